@@ -0,0 +1,178 @@
+"""Các loại FAISS index để RAGTool tìm kiếm: exact (Flat), HNSW hoặc IVF, có thể nén vector
+bằng int8 (scalar quantization) hoặc product quantization (PQ).
+
+Index phẳng float32 do agent/ingestion.py ghi ra vẫn là dữ liệu gốc để cập nhật tăng dần;
+index ANN được dựng lại từ chính các vector đó (không cần embed lại) và lưu cạnh index gốc.
+"""
+import math
+import os
+import tempfile
+
+INDEX_TYPES = ('flat', 'hnsw', 'ivf')
+QUANTIZATIONS = ('none', 'int8', 'pq')
+
+# FAISS cần khoảng 39 điểm train cho mỗi centroid (IVF) hoặc mỗi mã PQ
+MIN_POINTS_PER_CENTROID = 39
+
+
+class AnnIndexConfig:
+    """Cấu hình index ANN. Tham số build (index_type, quantization, hnsw_m, ef_construction, nlist, pq_m)
+    quyết định file index; tham số tìm kiếm (ef_search, nprobe) đổi được mà không cần build lại."""
+
+    def __init__(self, index_type='flat', quantization='none', hnsw_m=32, ef_construction=200, ef_search=64,
+                 nlist=None, nprobe=8, pq_m=48):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"index_type phải là một trong {INDEX_TYPES}, nhận được '{index_type}'.")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"quantization phải là một trong {QUANTIZATIONS}, nhận được '{quantization}'.")
+        self.index_type = index_type
+        self.quantization = quantization
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+
+    @classmethod
+    def from_env(cls):
+        """Đọc cấu hình từ TUTOR_RAG_INDEX (flat/hnsw/ivf), TUTOR_RAG_QUANTIZATION (none/int8/pq),
+        TUTOR_RAG_HNSW_M, TUTOR_RAG_EF_SEARCH, TUTOR_RAG_NLIST, TUTOR_RAG_NPROBE, TUTOR_RAG_PQ_M."""
+        nlist = os.getenv('TUTOR_RAG_NLIST')
+        return cls(
+            index_type=os.getenv('TUTOR_RAG_INDEX', 'flat').lower(),
+            quantization=os.getenv('TUTOR_RAG_QUANTIZATION', 'none').lower(),
+            hnsw_m=int(os.getenv('TUTOR_RAG_HNSW_M', '32')),
+            ef_search=int(os.getenv('TUTOR_RAG_EF_SEARCH', '64')),
+            nlist=int(nlist) if nlist else None,
+            nprobe=int(os.getenv('TUTOR_RAG_NPROBE', '8')),
+            pq_m=int(os.getenv('TUTOR_RAG_PQ_M', '48')),
+        )
+
+    @property
+    def is_exact(self):
+        return self.index_type == 'flat' and self.quantization == 'none'
+
+    @property
+    def build_key(self):
+        """Tên ổn định theo tham số build, dùng đặt tên file index ANN."""
+        parts = [self.index_type]
+        if self.index_type == 'hnsw':
+            parts.append(f"m{self.hnsw_m}-efc{self.ef_construction}")
+        elif self.index_type == 'ivf':
+            parts.append(f"nlist{self.nlist or 'auto'}")
+        if self.quantization == 'pq':
+            parts.append(f"pq{self.pq_m}")
+        elif self.quantization == 'int8':
+            parts.append('int8')
+        return '-'.join(parts)
+
+    @property
+    def cache_key(self):
+        """Khóa gồm cả tham số tìm kiếm, vì chúng cũng làm thay đổi kết quả trả về."""
+        if self.index_type == 'hnsw':
+            return f"{self.build_key}-ef{self.ef_search}"
+        if self.index_type == 'ivf':
+            return f"{self.build_key}-nprobe{self.nprobe}"
+        return self.build_key
+
+    def factory_string(self, num_vectors, dim):
+        """Chuỗi faiss.index_factory. nlist và số bit PQ được giới hạn theo số vector hiện có
+        để corpus nhỏ vẫn train được."""
+        if self.quantization == 'int8':
+            encoding = 'SQ8'
+        elif self.quantization == 'pq':
+            pq_m = max(m for m in range(1, min(self.pq_m, dim) + 1) if dim % m == 0)
+            nbits = max(4, min(8, int(math.log2(max(num_vectors / MIN_POINTS_PER_CENTROID, 1)))))
+            encoding = f"PQ{pq_m}x{nbits}"
+        else:
+            encoding = 'Flat'
+
+        if self.index_type == 'hnsw':
+            return f"HNSW{self.hnsw_m}" if encoding == 'Flat' else f"HNSW{self.hnsw_m}_{encoding}"
+        if self.index_type == 'ivf':
+            nlist = self.nlist or int(4 * math.sqrt(num_vectors))
+            nlist = max(1, min(nlist, num_vectors // MIN_POINTS_PER_CENTROID))
+            return f"IVF{nlist},{encoding}"
+        return encoding
+
+
+def set_search_params(index, config):
+    """Áp dụng tham số tìm kiếm (efSearch cho HNSW, nprobe cho IVF) lên index đã build."""
+    import faiss
+
+    space = faiss.ParameterSpace()
+    if config.index_type == 'hnsw':
+        space.set_index_parameter(index, 'efSearch', config.ef_search)
+    elif config.index_type == 'ivf':
+        space.set_index_parameter(index, 'nprobe', config.nprobe)
+
+
+def build_ann_index(vectors, config):
+    """Dựng index FAISS (metric L2, giống index mặc định của LangChain) từ ma trận vector float32."""
+    import faiss
+
+    num_vectors, dim = vectors.shape
+    index = faiss.index_factory(dim, config.factory_string(num_vectors, dim), faiss.METRIC_L2)
+    if config.index_type == 'hnsw':
+        index.hnsw.efConstruction = config.ef_construction
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    set_search_params(index, config)
+    return index
+
+
+def index_vectors(index):
+    """Lấy lại toàn bộ vector từ index phẳng theo đúng thứ tự vị trí (khớp index_to_docstore_id)."""
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def read_index_mmap(path):
+    """Đọc file index FAISS bằng mmap, chỉ đọc: vector nằm trong page cache của hệ điều hành nên mọi process
+    mở cùng file (các worker của server HTTP) dùng chung một bản thay vì mỗi process giữ một bản trong RAM.
+    Index đọc kiểu này không thêm/xóa vector được."""
+    import faiss
+
+    # IO_FLAG_MMAP_IFC (FAISS >= 1.8) mmap cả dữ liệu vector của index phẳng, IO_FLAG_MMAP chỉ áp dụng cho IVF
+    flags = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    return faiss.read_index(path, flags)
+
+
+def apply_ann_index(vectorstore, config, index_path=None, mmap=False):
+    """Thay index exact của vectorstore bằng index theo config. Thứ tự vector được giữ nguyên
+    nên ánh xạ vị trí -> docstore id của LangChain vẫn đúng.
+
+    Nếu có index_path, index ANN được lưu thành ann-<build_key>.faiss trong thư mục index; khi
+    ingestion cập nhật tài liệu thì thư mục được ghi lại nên file cũ tự mất và được build lại.
+    Sau khi áp dụng, vectorstore chỉ dùng để tìm kiếm (HNSW không hỗ trợ xóa vector).
+    mmap=True đọc index ANN từ file đã lưu bằng read_index_mmap."""
+    import faiss
+
+    if config.is_exact:
+        return vectorstore
+
+    ann_path = os.path.join(index_path, f"ann-{config.build_key}.faiss") if index_path else None
+    index = None
+    if ann_path and os.path.exists(ann_path):
+        index = read_index_mmap(ann_path) if mmap else faiss.read_index(ann_path)
+        if index.ntotal != vectorstore.index.ntotal:
+            index = None
+    if index is None:
+        index = build_ann_index(index_vectors(vectorstore.index), config)
+        if ann_path:
+            tmp_path = None
+            try:
+                fd, tmp_path = tempfile.mkstemp(prefix='.ann-', dir=index_path)
+                os.close(fd)
+                faiss.write_index(index, tmp_path)
+                os.replace(tmp_path, ann_path)
+                if mmap:
+                    index = read_index_mmap(ann_path)
+            except (OSError, RuntimeError):
+                # Thư mục index vừa được ingestion ghi lại; vẫn dùng index trong bộ nhớ
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+    set_search_params(index, config)
+    vectorstore.index = index
+    return vectorstore
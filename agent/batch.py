@@ -0,0 +1,136 @@
+"""Phân tích hàng loạt bài viết của học viên (CSV hoặc JSONL) bằng EnglishTutorAgent.aanalyze_text.
+
+Kết quả được ghi dần ra file JSONL, mỗi dòng một bài:
+{"id": ..., "status": "ok" | "error", "analysis": ..., "error": ...}
+File kết quả đồng thời là checkpoint: chạy lại cùng lệnh sẽ bỏ qua các bài đã "ok".
+"""
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import random
+import time
+
+from agent.llm_gateway import classify_error
+from utils.cache import normalize_text
+
+
+def read_submissions(path, id_field='id', text_field='text'):
+    """Đọc lần lượt từng bài (id, text) từ file .csv hoặc .jsonl mà không nạp cả file vào bộ nhớ.
+    Bài không có id thì dùng số thứ tự dòng."""
+    with open(path, encoding='utf-8', newline='') as f:
+        if path.lower().endswith('.csv'):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for line_number, row in enumerate(rows, start=1):
+            text = row.get(text_field) or ''
+            if text.strip():
+                yield str(row.get(id_field) or line_number), text
+
+
+def load_checkpoint(output_path):
+    """Tập id đã phân tích thành công trong file kết quả của lần chạy trước."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # dòng ghi dở khi process bị dừng đột ngột
+            if record.get('status') == 'ok':
+                done.add(record['id'])
+    return done
+
+
+class RequestPacer:
+    """Giãn cách các request để không vượt `requests_per_minute`.
+    Khi gặp lỗi rate limit, pause() tạm dừng toàn bộ batch thay vì để từng worker tự thử lại."""
+
+    def __init__(self, requests_per_minute=None):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_start = 0.0
+        self._paused_until = 0.0
+
+    async def wait(self):
+        now = time.monotonic()
+        start = max(now, self._next_start, self._paused_until)
+        self._next_start = start + self.interval
+        await asyncio.sleep(start - now)
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+async def analyze_batch(tutor, input_path, output_path, concurrency=4, requests_per_minute=None,
+                        max_retries=5, id_field='id', text_field='text'):
+    """Phân tích mọi bài trong input_path và ghi kết quả vào output_path. Trả về thống kê của lần chạy."""
+    done = load_checkpoint(output_path)
+    pacer = RequestPacer(requests_per_minute)
+    submissions = asyncio.Queue(maxsize=concurrency * 2)
+    results = {}  # khóa nội dung -> Future[(status, text)], để các bài trùng nhau chỉ gọi API một lần
+    stats = {'processed': 0, 'skipped': 0, 'duplicates': 0, 'errors': 0, 'retries': 0}
+
+    async def analyze_with_retry(worker_id, text):
+        for attempt in range(max_retries + 1):
+            await pacer.wait()
+            try:
+                return 'ok', await tutor.aanalyze_text(text, user_id=f"batch-{worker_id}", raise_errors=True)
+            except Exception as e:
+                # LLMGateway đã thử lại từng lời gọi; ở đây chỉ thử lại cả bài khi lỗi còn có thể qua được
+                # (rate limit, lỗi tạm thời, breaker đang mở), lỗi đầu vào/cấu hình thì ghi lỗi ngay
+                kind = classify_error(e)
+                if kind is None or attempt == max_retries:
+                    return 'error', str(e)
+                stats['retries'] += 1
+                delay = min(60.0, 2.0 ** attempt) * (0.5 + random.random())
+                if kind == 'rate_limit':
+                    pacer.pause(delay)
+                await asyncio.sleep(delay)
+
+    async def worker(worker_id, output):
+        while True:
+            item = await submissions.get()
+            if item is None:
+                return
+            sub_id, text = item
+            key = hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+            future = results.get(key)
+            if future is None:
+                future = results[key] = asyncio.get_running_loop().create_future()
+                outcome = ('error', "Phân tích bị dừng giữa chừng")
+                try:
+                    outcome = await analyze_with_retry(worker_id, text)
+                finally:
+                    # Luôn hoàn tất future, kể cả khi worker bị hủy, để các bài trùng đang chờ không bị treo
+                    future.set_result(outcome)
+            else:
+                stats['duplicates'] += 1
+            status, content = await future
+
+            record = {'id': sub_id, 'status': status}
+            record['analysis' if status == 'ok' else 'error'] = content
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            stats['processed'] += 1
+            if status != 'ok':
+                stats['errors'] += 1
+
+    start = time.perf_counter()
+    with open(output_path, 'a', encoding='utf-8') as output:
+        workers = [asyncio.create_task(worker(i, output)) for i in range(concurrency)]
+        for sub_id, text in read_submissions(input_path, id_field, text_field):
+            if sub_id in done:
+                stats['skipped'] += 1
+                continue
+            await submissions.put((sub_id, text))
+        for _ in workers:
+            await submissions.put(None)
+        await asyncio.gather(*workers)
+
+    stats['elapsed_s'] = time.perf_counter() - start
+    stats['essays_per_minute'] = stats['processed'] / stats['elapsed_s'] * 60 if stats['elapsed_s'] else 0.0
+    return stats
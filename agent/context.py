@@ -0,0 +1,195 @@
+"""Ngân sách token cho prompt của agent.
+
+Prompt ReAct được gửi lại ở mỗi vòng lặp nên mọi token thừa đều bị nhân lên. Module này:
+- ước lượng số token (không cần gọi API đếm token),
+- giữ nguyên văn các lượt gần nhất trong ngân sách và gộp dần các lượt cũ hơn vào một bản tóm tắt,
+- rút gọn kết quả tool (Wikipedia, tài liệu RAG) quá dài.
+Phần tĩnh của prompt (system prompt, mô tả tool, hướng dẫn định dạng) luôn đứng đầu và không đổi giữa các lượt,
+còn tóm tắt/lịch sử nằm sau nó, để phần đầu prompt giống hệt nhau và provider có thể cache prefix.
+"""
+import asyncio
+import os
+import threading
+from typing import Any
+
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_core.messages import SystemMessage, get_buffer_string
+from pydantic import PrivateAttr
+
+CHARS_PER_TOKEN = 4
+
+DEFAULT_HISTORY_TOKENS = int(os.getenv('TUTOR_HISTORY_TOKENS', '800'))
+DEFAULT_MESSAGE_TOKENS = int(os.getenv('TUTOR_MESSAGE_TOKENS', '300'))
+DEFAULT_OBSERVATION_TOKENS = int(os.getenv('TUTOR_OBSERVATION_TOKENS', '600'))
+DEFAULT_SUMMARY_TOKENS = 200
+# Tóm tắt cần ổn định, không cần sáng tạo; temperature riêng cũng cho một client riêng trong registry
+SUMMARY_TEMPERATURE = 0.0
+# Phiên cũ (trước khi có bảng summaries) có thể có hàng trăm tin nhắn chưa tóm tắt: chỉ đưa phần cuối vào prompt
+MAX_SUMMARY_INPUT_MESSAGES = 20
+# Trần số tin nhắn chưa tóm tắt đọc mỗi lần, kể cả khi k lớn hoặc summarizer lỗi liên tục
+MAX_PENDING_MESSAGES = 200
+
+TRUNCATION_MARKER = " …[đã rút gọn]"
+SUMMARY_PREFIX = "Summary of earlier conversation: "
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between an English learner and their AI tutor.
+Keep what matters for future turns: the learner's goals, level, recurring mistakes, topics already explained
+and any plans or scheduled lessons. Write at most {max_words} words, in the same language as the current summary
+(English if there is none). Answer with the new summary only.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{new_lines}"""
+
+
+def estimate_tokens(text):
+    """Ước lượng số token (~4 ký tự/token). Đủ chính xác để lập ngân sách mà không tốn một lời gọi API."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cắt text về khoảng max_tokens, ưu tiên cắt ở cuối dòng/câu để không bỏ dở một ví dụ."""
+    if max_tokens is None or estimate_tokens(text) <= max_tokens:
+        return text
+    limit = max_tokens * CHARS_PER_TOKEN
+    cut = text[:limit]
+    boundary = max(cut.rfind('\n'), cut.rfind('. '))
+    if boundary > limit // 2:
+        cut = cut[:boundary + 1]
+    return cut.rstrip() + TRUNCATION_MARKER
+
+
+class BudgetedConversationMemory(BaseChatMemory):
+    """Memory cho AgentExecutor: các lượt gần nhất (tối đa k lượt và max_history_tokens) được giữ nguyên văn,
+    các lượt cũ hơn được gộp dần vào một bản tóm tắt bằng `summarizer` (chat model).
+
+    Tóm tắt được cập nhật tăng dần (tóm tắt cũ + vài tin nhắn mới), mặc định chạy nền sau khi lưu lượt
+    để không làm chậm câu trả lời. Nếu chat_memory hỗ trợ load_summary/save_summary (SQLiteChatMessageHistory)
+    thì bản tóm tắt được lưu cùng lịch sử và dùng lại khi tiếp tục phiên."""
+
+    memory_key: str = "chat_history"
+    k: int = 5
+    max_history_tokens: int = DEFAULT_HISTORY_TOKENS
+    max_message_tokens: int = DEFAULT_MESSAGE_TOKENS
+    summary_max_tokens: int = DEFAULT_SUMMARY_TOKENS
+    # Số tin nhắn tối thiểu rời khỏi cửa sổ trước khi gọi summarizer (2 = mỗi lượt)
+    summary_batch: int = 2
+    summarizer: Any = None
+    summarize_in_background: bool = True
+    summary: str = ""
+    summarized_count: int = 0
+    # Id của tin nhắn cuối đã gộp vào tóm tắt, khi chat_memory đọc được theo id (messages_after)
+    summarized_id: int = 0
+
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _summarizing: bool = PrivateAttr(default=False)
+    _summary_loaded: bool = PrivateAttr(default=False)
+
+    @property
+    def memory_variables(self):
+        return [self.memory_key]
+
+    def _load_summary(self):
+        if not self._summary_loaded:
+            self._summary_loaded = True
+            if hasattr(self.chat_memory, 'load_summary'):
+                self.summary, self.summarized_count, self.summarized_id = self.chat_memory.load_summary()
+
+    def _pending_limit(self):
+        # Cửa sổ nguyên văn cộng phần summarizer dùng được; tin nhắn cũ hơn nữa không bao giờ vào prompt
+        return min(2 * self.k + max(self.summary_batch, MAX_SUMMARY_INPUT_MESSAGES), MAX_PENDING_MESSAGES)
+
+    def _pending_messages(self):
+        """Các tin nhắn chưa được gộp vào tóm tắt; đọc từ kho lưu trữ thì chỉ lấy _pending_limit() tin nhắn gần nhất."""
+        self._load_summary()
+        if hasattr(self.chat_memory, 'messages_after'):
+            return self.chat_memory.messages_after(self.summarized_id, self._pending_limit())
+        return self.chat_memory.messages[self.summarized_count:]
+
+    def _verbatim_count(self, messages):
+        """Số tin nhắn mới nhất giữ nguyên văn: không quá k lượt và vừa ngân sách token."""
+        used, count = 0, 0
+        for message in reversed(messages[-2 * self.k:] if self.k > 0 else []):
+            tokens = min(estimate_tokens(message.content), self.max_message_tokens)
+            if count and used + tokens > self.max_history_tokens:
+                break
+            used += tokens
+            count += 1
+        return count
+
+    @property
+    def buffer_as_messages(self):
+        messages = self._pending_messages()
+        recent = messages[len(messages) - self._verbatim_count(messages):]
+        recent = [
+            message.model_copy(update={'content': truncate_to_tokens(message.content, self.max_message_tokens)})
+            for message in recent
+        ]
+        if self.summary:
+            return [SystemMessage(content=SUMMARY_PREFIX + self.summary), *recent]
+        return recent
+
+    @property
+    def buffer_as_str(self):
+        return get_buffer_string(self.buffer_as_messages, human_prefix="Human", ai_prefix="AI")
+
+    def load_memory_variables(self, inputs):
+        return {self.memory_key: self.buffer_as_messages if self.return_messages else self.buffer_as_str}
+
+    def save_context(self, inputs, outputs):
+        super().save_context(inputs, outputs)
+        self._maybe_summarize()
+
+    async def asave_context(self, inputs, outputs):
+        await asyncio.to_thread(self.save_context, inputs, outputs)
+
+    def _maybe_summarize(self):
+        if self.summarizer is None:
+            return
+        with self._lock:
+            if self._summarizing:
+                return
+            pending = self._pending_messages()
+            evicted = pending[:len(pending) - self._verbatim_count(pending)]
+            if len(evicted) < self.summary_batch:
+                return
+            self._summarizing = True
+
+        if self.summarize_in_background:
+            threading.Thread(target=self._summarize, args=(evicted,), name="tutor-summary", daemon=True).start()
+        else:
+            self._summarize(evicted)
+
+    def _summarize(self, evicted):
+        try:
+            new_lines = get_buffer_string(
+                [message.model_copy(update={'content': truncate_to_tokens(message.content, self.max_message_tokens)})
+                 for message in evicted[-MAX_SUMMARY_INPUT_MESSAGES:]],
+                human_prefix="Learner", ai_prefix="Tutor",
+            )
+            prompt = SUMMARY_PROMPT.format(
+                max_words=self.summary_max_tokens * 3 // 4, summary=self.summary or "(none)", new_lines=new_lines,
+            )
+            summary = truncate_to_tokens(self.summarizer.invoke(prompt).content.strip(), self.summary_max_tokens)
+            with self._lock:
+                self.summary = summary
+                self.summarized_count += len(evicted)
+                if hasattr(self.chat_memory, 'messages_after'):
+                    self.summarized_id = int(evicted[-1].id)
+                if hasattr(self.chat_memory, 'save_summary'):
+                    self.chat_memory.save_summary(self.summary, self.summarized_count, self.summarized_id)
+        except Exception as e:
+            # Lần lưu lượt sau sẽ thử lại; trong lúc đó lịch sử cũ chỉ tạm thời không có trong prompt
+            print(f"Tóm tắt lịch sử thất bại: {e}")
+        finally:
+            with self._lock:
+                self._summarizing = False
+
+    def clear(self):
+        super().clear()
+        with self._lock:
+            self.summary = ""
+            self.summarized_count = 0
+            self.summarized_id = 0
@@ -0,0 +1,48 @@
+"""Lịch sử hội thoại bền vững cho LangChain memory, đọc/ghi qua database.db_manager.ConversationStore."""
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+_MESSAGE_TYPES = {
+    'human': HumanMessage,
+    'ai': AIMessage,
+    'system': SystemMessage,
+}
+
+
+class SQLiteChatMessageHistory(BaseChatMessageHistory):
+    """Chat history của một phiên, dùng làm chat_memory cho ConversationBufferWindowMemory.
+    `messages` chỉ nạp `window` tin nhắn gần nhất thay vì toàn bộ phiên."""
+
+    def __init__(self, store, user_id, session_id, window=10):
+        self.store = store
+        self.user_id = user_id
+        self.session_id = session_id
+        self.window = window
+
+    @property
+    def messages(self):
+        return [
+            _MESSAGE_TYPES.get(role, HumanMessage)(content=content)
+            for role, content in self.store.recent_messages(self.session_id, self.window)
+        ]
+
+    def messages_after(self, after_id, limit):
+        """Tối đa `limit` tin nhắn gần nhất sau tin nhắn có id `after_id` (dùng cho phần chưa được tóm tắt).
+        `id` của mỗi message là id trong ConversationStore."""
+        return [
+            _MESSAGE_TYPES.get(role, HumanMessage)(content=content, id=str(message_id))
+            for message_id, role, content in self.store.messages_after(self.session_id, after_id, limit)
+        ]
+
+    def load_summary(self):
+        """(tóm tắt, số tin nhắn đã tóm tắt, id tin nhắn cuối đã tóm tắt)."""
+        return self.store.get_summary(self.session_id)
+
+    def save_summary(self, summary, message_count, last_message_id):
+        self.store.set_summary(self.session_id, summary, message_count, last_message_id)
+
+    def add_messages(self, messages):
+        self.store.append(self.user_id, self.session_id, [(message.type, message.content) for message in messages])
+
+    def clear(self):
+        self.store.clear_session(self.session_id)
@@ -0,0 +1,289 @@
+"""Phân tích bài viết dài theo từng phần: tách đoạn/câu, kiểm tra nhanh bằng luật cục bộ các lỗi phổ biến của người
+Việt học tiếng Anh ("I am study", thiếu mạo từ, "I goes"...) để gợi ý cho LLM, bỏ qua các câu lặp lại nguyên văn
+đã có trong một phần trước, gom các câu thành từng phần nhỏ để phân tích song song, rồi gộp kết quả thành một báo cáo
+với một điểm tổng.
+
+Luật chỉ bắt được một số lỗi quen thuộc: câu không khớp luật nào chưa chắc đã đúng, nên mọi câu (trừ câu lặp lại)
+vẫn được LLM phân tích.
+"""
+import os
+import re
+
+# Bài ngắn hơn ngưỡng này vẫn phân tích bằng một lời gọi như trước
+CHUNKED_MIN_WORDS = int(os.getenv('TUTOR_ANALYSIS_CHUNK_MIN_WORDS', '150'))
+CHUNK_WORDS = int(os.getenv('TUTOR_ANALYSIS_CHUNK_WORDS', '120'))
+MAX_PARALLEL_CHUNKS = int(os.getenv('TUTOR_ANALYSIS_PARALLEL', '8'))
+PREPASS_ENABLED = os.getenv('TUTOR_ANALYSIS_PREPASS', '1') != '0'
+
+COMMON_VERBS = (
+    'study', 'go', 'work', 'live', 'play', 'brush', 'eat', 'drink', 'watch', 'read', 'write', 'learn', 'like',
+    'love', 'want', 'need', 'have', 'do', 'make', 'take', 'help', 'think', 'visit', 'travel', 'cook', 'teach',
+    'listen', 'speak', 'talk', 'use', 'get', 'come', 'buy', 'walk', 'wake', 'sleep', 'stay', 'practice', 'practise',
+    'become', 'leave',
+)
+# 'like'/'love' sau be có thể đúng ("He is like his father") nên luật be + động từ nguyên mẫu không xét
+BE_BASE_VERBS = tuple(verb for verb in COMMON_VERBS if verb not in ('like', 'love'))
+# Động từ nguyên mẫu hay bị dùng sau have/had thay cho quá khứ phân từ (không gồm từ cũng là danh từ như 'work',
+# hay từ có nguyên mẫu trùng quá khứ phân từ như 'come', 'become': "have come" là đúng)
+PARTICIPLE_ERRORS = ('leave', 'go', 'eat', 'see', 'take', 'wait', 'finish', 'arrive', 'write', 'visit', 'buy',
+                     'begin', 'know', 'speak')
+THIRD_PERSON_FORMS = (
+    'goes', 'does', 'has', 'studies', 'works', 'lives', 'plays', 'watches', 'likes', 'loves', 'wants', 'needs',
+    'makes', 'takes', 'helps', 'thinks', 'teaches', 'learns', 'reads', 'writes', 'uses', 'gets', 'comes',
+)
+PAST_FORMS = ('went', 'saw', 'ate', 'came', 'bought', 'took', 'made', 'had', 'was', 'were', 'did', 'gone', 'got',
+              'visited', 'studied', 'played', 'watched', 'finished', 'wanted', 'liked')
+SINGULAR_NOUNS = (
+    'student', 'teacher', 'doctor', 'engineer', 'nurse', 'worker', 'farmer', 'singer', 'driver', 'manager',
+    'accountant', 'car', 'dog', 'cat', 'bike', 'motorbike', 'computer', 'laptop', 'job', 'house', 'phone',
+    'smartphone', 'brother', 'sister', 'question', 'idea', 'problem',
+)
+AUXILIARIES = r"did|does|do|didn't|doesn't|don't|will|would|can|could|should|may|might|must|to|let|make|help|see|hear"
+
+
+def _words(items):
+    return '|'.join(items)
+
+
+# (mã luật, regex, giải thích bằng tiếng Việt). Nhóm 'aux' (nếu có) khớp thì bỏ qua: "did he go" không phải lỗi.
+RULES = [
+    ('be_base_verb',
+     re.compile(rf"\b(?:am|is|are|was|were)\s+(?:not\s+)?(?:{_words(BE_BASE_VERBS)})\b", re.IGNORECASE),
+     "'am/is/are' đứng trước động từ nguyên mẫu: dùng 'I study' hoặc 'I am studying'."),
+    ('plural_subject_verb_s',
+     re.compile(rf"\b(?:I|you|we|they)\s+(?:{_words(THIRD_PERSON_FORMS)})\b", re.IGNORECASE),
+     "Chủ ngữ I/you/we/they dùng động từ nguyên mẫu, không thêm -s/-es."),
+    ('third_person_base_verb',
+     re.compile(rf"(?P<aux>\b(?:{AUXILIARIES})\s+)?\b(?:he|she|it)\s+(?:{_words(COMMON_VERBS)})\b", re.IGNORECASE),
+     "Chủ ngữ he/she/it ở thì hiện tại đơn cần động từ thêm -s/-es."),
+    ('plural_noun_singular_verb',
+     re.compile(r"(?P<aux>\bof\s+(?:the\s+|my\s+|our\s+)?(?:\w+\s+)?)?"
+                r"\b(?:people|children|my (?:friends|teachers|parents|classmates)|students|teachers|parents)\s+"
+                r"(?:is|was|has)\b", re.IGNORECASE),
+     "Chủ ngữ số nhiều dùng 'are/were/have'."),
+    ('singular_noun_plural_verb',
+     re.compile(r"\b(?:technology|everyone|everybody|my (?:mother|father|family|school|teacher))\s+(?:have|are|were|do)\b",
+                re.IGNORECASE),
+     "Chủ ngữ số ít dùng 'has/is/was/does'."),
+    ('negative_agreement',
+     re.compile(r"\b(?:he|she|it)\s+don't\b|\b(?:I|you|we|they)\s+doesn't\b", re.IGNORECASE),
+     "he/she/it dùng 'doesn't', I/you/we/they dùng 'don't'."),
+    ('was_were',
+     re.compile(r"(?P<aux>\b(?:if|wish|as if)\s+)?\b(?:(?:we|you|they)\s+was|(?:I|he|she|it)\s+were)\b", re.IGNORECASE),
+     "we/you/they dùng 'were', I/he/she/it dùng 'was'."),
+    ('quantifier_plural_verb',
+     re.compile(r"\b(?:many|several|these|those|both|two|three|four|five|all)\s+\w+s\s+(?:is|was|has)\b", re.IGNORECASE),
+     "Chủ ngữ số nhiều dùng 'are/were/have'."),
+    ('one_of_plural',
+     re.compile(r"\bone of (?:the|my|our|his|her|their|your)\s+(?:\w+est|best|worst|most \w+)\s+"
+                r"(?!\w*s\b|people\b|children\b|men\b|women\b)\w+\b", re.IGNORECASE),
+     "'one of the ...' đi với danh từ số nhiều (one of the biggest problems)."),
+    ('perfect_base_verb',
+     re.compile(rf"\b(?:have|has|had)\s+(?:already\s+|just\s+|never\s+|been\s+)?(?:{_words(PARTICIPLE_ERRORS)})\b",
+                re.IGNORECASE),
+     "Sau 'have/has/had' (và 'been') dùng quá khứ phân từ hoặc V-ing: 'had already left', 'had been waiting'."),
+    ('did_past_form',
+     re.compile(rf"\b(?:did|didn't|did not)\s+(?:{_words(PAST_FORMS)})\b", re.IGNORECASE),
+     "Sau 'did/didn't' dùng động từ nguyên mẫu (didn't go, không phải didn't went)."),
+    ('missing_article',
+     re.compile(rf"\b(?:am|is|was|have|has|had|buy|bought|want|need)\s+(?:(?:good|new|old|big|small)\s+)?"
+                rf"(?:{_words(SINGULAR_NOUNS)})\b", re.IGNORECASE),
+     "Thiếu mạo từ 'a/an/the' trước danh từ đếm được số ít (I am a student, I have a car)."),
+    ('everyday_adverb',
+     re.compile(r"\beveryday\s*(?:[.!?,;]|$)", re.IGNORECASE),
+     "'everyday' là tính từ; trạng từ 'hằng ngày' viết tách: 'every day'."),
+    ('very_like',
+     re.compile(r"\b(?:I|we|they|you)\s+very\s+(?:like|love|enjoy|want)\b", re.IGNORECASE),
+     "Không dùng 'very' trước động từ: 'I really like' hoặc 'I like it very much'."),
+    ('double_comparative',
+     re.compile(r"\bmore\s+(?:better|worse|bigger|smaller|easier|harder|faster|cheaper|older|younger)\b",
+                re.IGNORECASE),
+     "So sánh hơn dùng một trong hai: 'more' hoặc đuôi -er, không dùng cả hai."),
+    ('missing_preposition',
+     re.compile(r"\blisten(?:s|ed|ing)?\s+(?:music|the radio|songs|him|her|me|them)\b|"
+                r"\bapply(?:ing)?\s+(?:the|this|a)\s+(?:job|position)\b|"
+                r"\bwait(?:s|ed|ing)?\s+(?:you|him|her|me|them)\b", re.IGNORECASE),
+     "Thiếu giới từ: 'listen to', 'apply for', 'wait for'."),
+    ('arrive_to',
+     re.compile(r"\barriv(?:e|es|ed|ing)\s+to\b", re.IGNORECASE),
+     "'arrive' đi với 'at' (địa điểm nhỏ) hoặc 'in' (thành phố, quốc gia), không đi với 'to'."),
+    ('extra_preposition',
+     re.compile(r"\b(?:discuss|mention)(?:es|ed|ing)?\s+about\b|\bexplain(?:s|ed|ing)?\s+(?:me|him|her|them|us)\b",
+                re.IGNORECASE),
+     "'discuss/mention' không đi với 'about'; nói 'explain to me', không phải 'explain me'."),
+    ('since_duration',
+     re.compile(r"\bsince\s+(?:\d+|one|two|three|four|five|six|ten|many|several)\s+(?:days|weeks|months|years)\b",
+                re.IGNORECASE),
+     "'since' đi với mốc thời gian (since 2022); khoảng thời gian dùng 'for' (for three days)."),
+    ('look_forward_to_base',
+     re.compile(r"\blook(?:ing)?\s+forward\s+to\s+(?:hear|see|meet|work|receive|visit)\b", re.IGNORECASE),
+     "'look forward to' + V-ing: 'I look forward to hearing from you'."),
+    ('perfect_with_past_time',
+     re.compile(r"\b(?:have|has)\s+\w+(?:ed|en)\b[^.!?]*\bago\b|"
+                r"\b(?:last (?:summer|year|week|month|night)|yesterday)\b[^.!?]*\b(?:have|has)\s+\w+(?:ed|en)\b",
+                re.IGNORECASE),
+     "Có mốc thời gian trong quá khứ (ago, last..., yesterday) thì dùng quá khứ đơn, không dùng hiện tại hoàn thành."),
+    ('ing_ed_adjective',
+     re.compile(r"\b(?:I am|I'm|we are|we're|I was|I feel|I felt)\s+(?:very |so |really )?"
+                r"(?:exciting|boring|interesting|tiring|confusing)\b", re.IGNORECASE),
+     "Tả cảm xúc của người dùng tính từ đuôi -ed (excited, bored), đuôi -ing tả sự vật."),
+    ('lowercase_i',
+     # Không tính viết tắt "i.e."/"i.a." (chữ i theo sau là dấu chấm và một chữ cái)
+     re.compile(r"(?<![\w'’])i(?![\w'’])(?!\.[^\W\d_])"),
+     "Đại từ 'I' luôn viết hoa."),
+]
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])[\"')\]]?\s+(?=[\"'(\[]?[A-Z0-9])")
+SCORE_PATTERN = re.compile(r"Điểm[^0-9\n]{0,40}(\d+(?:[.,]\d+)?)\s*/\s*10", re.IGNORECASE)
+
+
+def find_issues(sentence):
+    """Các lỗi phổ biến luật cục bộ tìm thấy trong câu: [{"rule", "match", "message"}]."""
+    issues = []
+    for rule, pattern, message in RULES:
+        for match in pattern.finditer(sentence):
+            if match.groupdict().get('aux'):
+                continue
+            issues.append({'rule': rule, 'match': match.group(0).strip(), 'message': message})
+            break
+    return issues
+
+
+def sentence_key(sentence):
+    """Khóa so trùng câu: bỏ khác biệt về khoảng trắng và chữ hoa/thường."""
+    return ' '.join(sentence.lower().split())
+
+
+def split_paragraphs(text):
+    return [paragraph.strip() for paragraph in re.split(r'\n\s*\n|\n', text) if paragraph.strip()]
+
+
+def split_sentences(paragraph):
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(paragraph) if sentence.strip()]
+
+
+class AnalysisPlan:
+    """Kết quả tách bài viết: các phần cần LLM phân tích (`chunks`, mỗi phần gồm các câu liền nhau, tối đa khoảng
+    `chunk_words` từ, đoạn văn ngắn được gộp chung để không tốn prompt cho từng đoạn), các câu lặp lại nguyên văn
+    một câu đã có trong phần trước (`skipped`, chỉ khi bật pre-pass) và lỗi phổ biến luật cục bộ tìm thấy."""
+
+    def __init__(self, text, chunk_words=None, prepass=None):
+        chunk_words = chunk_words or CHUNK_WORDS
+        self.prepass = PREPASS_ENABLED if prepass is None else prepass
+        self.chunks = []
+        self.chunk_words = []
+        self.skipped = []
+        self.issues = []
+        self.total_words = 0
+        current, current_words = [], 0
+        seen = set()
+        for paragraph_index, paragraph in enumerate(split_paragraphs(text)):
+            for sentence in split_sentences(paragraph):
+                words = len(sentence.split())
+                self.total_words += words
+                key = sentence_key(sentence)
+                if self.prepass and key in seen:
+                    # Câu giống hệt đã nằm trong một phần được phân tích: nhận xét và lỗi của nó đã có ở phần đó
+                    self.skipped.append(sentence)
+                    continue
+                seen.add(key)
+                self.issues.extend({'sentence': sentence, **issue} for issue in find_issues(sentence))
+                if current and current_words + words > chunk_words:
+                    self._add_chunk(current, current_words)
+                    current, current_words = [], 0
+                current.append((paragraph_index, sentence))
+                current_words += words
+        if current:
+            self._add_chunk(current, current_words)
+
+    def _add_chunk(self, sentences, words):
+        paragraphs = {}
+        for paragraph_index, sentence in sentences:
+            paragraphs.setdefault(paragraph_index, []).append(sentence)
+        self.chunks.append("\n\n".join(" ".join(paragraph) for paragraph in paragraphs.values()))
+        self.chunk_words.append(words)
+
+    @property
+    def skipped_words(self):
+        return sum(len(sentence.split()) for sentence in self.skipped)
+
+
+def chunk_hints(chunk, prepass=None):
+    """Lỗi phổ biến luật cục bộ tìm thấy trong một phần (mỗi lỗi một lần), để gợi ý cho LLM; rỗng nếu tắt pre-pass
+    (truyền AnalysisPlan.prepass để dùng đúng lựa chọn của bài viết)."""
+    if not (PREPASS_ENABLED if prepass is None else prepass):
+        return []
+    hints = {}
+    for paragraph in split_paragraphs(chunk):
+        for sentence in split_sentences(paragraph):
+            for issue in find_issues(sentence):
+                hints.setdefault((issue['rule'], issue['match'].lower()), f"\"{issue['match']}\": {issue['message']}")
+    return list(hints.values())
+
+
+def should_chunk(text):
+    return len(text.split()) >= CHUNKED_MIN_WORDS
+
+
+def parse_score(analysis):
+    """Điểm (trên 10) trong câu trả lời của một phần, None nếu không tìm thấy."""
+    match = SCORE_PATTERN.search(analysis or "")
+    if not match:
+        return None
+    return min(10.0, float(match.group(1).replace(',', '.')))
+
+
+def overall_score(plan, analyses):
+    """Điểm tổng: trung bình điểm các phần theo số từ (câu lặp lại được bỏ qua không tính)."""
+    total, weight = 0.0, 0
+    for words, analysis in zip(plan.chunk_words, analyses):
+        score = parse_score(analysis)
+        if score is not None:
+            total += score * words
+            weight += words
+    return round(total / weight, 1) if weight else None
+
+
+def encouragement(score):
+    if score is None:
+        return "Bạn đã hoàn thành một bài viết dài, đó là một bước tiến lớn. Tiếp tục luyện tập nhé!"
+    if score >= 8:
+        return "Bài viết rất tốt! Bạn diễn đạt tự nhiên và mạch lạc, hãy thử thêm các cấu trúc nâng cao nhé."
+    if score >= 6:
+        return "Bạn đang tiến bộ rõ rệt. Sửa các lỗi lặp lại ở trên là bài viết sẽ tốt hơn nhiều, cố gắng lên!"
+    return "Đừng nản lòng! Hãy tập trung vào từng lỗi phổ biến ở trên, luyện đều đặn bạn sẽ tiến bộ nhanh thôi."
+
+
+def report_header(plan):
+    skipped = f", {len(plan.skipped)} câu lặp lại câu đã phân tích được bỏ qua" if plan.skipped else ""
+    return f"Bài viết {plan.total_words} từ được phân tích theo {len(plan.chunks)} phần{skipped}.\n\n"
+
+
+def report_section(index, chunk, analysis):
+    preview = " ".join(chunk.split()[:8])
+    return f"**Phần {index + 1}:** _\"{preview}…\"_\n\n{analysis.strip()}\n\n"
+
+
+def report_footer(plan, analyses):
+    lines = []
+    # Cùng một lỗi lặp lại nhiều lần chỉ liệt kê một lần
+    issues = {(issue['rule'], issue['match'].lower()): issue for issue in plan.issues}
+    if issues:
+        lines.append("**Lỗi phổ biến (kiểm tra tự động):**")
+        lines.extend(f"- \"{issue['match']}\": {issue['message']}" for issue in issues.values())
+        lines.append("")
+    score = overall_score(plan, analyses)
+    if score is not None:
+        lines.append(f"**Điểm tổng thể: {score:g}/10**")
+    lines.append(encouragement(score))
+    return "\n".join(lines)
+
+
+def merge_report(plan, analyses):
+    """Gộp kết quả các phần (cùng thứ tự với plan.chunks) thành một báo cáo."""
+    return (
+        report_header(plan)
+        + "".join(report_section(index, chunk, analysis)
+                  for index, (chunk, analysis) in enumerate(zip(plan.chunks, analyses)))
+        + report_footer(plan, analyses)
+    )
@@ -0,0 +1,271 @@
+"""Nạp tài liệu học (PDF, TXT, MD) trong docs/ vào FAISS index cho RAGTool.
+
+Pipeline chạy tăng dần: mỗi file được ghi hash vào manifest của index, lần chạy sau
+chỉ trích xuất và embed lại các file mới hoặc đã thay đổi (file bị xóa thì chunk của nó
+cũng bị gỡ khỏi index). Các trang PDF được trích xuất song song bằng process pool và
+đi qua pipeline dạng generator nên không cần giữ toàn bộ tài liệu trong bộ nhớ.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+# Cấu hình mặc định cho index tài liệu RAG; TUTOR_DOCS_DIR đổi thư mục tài liệu cho cả setup_database.py và server
+DOCS_DIR = os.getenv('TUTOR_DOCS_DIR') or os.path.join(os.path.dirname(__file__), '..', 'docs')
+INDEX_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'faiss_index')
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.txt', '.md')
+PAGES_PER_TASK = 8
+EMBED_BATCH_SIZE = 256
+MANIFEST_NAME = 'manifest.json'
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(1 << 20), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def iter_source_files(docs_dir=DOCS_DIR):
+    """Đường dẫn tương đối của các tài liệu được hỗ trợ trong docs_dir (đệ quy, theo thứ tự ổn định)."""
+    for root, dirs, files in os.walk(docs_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                yield os.path.relpath(os.path.join(root, name), docs_dir)
+
+
+def settings_key(docs_dir=DOCS_DIR, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+                 model_name=EMBEDDING_MODEL_NAME):
+    """Khóa thư mục index: đổi thư mục tài liệu hoặc tham số chunking/embedding thì phải build một index mới."""
+    settings = {'docs_dir': os.path.realpath(docs_dir), 'chunk_size': chunk_size, 'chunk_overlap': chunk_overlap,
+                'model_name': model_name}
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def compute_index_key(docs_dir=DOCS_DIR, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+                      model_name=EMBEDDING_MODEL_NAME):
+    """Khóa cho phiên bản nội dung của index: đổi khi bất kỳ tài liệu hoặc tham số nào thay đổi."""
+    digest = hashlib.sha256(settings_key(docs_dir, chunk_size, chunk_overlap, model_name).encode('utf-8'))
+    for relpath in iter_source_files(docs_dir):
+        digest.update(f"{relpath}:{file_hash(os.path.join(docs_dir, relpath))}\n".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def _extract_pdf_pages(path, start, end):
+    """Chạy trong process con: trả về [(số trang, [block, ...]), ...] cho các trang [start, end)."""
+    import fitz
+
+    pages = []
+    with fitz.open(path) as doc:
+        for number in range(start, end):
+            blocks = [block[4].strip() for block in doc[number].get_text("blocks")]
+            pages.append((number + 1, [text for text in blocks if text]))
+    return pages
+
+
+def _extract_text_file(path):
+    """Chạy trong process con: file văn bản được coi là một trang, mỗi đoạn là một block."""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    encoding = 'utf-16' if raw[:2] in (b'\xff\xfe', b'\xfe\xff') else 'utf-8'
+    text = raw.decode(encoding, errors='replace')
+    return [(1, [block.strip() for block in text.split('\n\n') if block.strip()])]
+
+
+def _extraction_tasks(docs_dir, relpaths):
+    """Chia các file thành tác vụ trích xuất; PDF lớn được chia theo từng nhóm PAGES_PER_TASK trang."""
+    import fitz
+
+    for relpath in relpaths:
+        path = os.path.join(docs_dir, relpath)
+        if relpath.lower().endswith('.pdf'):
+            with fitz.open(path) as doc:
+                page_count = doc.page_count
+            for start in range(0, page_count, PAGES_PER_TASK):
+                yield relpath, _extract_pdf_pages, (path, start, min(start + PAGES_PER_TASK, page_count))
+        else:
+            yield relpath, _extract_text_file, (path,)
+
+
+def iter_extracted_pages(docs_dir, relpaths, workers=None):
+    """Generator (relpath, số trang, blocks) khi các tác vụ trích xuất hoàn thành.
+    workers=0 chạy tuần tự trong process hiện tại; mặc định dùng một process cho mỗi CPU."""
+    tasks = _extraction_tasks(docs_dir, relpaths)
+    if workers == 0:
+        for relpath, func, args in tasks:
+            for page_number, blocks in func(*args):
+                yield relpath, page_number, blocks
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Chỉ giữ tối đa 2 * workers tác vụ đang chạy để bộ nhớ không tăng theo kích thước thư viện
+        pending = []
+        for relpath, func, args in tasks:
+            pending.append((relpath, executor.submit(func, *args)))
+            if len(pending) >= 2 * workers:
+                relpath_done, future = pending.pop(0)
+                for page_number, blocks in future.result():
+                    yield relpath_done, page_number, blocks
+        for relpath_done, future in pending:
+            for page_number, blocks in future.result():
+                yield relpath_done, page_number, blocks
+
+
+def iter_chunks(pages, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, stats=None):
+    """Generator (id, text, metadata) cho từng chunk. Id ổn định theo file/trang để có thể gỡ khi file đổi."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    for relpath, page_number, blocks in pages:
+        if stats is not None:
+            stats['pages'] += 1
+        for index, doc in enumerate(splitter.create_documents(blocks)):
+            yield f"{relpath}:{page_number}:{index}", doc.page_content, {'source': relpath, 'page': page_number}
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _load_index(index_path, embedding_model):
+    from langchain.vectorstores import FAISS
+
+    with open(os.path.join(index_path, MANIFEST_NAME), encoding='utf-8') as f:
+        manifest = json.load(f)
+    # index.pkl do chính ứng dụng ghi ra nên có thể tin cậy khi deserialize
+    vectorstore = FAISS.load_local(index_path, embedding_model, allow_dangerous_deserialization=True)
+    return vectorstore, manifest
+
+
+def _save_index(index_dir, key, vectorstore, manifest):
+    """Ghi index vào thư mục tạm rồi đổi tên, để process khác không bao giờ đọc phải index dở dang."""
+    os.makedirs(index_dir, exist_ok=True)
+    index_path = os.path.join(index_dir, key)
+    tmp_path = tempfile.mkdtemp(prefix=f".{key}-", dir=index_dir)
+    vectorstore.save_local(tmp_path)
+    with open(os.path.join(tmp_path, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    old_path = None
+    if os.path.exists(index_path):
+        old_path = tempfile.mkdtemp(prefix=f".{key}-old-", dir=index_dir)
+        os.replace(index_path, os.path.join(old_path, key))
+    os.replace(tmp_path, index_path)
+    if old_path:
+        shutil.rmtree(old_path, ignore_errors=True)
+
+
+def ingest_directory(embedding_model, docs_dir=DOCS_DIR, index_dir=INDEX_DIR, chunk_size=CHUNK_SIZE,
+                     chunk_overlap=CHUNK_OVERLAP, model_name=EMBEDDING_MODEL_NAME, force_rebuild=False,
+                     workers=None):
+    """Đồng bộ FAISS index với các tài liệu trong docs_dir và trả về (vectorstore, report).
+
+    index_dir=None build index chỉ trong bộ nhớ (không đọc/ghi đĩa)."""
+    from langchain.vectorstores import FAISS
+
+    key = settings_key(docs_dir, chunk_size, chunk_overlap, model_name)
+    index_path = os.path.join(index_dir, key) if index_dir else None
+
+    vectorstore, manifest = None, {'files': {}}
+    if index_path and not force_rebuild and os.path.exists(os.path.join(index_path, MANIFEST_NAME)):
+        vectorstore, manifest = _load_index(index_path, embedding_model)
+
+    current = {relpath: file_hash(os.path.join(docs_dir, relpath)) for relpath in iter_source_files(docs_dir)}
+    indexed = manifest['files']
+    changed = [relpath for relpath, digest in current.items() if indexed.get(relpath, {}).get('hash') != digest]
+    removed = [relpath for relpath in indexed if relpath not in current]
+    report = {
+        'files': len(current), 'changed': len(changed), 'removed': len(removed),
+        'pages': 0, 'chunks': 0, 'elapsed_s': 0.0,
+    }
+    if not changed and not removed and vectorstore is not None:
+        return vectorstore, report
+
+    start = time.perf_counter()
+    # Gỡ chunk cũ của các file đã đổi hoặc bị xóa
+    stale_ids = [chunk_id for relpath in changed + removed for chunk_id in indexed.get(relpath, {}).get('ids', [])]
+    if vectorstore is not None and stale_ids:
+        vectorstore.delete(stale_ids)
+    for relpath in changed + removed:
+        indexed.pop(relpath, None)
+
+    chunks = iter_chunks(iter_extracted_pages(docs_dir, changed, workers), chunk_size, chunk_overlap, report)
+    for batch in _batched(chunks, EMBED_BATCH_SIZE):
+        ids, texts, metadatas = zip(*batch)
+        if vectorstore is None:
+            vectorstore = FAISS.from_texts(list(texts), embedding_model, metadatas=list(metadatas), ids=list(ids))
+        else:
+            vectorstore.add_texts(list(texts), metadatas=list(metadatas), ids=list(ids))
+        for chunk_id, metadata in zip(ids, metadatas):
+            indexed.setdefault(metadata['source'], {'ids': []})['ids'].append(chunk_id)
+        report['chunks'] += len(batch)
+
+    if vectorstore is None:
+        raise ValueError(f"Không tìm thấy tài liệu nào ({', '.join(SUPPORTED_EXTENSIONS)}) trong {docs_dir}.")
+
+    for relpath in changed:
+        indexed.setdefault(relpath, {'ids': []})['hash'] = current[relpath]
+    report['elapsed_s'] = time.perf_counter() - start
+    report['pages_per_s'] = report['pages'] / report['elapsed_s'] if report['elapsed_s'] else 0.0
+    report['chunks_per_s'] = report['chunks'] / report['elapsed_s'] if report['elapsed_s'] else 0.0
+
+    if index_path:
+        manifest.update({
+            'chunk_size': chunk_size,
+            'chunk_overlap': chunk_overlap,
+            'model_name': model_name,
+            'num_chunks': len(vectorstore.index_to_docstore_id),
+            'built_at': datetime.now().isoformat(timespec='seconds'),
+            'files': indexed,
+        })
+        _save_index(index_dir, key, vectorstore, manifest)
+    return vectorstore, report
+
+
+def build_vectorstore(embedding_model, docs_dir=DOCS_DIR, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """Trích xuất, chia chunk và embed toàn bộ tài liệu trong bộ nhớ (không lưu xuống đĩa)."""
+    vectorstore, _ = ingest_directory(embedding_model, docs_dir, index_dir=None, chunk_size=chunk_size,
+                                      chunk_overlap=chunk_overlap, workers=0)
+    return vectorstore
+
+
+def load_or_build_vectorstore(embedding_model, docs_dir=DOCS_DIR, index_dir=INDEX_DIR,
+                              chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+                              model_name=EMBEDDING_MODEL_NAME, force_rebuild=False, workers=0, ann_config=None,
+                              mmap=False):
+    """Nạp FAISS index đã lưu trên đĩa, chỉ embed lại những tài liệu mới hoặc đã thay đổi.
+    Mặc định trích xuất tuần tự vì hàm này chạy trong server; build song song dùng setup_database.py.
+    ann_config (AnnIndexConfig) chọn loại index dùng để tìm kiếm; mặc định là exact search.
+    mmap=True đọc index tìm kiếm từ file bằng mmap chỉ đọc để nhiều process dùng chung (vectorstore trả về
+    không thêm/xóa tài liệu được nữa)."""
+    vectorstore, _ = ingest_directory(embedding_model, docs_dir, index_dir, chunk_size, chunk_overlap,
+                                      model_name, force_rebuild, workers)
+    index_path = (os.path.join(index_dir, settings_key(docs_dir, chunk_size, chunk_overlap, model_name))
+                  if index_dir else None)
+    if ann_config is not None and not ann_config.is_exact:
+        from agent.ann_index import apply_ann_index
+
+        vectorstore = apply_ann_index(vectorstore, ann_config, index_path, mmap=mmap)
+    elif mmap and index_path:
+        from agent.ann_index import read_index_mmap
+
+        vectorstore.index = read_index_mmap(os.path.join(index_path, 'index.faiss'))
+    return vectorstore
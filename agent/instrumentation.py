@@ -0,0 +1,188 @@
+"""Đo đạc từng lượt hội thoại của agent: mỗi vòng ReAct (lời gọi LLM, độ trễ, token), mỗi lần gọi tool và
+mỗi lần tra cache. Kết quả được xuất thành một dòng log JSON cho mỗi lượt và cộng vào counter/histogram
+kiểu Prometheus (xem utils/metrics.py)."""
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from agent.context import CHARS_PER_TOKEN
+from agent.model_router import model_name_of
+from agent.router import ROUTE_AGENT
+from utils.helper import get_metrics
+from utils.metrics import current_trace
+
+turn_logger = logging.getLogger('english_tutor.turns')
+
+
+class TurnTrace:
+    """Dữ liệu đo đạc của một lượt: route, các lời gọi LLM, các lần gọi tool và số lần hit/miss cache."""
+
+    def __init__(self, user_id=None, session_id=None, model=None):
+        self.turn_id = uuid.uuid4().hex[:12]
+        self.user_id = user_id
+        self.session_id = session_id
+        self.model = model
+        self.route = None
+        self.started_at = time.time()
+        self.duration_s = None
+        self.error = None
+        self.llm_calls = []
+        self.tool_calls = []
+        self.cache = {}
+        self._start = time.perf_counter()
+
+    def record_llm(self, duration_s, prompt_tokens, completion_tokens, estimated, model=None):
+        self.llm_calls.append({
+            'model': model or self.model,
+            'duration_ms': round(duration_s * 1000, 2),
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'tokens_estimated': estimated,
+        })
+
+    def record_tool(self, name, duration_s, output_chars, error=None):
+        self.tool_calls.append({
+            'tool': name,
+            'duration_ms': round(duration_s * 1000, 2),
+            'output_chars': output_chars,
+            'error': error,
+        })
+
+    def record_cache(self, namespace, hit):
+        counters = self.cache.setdefault(namespace, {'hits': 0, 'misses': 0})
+        counters['hits' if hit else 'misses'] += 1
+
+    def to_dict(self):
+        return {
+            'turn_id': self.turn_id,
+            'user_id': self.user_id,
+            'session_id': self.session_id,
+            'model': self.model,
+            'route': self.route,
+            'started_at': self.started_at,
+            'duration_ms': round(self.duration_s * 1000, 2) if self.duration_s is not None else None,
+            'react_iterations': len(self.llm_calls) if self.route == ROUTE_AGENT else 0,
+            'prompt_tokens': sum(call['prompt_tokens'] for call in self.llm_calls),
+            'completion_tokens': sum(call['completion_tokens'] for call in self.llm_calls),
+            'llm_calls': self.llm_calls,
+            'tool_calls': self.tool_calls,
+            'cache': self.cache,
+            'error': self.error,
+        }
+
+    def finish(self, route, error=None):
+        """Kết thúc lượt: ghi log JSON và cập nhật metrics. Trả về dict của lượt (dùng cho debug panel)."""
+        self.route = route
+        self.error = str(error) if error is not None else None
+        self.duration_s = time.perf_counter() - self._start
+        data = self.to_dict()
+
+        metrics = get_metrics()
+        metrics.inc('tutor_turns_total', route=route)
+        metrics.observe('tutor_turn_duration_seconds', self.duration_s, route=route)
+        if error is not None:
+            metrics.inc('tutor_turn_errors_total', route=route)
+        if route == ROUTE_AGENT:
+            metrics.observe('tutor_react_iterations', len(self.llm_calls))
+        for call in self.llm_calls:
+            metrics.inc('tutor_llm_calls_total', model=call['model'])
+            metrics.observe('tutor_llm_duration_seconds', call['duration_ms'] / 1000, model=call['model'])
+            metrics.inc('tutor_llm_tokens_total', call['prompt_tokens'], model=call['model'], kind='prompt')
+            metrics.inc('tutor_llm_tokens_total', call['completion_tokens'], model=call['model'], kind='completion')
+        for call in self.tool_calls:
+            metrics.inc('tutor_tool_calls_total', tool=call['tool'], status='error' if call['error'] else 'ok')
+            metrics.observe('tutor_tool_duration_seconds', call['duration_ms'] / 1000, tool=call['tool'])
+        for namespace, counters in self.cache.items():
+            for field, result in (('hits', 'hit'), ('misses', 'miss')):
+                if counters[field]:
+                    metrics.inc('tutor_cache_requests_total', counters[field], namespace=namespace, result=result)
+
+        if turn_logger.isEnabledFor(logging.INFO):
+            turn_logger.info(json.dumps(data, ensure_ascii=False))
+        return data
+
+
+@contextmanager
+def activate_trace(trace):
+    """Đặt trace làm lượt hiện tại để cache/tool ở các lớp dưới ghi sự kiện vào đúng lượt."""
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+
+
+def _token_usage(response):
+    """(prompt_tokens, completion_tokens) từ LLMResult nếu provider trả về usage, ngược lại None."""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, 'message', None), 'usage_metadata', None)
+            if usage:
+                return usage.get('input_tokens', 0), usage.get('output_tokens', 0)
+    usage = (response.llm_output or {}).get('token_usage') or (response.llm_output or {}).get('usage_metadata')
+    if usage:
+        return (usage.get('prompt_tokens', usage.get('input_tokens', 0)),
+                usage.get('completion_tokens', usage.get('output_tokens', 0)))
+    return None
+
+
+class TurnRecorder(BaseCallbackHandler):
+    """Callback ghi lại số lời gọi LLM và tên các tool mà agent đã dùng trong một lượt.
+    Nếu có trace, độ trễ và token của từng lời gọi LLM/tool cũng được ghi vào trace."""
+
+    def __init__(self, trace=None):
+        self.tools_used = []
+        self.llm_calls = 0
+        self.trace = trace
+        self._started = {}
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.llm_calls += 1
+        if self.trace is not None:
+            self._started[kwargs.get('run_id')] = (
+                time.perf_counter(), sum(len(prompt) for prompt in prompts), model_name_of(kwargs)
+            )
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.llm_calls += 1
+        if self.trace is not None:
+            chars = sum(len(str(message.content)) for batch in messages for message in batch)
+            self._started[kwargs.get('run_id')] = (time.perf_counter(), chars, model_name_of(kwargs))
+
+    def on_llm_end(self, response, **kwargs):
+        started = self._started.pop(kwargs.get('run_id'), None)
+        if started is None:
+            return
+        start, prompt_chars, model = started
+        usage = _token_usage(response)
+        if usage is not None:
+            self.trace.record_llm(time.perf_counter() - start, usage[0], usage[1], estimated=False, model=model)
+            return
+        completion_chars = sum(len(generation.text) for generations in response.generations for generation in generations)
+        self.trace.record_llm(time.perf_counter() - start, prompt_chars // CHARS_PER_TOKEN,
+                              completion_chars // CHARS_PER_TOKEN, estimated=True, model=model)
+
+    def on_llm_error(self, error, **kwargs):
+        started = self._started.pop(kwargs.get('run_id'), None)
+        if started is not None:
+            self.trace.record_llm(time.perf_counter() - started[0], 0, 0, estimated=True, model=started[2])
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        name = (serialized or {}).get("name", "")
+        self.tools_used.append(name)
+        if self.trace is not None:
+            self._started[kwargs.get('run_id')] = (time.perf_counter(), name)
+
+    def on_tool_end(self, output, **kwargs):
+        started = self._started.pop(kwargs.get('run_id'), None)
+        if started is not None:
+            self.trace.record_tool(started[1], time.perf_counter() - started[0], len(str(output)))
+
+    def on_tool_error(self, error, **kwargs):
+        started = self._started.pop(kwargs.get('run_id'), None)
+        if started is not None:
+            self.trace.record_tool(started[1], time.perf_counter() - started[0], 0, error=str(error))
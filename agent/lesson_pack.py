@@ -0,0 +1,231 @@
+"""Gói bài học soạn sẵn theo trình độ: giải thích và bài tập cho các chủ đề ngữ pháp hay hỏi (thì, mạo từ, câu hỏi,
+lỗi thường gặp...) được soạn offline một lần cho mỗi trình độ từ chính tài liệu RAG (docs/), lưu trong LessonPack
+(database/db_manager.py), rồi agent trả lời thẳng từ gói hoặc dùng làm căn cứ thay vì soạn lại ở mỗi lượt.
+
+    python setup_database.py --lesson-pack --skip-rag
+
+Build chạy lại được nhiều lần: chỉ các (chủ đề, trình độ) có đoạn tài liệu nguồn hoặc LESSON_PACK_VERSION đã đổi mới
+được soạn lại.
+"""
+import hashlib
+import os
+import re
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+LEVELS = ('beginner', 'intermediate', 'advanced')
+# Tăng khi đổi prompt hoặc định dạng bài học để lần build sau soạn lại toàn bộ gói
+LESSON_PACK_VERSION = 1
+LESSON_TOPICS = os.path.join(os.path.dirname(__file__), '..', 'database', 'lesson_topics.txt')
+# Số đoạn tài liệu làm căn cứ cho mỗi chủ đề
+GROUNDING_CHUNKS = 4
+LEVEL_GUIDANCE = {
+    'beginner': "câu ngắn, từ vựng đơn giản, giải thích chủ yếu bằng tiếng Việt kèm ví dụ tiếng Anh dễ; "
+                "3 bài tập điền từ hoặc chọn đáp án",
+    'intermediate': "giải thích bằng tiếng Anh, thêm ghi chú tiếng Việt cho điểm dễ nhầm; so sánh với cấu trúc gần "
+                    "giống; 4 bài tập gồm điền từ và sửa lỗi",
+    'advanced': "giải thích bằng tiếng Anh, nêu sắc thái, ngoại lệ và cách dùng trang trọng/thân mật; "
+                "4 bài tập viết lại câu hoặc sửa lỗi tinh tế",
+}
+# Câu hỏi dài hơn thế này thường kèm ngữ cảnh riêng (đoạn văn, bài viết) nên không trả lời bằng bài soạn sẵn
+MAX_SERVED_WORDS = 16
+MAX_GROUNDED_WORDS = 60
+MAX_GROUNDING_LESSONS = 2
+
+LESSON_SERVED = 'served'
+LESSON_GROUNDED = 'grounded'
+
+# Yêu cầu giải thích/luyện tập chung về một chủ đề: bài soạn sẵn trả lời được trọn vẹn
+EXPLANATION_PATTERNS = [
+    r"^(?:please |can you |could you )?(?:explain|teach me|tell me about)\b",
+    r"^what(?:'s| is| are)\b",
+    r"^(?:when|how) (?:do|should|can) (?:i|we|you) use\b",
+    r"^how (?:do|should|can) (?:i|we|you) (?:form|make)\b",
+    r"^how to (?:use|form|make)\b",
+    r"^(?:give me|i want|i need|can i have) (?:some |more )?(?:exercises?|practice)\b",
+    r"\bgiải thích\b",
+    r"\bcách dùng\b",
+    r"\blà gì\b",
+    r"\bbài tập\b",
+]
+# Câu hỏi ngữ pháp cụ thể hơn: bài soạn sẵn được dùng làm căn cứ cho một lời gọi LLM
+GRAMMAR_QUESTION_PATTERNS = [
+    r"\?$",
+    r"\b(?:explain|difference|differences|compare|versus|vs|when|why|how|which|correct|right|wrong|mistakes?|"
+    r"examples?|use|usage|rules?|exercises?|practice)\b",
+    r"\b(?:khác nhau|khi nào|tại sao|vì sao|đúng không|ví dụ|cách|bài tập)\b",
+]
+
+LessonTopic = namedtuple('LessonTopic', 'slug title keywords')
+Lesson = namedtuple('Lesson', 'topic title keywords explanation exercises sources')
+
+
+def normalize_phrase(text):
+    """Chữ thường, chỉ giữ chữ/số/nháy đơn, ngăn cách bằng một dấu cách ("Subject-verb" -> "subject verb")."""
+    return ' '.join(re.findall(r"[\w']+", text.lower().replace('’', "'")))
+
+
+def load_topics(path=LESSON_TOPICS):
+    """Các chủ đề từ file "Tiêu đề | cụm từ khóa, cụm từ khóa, ..." (bỏ qua dòng trống và dòng '#')."""
+    topics = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            title, _, keywords = line.partition('|')
+            title = title.strip()
+            phrases = [phrase.strip() for phrase in keywords.split(',') if phrase.strip()]
+            slug = normalize_phrase(title).replace(' ', '-')
+            topics.append(LessonTopic(slug, title, ', '.join(dict.fromkeys([title.lower(), *phrases]))))
+    return topics
+
+
+def topic_grounding(topic, retriever, k=GROUNDING_CHUNKS):
+    """(đoạn tài liệu làm căn cứ, danh sách nguồn, hash) của một chủ đề. Hash chỉ phụ thuộc nội dung các đoạn tìm
+    được nên tài liệu đổi ở chỗ khác không làm chủ đề này phải soạn lại."""
+    docs = retriever.search(f"{topic.title}: {topic.keywords}", k=k)
+    text = "\n\n".join(doc.page_content for doc in docs)
+    sources = []
+    for doc in docs:
+        source = os.path.basename(str(doc.metadata.get('source', '')))
+        page = doc.metadata.get('page')
+        label = f"{source} p.{page}" if isinstance(page, int) and source.lower().endswith('.pdf') else source
+        if label and label not in sources:
+            sources.append(label)
+    digest = hashlib.sha256(f"{topic.title}\n{text}".encode('utf-8')).hexdigest()[:16]
+    return text, '; '.join(sources), digest
+
+
+def build_lesson_prompt(topic, level, grounding):
+    return f"""Bạn là giáo viên tiếng Anh cho học viên Việt Nam. Soạn một bài học ngắn về chủ đề "{topic.title}"
+cho học viên trình độ {level}: {LEVEL_GUIDANCE[level]}.
+Chỉ dựa vào tài liệu của lớp dưới đây; không thêm quy tắc mà tài liệu không có.
+
+Tài liệu:
+{grounding}
+
+Trả lời đúng định dạng, không thêm gì trước EXPLANATION:
+EXPLANATION:
+<giải thích: cách dùng, cấu trúc, 2-3 ví dụ, lỗi người Việt hay gặp>
+EXERCISES:
+<các bài tập đánh số, đáp án ở cuối dưới dòng "Đáp án:">"""
+
+
+def parse_lesson(text):
+    """(giải thích, bài tập) từ câu trả lời theo định dạng EXPLANATION:/EXERCISES:; thiếu phần bài tập thì cả câu
+    trả lời là phần giải thích."""
+    text = re.sub(r"^\s*EXPLANATION:\s*", "", text.strip(), flags=re.IGNORECASE)
+    parts = re.split(r"^\s*EXERCISES:\s*$", text, maxsplit=1, flags=re.IGNORECASE | re.MULTILINE)
+    return parts[0].strip(), parts[1].strip() if len(parts) > 1 else ''
+
+
+def build_lesson_pack(pack, topics, retriever, generate, index_key, levels=LEVELS, workers=4, force=False):
+    """Soạn/cập nhật gói bài học. generate(prompt) -> (câu trả lời, tên model); mục soạn lỗi được bỏ qua và
+    thử lại ở lần build sau. Trả về báo cáo số mục đã soạn, giữ nguyên, xóa và lỗi."""
+    start = time.perf_counter()
+    revisions = pack.revisions()
+    grounding = {topic.slug: topic_grounding(topic, retriever) for topic in topics}
+
+    pending, unchanged = [], []
+    for topic in topics:
+        source_hash = grounding[topic.slug][2]
+        for level in levels:
+            if not force and revisions.get((topic.slug, level)) == (source_hash, LESSON_PACK_VERSION):
+                unchanged.append((topic.slug, level))
+            else:
+                pending.append((topic, level))
+    wanted = {(topic.slug, level) for topic in topics for level in levels}
+    removed = [key for key in revisions if key not in wanted]
+    pack.remove(removed)
+    pack.confirm(unchanged, index_key, {topic.slug: (topic.title, topic.keywords) for topic in topics})
+
+    def _generate(topic, level):
+        text, sources, source_hash = grounding[topic.slug]
+        answer, model = generate(build_lesson_prompt(topic, level, text))
+        explanation, exercises = parse_lesson(answer)
+        if not explanation:
+            raise ValueError(f"Bài học trống: {topic.title} ({level})")
+        return (topic.slug, level, topic.title, topic.keywords, explanation, exercises, sources, source_hash,
+                LESSON_PACK_VERSION, index_key, model)
+
+    failed = []
+    # Mỗi mục chủ yếu là chờ LLM nên dùng thread; LLMGateway giới hạn tần suất chung
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        futures = {pool.submit(_generate, topic, level): (topic, level) for topic, level in pending}
+        for future in as_completed(futures):
+            topic, level = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                failed.append(f"{topic.title} ({level}): {e}")
+                continue
+            # Ghi từng mục ngay khi xong để build bị ngắt giữa chừng vẫn giữ được phần đã soạn
+            pack.upsert([entry])
+
+    return {
+        'topics': len(topics),
+        'entries': len(pack),
+        'generated': len(pending) - len(failed),
+        'unchanged': len(unchanged),
+        'removed': len(removed),
+        'failed': failed,
+        'elapsed_s': time.perf_counter() - start,
+    }
+
+
+def _normalize_message(text):
+    return re.sub(r'\s+', ' ', text.strip().lower().replace('’', "'"))
+
+
+def match_lessons(pack, message, level):
+    """Các bài học (Lesson) của trình độ `level` có cụm từ khóa xuất hiện nguyên văn trong tin nhắn. Chủ đề chỉ khớp
+    bên trong cụm của chủ đề khác bị bỏ ("present simple" trong "present simple vs present continuous")."""
+    padded = f" {normalize_phrase(message)} "
+    spans = []
+    for row in pack.candidates(message, level):
+        lesson = Lesson(*row)
+        best = None
+        for phrase in lesson.keywords.split(','):
+            phrase = normalize_phrase(phrase)
+            position = padded.find(f" {phrase} ") if phrase else -1
+            if position >= 0 and (best is None or len(phrase) > best[1] - best[0]):
+                best = (position, position + len(phrase) + 1)
+        if best is not None:
+            spans.append((best, lesson))
+    return [
+        lesson for (start, end), lesson in spans
+        if not any(s <= start and end <= e and (e - s) > (end - start) for (s, e), _ in spans)
+    ]
+
+
+def choose_lesson_mode(message, lessons, context_dependent=False):
+    """LESSON_SERVED nếu trả lời thẳng bằng bài soạn sẵn được (yêu cầu giải thích/bài tập chung về đúng một chủ đề),
+    LESSON_GROUNDED nếu là câu hỏi ngữ pháp cụ thể hơn về tối đa MAX_GROUNDING_LESSONS chủ đề, ngược lại None."""
+    if not lessons:
+        return None
+    text = _normalize_message(message)
+    words = len(text.split())
+    if (len(lessons) == 1 and not context_dependent and words <= MAX_SERVED_WORDS
+            and any(re.search(pattern, text) for pattern in EXPLANATION_PATTERNS)):
+        return LESSON_SERVED
+    if (len(lessons) <= MAX_GROUNDING_LESSONS and words <= MAX_GROUNDED_WORDS
+            and any(re.search(pattern, text) for pattern in GRAMMAR_QUESTION_PATTERNS)):
+        return LESSON_GROUNDED
+    return None
+
+
+def format_lesson(lesson):
+    """Câu trả lời cho học viên từ một bài soạn sẵn."""
+    parts = [f"**{lesson.title}**", lesson.explanation]
+    if lesson.exercises:
+        parts.append(f"**Bài tập:**\n{lesson.exercises}")
+    if lesson.sources:
+        parts.append(f"_Nguồn: {lesson.sources}_")
+    return "\n\n".join(parts)
+
+
+def lesson_grounding(lessons):
+    """Phần thêm vào system prompt khi dùng bài soạn sẵn làm căn cứ."""
+    return "\n\n".join(f"[{lesson.title}]\n{lesson.explanation}" for lesson in lessons)
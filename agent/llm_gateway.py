@@ -0,0 +1,477 @@
+"""Cổng chung cho mọi lời gọi Gemini (LangChain và google.generativeai) của process.
+
+- Giới hạn tần suất theo token bucket cho từng model (TUTOR_LLM_RPM), thay vì để Gemini trả 429.
+- Gộp các yêu cầu giống hệt nhau đang chạy (single-flight): nhiều phiên hỏi cùng một câu cùng lúc chỉ tốn một lời gọi.
+- Thử lại lỗi tạm thời/giới hạn tần suất với backoff lũy thừa có jitter để các client không thử lại cùng lúc.
+- Circuit breaker cho từng model: sau nhiều lỗi liên tiếp thì từ chối ngay (CircuitOpenError) trong một khoảng thời
+  gian, để ModelRouter chuyển sang model khác thay vì chờ timeout.
+Client thật (ChatGoogleGenerativeAI, genai.GenerativeModel) vẫn được tạo một lần cho mỗi model trong registry
+(utils/helper.py) và dùng chung; gateway chỉ điều phối các lời gọi đi qua chúng.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from utils.helper import get_metrics
+
+RATE_LIMIT_MARKERS = ('429', 'resourceexhausted', 'resource has been exhausted', 'quota', 'rate limit')
+TRANSIENT_MARKERS = ('timeout', 'timed out', 'deadlineexceeded', 'deadline exceeded', '500', '502', '503', '504',
+                     'serviceunavailable', 'internalservererror', 'unavailable', 'connection')
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(RuntimeError):
+    """Model đang bị circuit breaker chặn; lời gọi bị từ chối ngay mà không gửi tới Gemini."""
+
+    def __init__(self, model, retry_after_s):
+        super().__init__(f"Circuit breaker đang mở cho {model}, thử lại sau {retry_after_s:.0f}s (service unavailable).")
+        self.model = model
+        self.retry_after_s = retry_after_s
+
+
+def classify_error(error):
+    """'rate_limit', 'transient' (thử lại/thử model khác được) hoặc None (lỗi cấu hình/đầu vào, thử lại vô ích)."""
+    if isinstance(error, CircuitOpenError):
+        return 'transient'
+    text = f"{type(error).__name__} {error}".lower()
+    if any(marker in text for marker in RATE_LIMIT_MARKERS):
+        return 'rate_limit'
+    if isinstance(error, (TimeoutError, ConnectionError)) or any(marker in text for marker in TRANSIENT_MARKERS):
+        return 'transient'
+    return None
+
+
+class TokenBucket(BaseRateLimiter):
+    """Token bucket an toàn đa luồng: `rate_per_s` token mỗi giây, tối đa `capacity` token (độ dài burst).
+    Dùng được trực tiếp làm rate_limiter của chat model LangChain."""
+
+    def __init__(self, rate_per_s, capacity=None):
+        self.rate_per_s = rate_per_s
+        self.capacity = capacity or max(1.0, rate_per_s)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self):
+        """Lấy một token; trả về 0 nếu được, ngược lại số giây cần chờ."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_s)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate_per_s
+
+    def acquire(self, *, blocking=True):
+        while True:
+            wait = self._take()
+            if not wait:
+                return True
+            if not blocking:
+                return False
+            time.sleep(wait)
+
+    async def aacquire(self, *, blocking=True):
+        while True:
+            wait = self._take()
+            if not wait:
+                return True
+            if not blocking:
+                return False
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    """Mở sau `failure_threshold` lỗi liên tiếp; sau `reset_timeout` giây cho đúng một lời gọi thử (half-open),
+    thành công thì đóng lại, thất bại thì mở tiếp."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CIRCUIT_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_id = 0
+        self._lock = threading.Lock()
+
+    def admit(self):
+        """(0 nếu được gọi, ngược lại số giây còn lại trước khi thử lại; mã lời gọi thử half-open hoặc None)."""
+        with self._lock:
+            if self.state == CIRCUIT_CLOSED:
+                return 0.0, None
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if self.state == CIRCUIT_OPEN and remaining <= 0:
+                self.state = CIRCUIT_HALF_OPEN
+            if self.state == CIRCUIT_HALF_OPEN and not self._probing:
+                self._probing = True
+                self._probe_id += 1
+                return 0.0, self._probe_id
+            return max(remaining, 1.0), None
+
+    def allow(self):
+        """0 nếu được gọi, ngược lại số giây còn lại trước khi thử lại."""
+        return self.admit()[0]
+
+    def end_probe(self, probe):
+        """Kết thúc lời gọi thử `probe` chưa được record_success/record_failure kết luận (lỗi đầu vào/cấu hình không
+        nói gì về model, lời gọi bị hủy, stream bị bỏ dở): breaker vẫn half-open và lời gọi kế tiếp được thử."""
+        with self._lock:
+            if self._probing and self._probe_id == probe:
+                self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CIRCUIT_CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == CIRCUIT_HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = CIRCUIT_OPEN
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class SingleFlight:
+    """Gộp các lời gọi cùng khóa đang chạy: lời gọi đầu tiên thực hiện, các lời gọi đến sau (thread hay coroutine)
+    chờ và nhận cùng kết quả hoặc cùng lỗi."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _done(self, key):
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def do(self, key, func):
+        """(kết quả, True nếu lời gọi này được gộp vào một lời gọi khác)."""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result(), True
+        try:
+            result = func()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._done(key)
+
+    async def ado(self, key, func):
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future), True
+        try:
+            result = await func()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._done(key)
+
+
+class LLMGateway:
+    """Điều phối lời gọi tới từng model: circuit breaker -> token bucket -> gọi -> thử lại có jitter."""
+
+    def __init__(self, requests_per_minute=None, burst=None, max_retries=2, base_delay=0.5, max_delay=8.0,
+                 failure_threshold=5, reset_timeout=30.0):
+        self.requests_per_minute = requests_per_minute
+        self.burst = burst
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._limiters = {}
+        self._breakers = {}
+        self._single_flight = SingleFlight()
+        self._counters = {'calls': 0, 'upstream_calls': 0, 'coalesced': 0, 'retries': 0, 'rejected': 0, 'failures': 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """TUTOR_LLM_RPM: số request/phút tối đa cho mỗi model (mặc định không giới hạn); TUTOR_LLM_BURST;
+        TUTOR_LLM_RETRIES (mặc định 2); TUTOR_LLM_BREAKER_FAILURES (mặc định 5); TUTOR_LLM_BREAKER_RESET_S (mặc định 30)."""
+        rpm = os.getenv('TUTOR_LLM_RPM')
+        burst = os.getenv('TUTOR_LLM_BURST')
+        return cls(
+            requests_per_minute=float(rpm) if rpm else None,
+            burst=float(burst) if burst else None,
+            max_retries=int(os.getenv('TUTOR_LLM_RETRIES', '2')),
+            failure_threshold=int(os.getenv('TUTOR_LLM_BREAKER_FAILURES', '5')),
+            reset_timeout=float(os.getenv('TUTOR_LLM_BREAKER_RESET_S', '30')),
+        )
+
+    def limiter(self, model):
+        """Token bucket của model (quota Gemini tính theo từng model), None nếu không giới hạn."""
+        if not self.requests_per_minute:
+            return None
+        with self._lock:
+            limiter = self._limiters.get(model)
+            if limiter is None:
+                limiter = self._limiters[model] = TokenBucket(self.requests_per_minute / 60.0, self.burst)
+            return limiter
+
+    def breaker(self, model):
+        with self._lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = self._breakers[model] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    def backoff(self, attempt, kind):
+        """Backoff lũy thừa với "equal jitter": nửa cố định, nửa ngẫu nhiên. Lỗi 429 chờ lâu gấp đôi."""
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt) * (2 if kind == 'rate_limit' else 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _count(self, field, value=1):
+        with self._lock:
+            self._counters[field] += value
+
+    def _admit(self, model):
+        """Kiểm tra circuit breaker; raise CircuitOpenError nếu model đang bị chặn.
+        Trả về mã lời gọi thử nếu lời gọi này là lời gọi thử half-open (để _end_probe), ngược lại None."""
+        retry_after, probe = self.breaker(model).admit()
+        if retry_after:
+            self._count('rejected')
+            get_metrics().inc('tutor_llm_gateway_rejected_total', model=model)
+            raise CircuitOpenError(model, retry_after)
+        self._count('upstream_calls')
+        return probe
+
+    def _end_probe(self, model, probe):
+        # Gọi trong finally của mỗi lần thử: lời gọi thử kết thúc theo bất kỳ cách nào cũng không giữ breaker mãi
+        if probe is not None:
+            self.breaker(model).end_probe(probe)
+
+    def _on_failure(self, model, error, attempt, retries):
+        """Ghi nhận lỗi; trả về số giây chờ trước khi thử lại, hoặc None nếu không thử lại."""
+        kind = classify_error(error)
+        if kind is None:
+            return None
+        self._count('failures')
+        self.breaker(model).record_failure()
+        if attempt >= retries:
+            return None
+        self._count('retries')
+        get_metrics().inc('tutor_llm_gateway_retries_total', model=model, reason=kind)
+        return self.backoff(attempt, kind)
+
+    def _retries(self, retries):
+        return self.max_retries if retries is None else retries
+
+    def _coalesced(self, model, coalesced):
+        if coalesced:
+            self._count('coalesced')
+            get_metrics().inc('tutor_llm_gateway_coalesced_total', model=model)
+
+    def call(self, model, func, key=None, retries=None):
+        """Gọi func() tới `model` qua gateway. `key` (chuỗi mô tả đầy đủ yêu cầu) bật gộp yêu cầu giống nhau;
+        `retries` ghi đè số lần thử lại (0 khi người gọi còn model dự phòng để chuyển sang ngay)."""
+        self._count('calls')
+        if key is None:
+            return self._call(model, func, self._retries(retries))
+        result, coalesced = self._single_flight.do((model, key), lambda: self._call(model, func, self._retries(retries)))
+        self._coalesced(model, coalesced)
+        return result
+
+    def _call(self, model, func, retries):
+        attempt = 0
+        while True:
+            probe = self._admit(model)
+            try:
+                limiter = self.limiter(model)
+                if limiter is not None:
+                    limiter.acquire()
+                try:
+                    result = func()
+                except Exception as e:
+                    delay = self._on_failure(model, e, attempt, retries)
+                    if delay is None:
+                        raise
+                else:
+                    self.breaker(model).record_success()
+                    return result
+            finally:
+                self._end_probe(model, probe)
+            attempt += 1
+            time.sleep(delay)
+
+    async def acall(self, model, func, key=None, retries=None):
+        """Giống call, với func() trả về coroutine."""
+        self._count('calls')
+        if key is None:
+            return await self._acall(model, func, self._retries(retries))
+        result, coalesced = await self._single_flight.ado(
+            (model, key), lambda: self._acall(model, func, self._retries(retries))
+        )
+        self._coalesced(model, coalesced)
+        return result
+
+    async def _acall(self, model, func, retries):
+        attempt = 0
+        while True:
+            probe = self._admit(model)
+            try:
+                limiter = self.limiter(model)
+                if limiter is not None:
+                    await limiter.aacquire()
+                try:
+                    result = await func()
+                except Exception as e:
+                    delay = self._on_failure(model, e, attempt, retries)
+                    if delay is None:
+                        raise
+                else:
+                    self.breaker(model).record_success()
+                    return result
+            finally:
+                self._end_probe(model, probe)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def stream(self, model, func, retries=None):
+        """Giống call cho func() trả về iterator (không gộp); chỉ thử lại nếu lỗi xảy ra trước phần đầu tiên."""
+        self._count('calls')
+        retries, attempt = self._retries(retries), 0
+        while True:
+            probe = self._admit(model)
+            started = False
+            try:
+                limiter = self.limiter(model)
+                if limiter is not None:
+                    limiter.acquire()
+                try:
+                    for chunk in func():
+                        started = True
+                        yield chunk
+                except Exception as e:
+                    delay = None if started else self._on_failure(model, e, attempt, retries)
+                    if started:
+                        self.breaker(model).record_failure()
+                    if delay is None:
+                        raise
+                else:
+                    self.breaker(model).record_success()
+                    return
+            finally:
+                # Kể cả khi người dùng ngừng đọc stream giữa chừng (GeneratorExit)
+                self._end_probe(model, probe)
+            attempt += 1
+            time.sleep(delay)
+
+    async def astream(self, model, func, retries=None):
+        """Giống stream, với func() trả về async iterator."""
+        self._count('calls')
+        retries, attempt = self._retries(retries), 0
+        while True:
+            probe = self._admit(model)
+            started = False
+            try:
+                limiter = self.limiter(model)
+                if limiter is not None:
+                    await limiter.aacquire()
+                try:
+                    async for chunk in func():
+                        started = True
+                        yield chunk
+                except Exception as e:
+                    delay = None if started else self._on_failure(model, e, attempt, retries)
+                    if started:
+                        self.breaker(model).record_failure()
+                    if delay is None:
+                        raise
+                else:
+                    self.breaker(model).record_success()
+                    return
+            finally:
+                self._end_probe(model, probe)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def chat_model(self, llm, model, retries=None):
+        """Bọc chat model LangChain dùng chung để mọi lời gọi của nó đi qua gateway."""
+        return GatewayChatModel(inner=llm, gateway=self, model=model, retries=retries)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['circuits'] = {model: breaker.state for model, breaker in self._breakers.items()}
+        return stats
+
+
+class GatewayChatModel(BaseChatModel):
+    """Chat model LangChain gọi `inner` qua LLMGateway. Callback (TurnRecorder, streaming token) vẫn chạy một lần
+    cho mỗi lời gọi như với model gốc; tên model trong metadata cũng là của model gốc."""
+
+    inner: BaseChatModel
+    gateway: Any
+    model: str
+    retries: Optional[int] = None
+
+    @property
+    def _llm_type(self):
+        return f"gateway-{self.inner._llm_type}"
+
+    def _get_ls_params(self, stop=None, **kwargs):
+        return self.inner._get_ls_params(stop=stop, **kwargs)
+
+    def _request_key(self, messages, stop, kwargs):
+        payload = json.dumps(
+            [getattr(self.inner, 'temperature', None), stop, [(message.type, message.content) for message in messages],
+             kwargs],
+            sort_keys=True, ensure_ascii=False, default=str,
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return self.gateway.call(
+            self.model, lambda: self.inner._generate(messages, stop=stop, **kwargs),
+            key=self._request_key(messages, stop, kwargs), retries=self.retries,
+        )
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return await self.gateway.acall(
+            self.model, lambda: self.inner._agenerate(messages, stop=stop, **kwargs),
+            key=self._request_key(messages, stop, kwargs), retries=self.retries,
+        )
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        # BaseChatModel.stream tự phát on_llm_new_token cho từng chunk nên không truyền run_manager xuống model gốc
+        yield from self.gateway.stream(
+            self.model, lambda: self.inner._stream(messages, stop=stop, **kwargs), retries=self.retries
+        )
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        async for chunk in self.gateway.astream(
+            self.model, lambda: self.inner._astream(messages, stop=stop, **kwargs), retries=self.retries
+        ):
+            yield chunk
@@ -0,0 +1,310 @@
+"""Chọn model Gemini cho từng yêu cầu theo loại tác vụ (trò chuyện, phân tích, suy luận dùng tool), độ dài
+đầu vào và ngân sách độ trễ/chi phí, tự chuyển sang tier khác khi một model đang chậm hoặc bị giới hạn tần suất.
+
+Mỗi tier (fast/balanced/smart/coding) là một model thật; độ trễ gần đây và lỗi của từng model được theo dõi
+chung cho cả process nên mọi phiên cùng tránh model đang quá tải. Mọi lời gọi đi qua LLMGateway (giới hạn tần suất,
+thử lại, circuit breaker, gộp yêu cầu trùng); chỉ model cuối cùng trong danh sách được thử lại tại chỗ, các model
+trước lỗi thì chuyển ngay sang model kế tiếp.
+"""
+import json
+import os
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from agent.llm_gateway import classify_error
+from utils.helper import get_chat_llm, get_llm_gateway, get_metrics
+
+TASK_CHAT = 'chat'
+TASK_ANALYSIS = 'analysis'
+TASK_TOOLS = 'tool_reasoning'
+TASKS = (TASK_CHAT, TASK_ANALYSIS, TASK_TOOLS)
+
+TIER_AUTO = 'auto'
+
+# Giá tham khảo (USD / 1 triệu token đầu vào) để áp ngân sách chi phí khi chọn tự động
+DEFAULT_TIERS = {
+    'fast': {'model': 'gemini-2.0-flash-lite', 'cost': 0.075},
+    'balanced': {'model': 'gemini-2.0-flash', 'cost': 0.10},
+    'smart': {'model': 'gemini-2.5-flash', 'cost': 0.30},
+    'coding': {'model': 'gemini-2.5-pro', 'cost': 1.25},
+}
+
+# Thứ tự ưu tiên khi chọn tự động; tier sau là phương án dự phòng của tier trước
+TASK_POLICIES = {
+    TASK_CHAT: ('fast', 'balanced', 'smart'),
+    TASK_TOOLS: ('balanced', 'smart', 'fast'),
+    TASK_ANALYSIS: ('balanced', 'smart', 'fast'),
+}
+# Đầu vào dài (bài viết dài, prompt ReAct nhiều Observation) cần model mạnh hơn
+LONG_INPUT_POLICIES = {
+    TASK_CHAT: ('balanced', 'smart', 'fast'),
+    TASK_TOOLS: ('smart', 'balanced', 'fast'),
+    TASK_ANALYSIS: ('smart', 'balanced', 'fast'),
+}
+LONG_INPUT_CHARS = {TASK_CHAT: 2000, TASK_TOOLS: 12000, TASK_ANALYSIS: 1500}
+
+# Giây cho một lời gọi LLM; model có độ trễ trung bình vượt ngân sách bị xếp xuống cuối
+DEFAULT_LATENCY_BUDGETS = {TASK_CHAT: 3.0, TASK_TOOLS: 8.0, TASK_ANALYSIS: 15.0}
+
+EWMA_ALPHA = 0.3
+RATE_LIMIT_COOLDOWN_S = 30.0
+FAILURE_COOLDOWN_S = 15.0
+MAX_CONSECUTIVE_FAILURES = 3
+# Model bị xếp sau vì chậm sẽ được thử lại sau khoảng này để cập nhật độ trễ (có thể nó đã hết quá tải)
+SLOW_RETRY_S = 60.0
+
+class ModelHealth:
+    """Độ trễ trung bình (EWMA) và trạng thái lỗi gần đây của một model."""
+
+    def __init__(self):
+        self.latency_s = None
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.updated_at = 0.0
+
+    def to_dict(self):
+        return {
+            'latency_s': round(self.latency_s, 3) if self.latency_s is not None else None,
+            'calls': self.calls,
+            'failures': self.failures,
+            'cooling_down': self.cooldown_until > time.monotonic(),
+        }
+
+
+class ModelRouter:
+    """Chọn danh sách model (model chính + dự phòng) cho một yêu cầu và chạy lời gọi với cơ chế dự phòng."""
+
+    def __init__(self, tiers=None, latency_budgets=None, cost_budget=None, gateway=None):
+        self.tiers = {name: dict(config) for name, config in (tiers or DEFAULT_TIERS).items()}
+        missing = {tier for policy in TASK_POLICIES.values() for tier in policy} - set(self.tiers)
+        if missing:
+            raise ValueError(f"Thiếu cấu hình cho tier: {', '.join(sorted(missing))}.")
+        self.latency_budgets = dict(DEFAULT_LATENCY_BUDGETS, **(latency_budgets or {}))
+        self.cost_budget = cost_budget
+        self._gateway = gateway
+        self._health = {}
+        self._runnables = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """TUTOR_MODEL_TIERS: JSON {"fast": "gemini-2.0-flash-lite", ...} hoặc {"fast": {"model": ..., "cost": ...}};
+        TUTOR_MODEL_COST_BUDGET: giá tối đa (USD/1 triệu token) khi chọn tự động;
+        TUTOR_LATENCY_BUDGET_CHAT / _ANALYSIS / _TOOL_REASONING: ngân sách độ trễ (giây) mỗi lời gọi."""
+        tiers = {name: dict(config) for name, config in DEFAULT_TIERS.items()}
+        raw = os.getenv('TUTOR_MODEL_TIERS')
+        if raw:
+            try:
+                overrides = json.loads(raw)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"TUTOR_MODEL_TIERS không phải JSON hợp lệ: {e}") from e
+            for name, config in overrides.items():
+                config = {'model': config} if isinstance(config, str) else config
+                tiers[name] = dict(tiers.get(name, {'cost': 0.0}), **config)
+        budgets = {
+            task: float(os.environ[f"TUTOR_LATENCY_BUDGET_{task.upper()}"])
+            for task in TASKS if os.getenv(f"TUTOR_LATENCY_BUDGET_{task.upper()}")
+        }
+        cost_budget = os.getenv('TUTOR_MODEL_COST_BUDGET')
+        return cls(tiers, budgets, float(cost_budget) if cost_budget else None)
+
+    @property
+    def gateway(self):
+        return self._gateway or get_llm_gateway()
+
+    def model_for(self, tier):
+        return self.tiers[tier]['model']
+
+    def _health_of(self, model):
+        health = self._health.get(model)
+        if health is None:
+            health = self._health[model] = ModelHealth()
+        return health
+
+    def candidates(self, task, input_chars=0, preferred=TIER_AUTO):
+        """Các model theo thứ tự thử. Tier người dùng chọn (preferred) luôn được thử trước; khi chọn tự động,
+        tier vượt ngân sách chi phí bị bỏ qua, model chậm hơn ngân sách độ trễ bị xếp sau, model đang bị
+        giới hạn tần suất/lỗi liên tiếp chỉ còn là phương án cuối cùng."""
+        long_input = input_chars > LONG_INPUT_CHARS[task]
+        order = list((LONG_INPUT_POLICIES if long_input else TASK_POLICIES)[task])
+        if preferred != TIER_AUTO:
+            order = [preferred] + [tier for tier in order if tier != preferred]
+        elif self.cost_budget is not None:
+            affordable = [tier for tier in order if self.tiers[tier].get('cost', 0.0) <= self.cost_budget]
+            order = affordable or [min(order, key=lambda tier: self.tiers[tier].get('cost', 0.0))]
+
+        budget = self.latency_budgets[task]
+        now = time.monotonic()
+        ready, slow, cooling = [], [], []
+        with self._lock:
+            for tier in order:
+                model = self.model_for(tier)
+                if model in ready or model in slow or model in cooling:
+                    continue
+                health = self._health_of(model)
+                if health.cooldown_until > now:
+                    cooling.append(model)
+                elif (health.latency_s is not None and health.latency_s > budget and tier != preferred
+                      and now - health.updated_at < SLOW_RETRY_S):
+                    slow.append(model)
+                else:
+                    ready.append(model)
+        return ready + slow + cooling
+
+    def record_success(self, model, duration_s):
+        with self._lock:
+            health = self._health_of(model)
+            health.calls += 1
+            health.consecutive_failures = 0
+            health.updated_at = time.monotonic()
+            health.latency_s = duration_s if health.latency_s is None else (
+                EWMA_ALPHA * duration_s + (1 - EWMA_ALPHA) * health.latency_s
+            )
+
+    def record_failure(self, model, error):
+        kind = classify_error(error) or 'error'
+        with self._lock:
+            health = self._health_of(model)
+            health.calls += 1
+            health.failures += 1
+            health.consecutive_failures += 1
+            if kind == 'rate_limit':
+                health.cooldown_until = time.monotonic() + RATE_LIMIT_COOLDOWN_S
+            elif health.consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+                health.cooldown_until = time.monotonic() + FAILURE_COOLDOWN_S
+        get_metrics().inc('tutor_model_failures_total', model=model, reason=kind)
+
+    def record_route(self, task, model, fallback):
+        metrics = get_metrics()
+        metrics.inc('tutor_model_requests_total', task=task, model=model)
+        if fallback:
+            metrics.inc('tutor_model_fallbacks_total', task=task, model=model)
+
+    def call(self, task, input_chars, func, preferred=TIER_AUTO, key=None):
+        """Gọi func(model_name) với model tốt nhất; lỗi tạm thời/giới hạn tần suất thì thử model kế tiếp.
+        `key` (mô tả đầy đủ yêu cầu) cho phép gateway gộp các yêu cầu giống hệt nhau đang chạy."""
+        error = None
+        models = self.candidates(task, input_chars, preferred)
+        for attempt, model in enumerate(models):
+            start = time.perf_counter()
+            try:
+                result = self.gateway.call(model, lambda: func(model), key=key,
+                                           retries=None if attempt == len(models) - 1 else 0)
+            except Exception as e:
+                self.record_failure(model, e)
+                if classify_error(e) is None:
+                    raise
+                error = e
+                continue
+            self.record_success(model, time.perf_counter() - start)
+            self.record_route(task, model, attempt > 0)
+            return result
+        raise error
+
+    async def acall(self, task, input_chars, func, preferred=TIER_AUTO, key=None):
+        """Giống call, với func(model_name) là coroutine function."""
+        error = None
+        models = self.candidates(task, input_chars, preferred)
+        for attempt, model in enumerate(models):
+            start = time.perf_counter()
+            try:
+                result = await self.gateway.acall(model, lambda: func(model), key=key,
+                                                  retries=None if attempt == len(models) - 1 else 0)
+            except Exception as e:
+                self.record_failure(model, e)
+                if classify_error(e) is None:
+                    raise
+                error = e
+                continue
+            self.record_success(model, time.perf_counter() - start)
+            self.record_route(task, model, attempt > 0)
+            return result
+        raise error
+
+    def stream(self, task, input_chars, func, preferred=TIER_AUTO):
+        """Giống call cho func(model_name) trả về iterator; chỉ chuyển model nếu lỗi xảy ra trước phần đầu tiên."""
+        error = None
+        models = self.candidates(task, input_chars, preferred)
+        for attempt, model in enumerate(models):
+            start = time.perf_counter()
+            started = False
+            try:
+                for chunk in self.gateway.stream(model, lambda: func(model),
+                                                 retries=None if attempt == len(models) - 1 else 0):
+                    started = True
+                    yield chunk
+            except Exception as e:
+                self.record_failure(model, e)
+                if started or classify_error(e) is None:
+                    raise
+                error = e
+                continue
+            self.record_success(model, time.perf_counter() - start)
+            self.record_route(task, model, attempt > 0)
+            return
+        raise error
+
+    def chat_model(self, task, input_chars=0, preferred=TIER_AUTO, temperature=0.3, stop=None):
+        """Runnable LangChain: model chính kèm các model dự phòng (with_fallbacks), mỗi model gọi qua LLMGateway;
+        độ trễ/lỗi của model thật sự được gọi được ghi vào router. Được cache theo danh sách model nên chọn lại ở mỗi lời gọi chỉ tốn một lần
+        tra dict."""
+        models = tuple(self.candidates(task, input_chars, preferred))
+        key = (task, models, temperature, tuple(stop or ()))
+        runnable = self._runnables.get(key)
+        if runnable is None:
+            gateway = self.gateway
+            llms = [
+                gateway.chat_model(get_chat_llm(model, temperature), model,
+                                   retries=None if index == len(models) - 1 else 0)
+                for index, model in enumerate(models)
+            ]
+            if stop:
+                llms = [llm.bind(stop=list(stop)) for llm in llms]
+            runnable = llms[0].with_fallbacks(llms[1:]) if len(llms) > 1 else llms[0]
+            # Callback gắn ở ngoài with_fallbacks: callback gắn trên từng model con bị mất callback của lượt
+            # chạy (TurnRecorder, streaming) khi with_fallbacks chạy ở chế độ stream
+            runnable = runnable.with_config(callbacks=[ModelHealthRecorder(self, task, models[0])])
+            self._runnables[key] = runnable
+        return runnable
+
+    def stats(self):
+        with self._lock:
+            return {model: health.to_dict() for model, health in self._health.items()}
+
+
+def model_name_of(callback_kwargs, default=None):
+    """Tên model của một lời gọi LLM từ metadata của callback (ChatGoogleGenerativeAI thêm tiền tố "models/")."""
+    name = (callback_kwargs.get('metadata') or {}).get('ls_model_name')
+    return name.removeprefix('models/') if name else default
+
+
+class ModelHealthRecorder(BaseCallbackHandler):
+    """Callback ghi độ trễ/lỗi của model được gọi (model chính hoặc dự phòng) vào ModelRouter."""
+
+    def __init__(self, router, task, primary_model):
+        self.router = router
+        self.task = task
+        self.primary_model = primary_model
+        self._started = {}
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._started[kwargs.get('run_id')] = (time.perf_counter(), model_name_of(kwargs, self.primary_model))
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._started[kwargs.get('run_id')] = (time.perf_counter(), model_name_of(kwargs, self.primary_model))
+
+    def on_llm_end(self, response, **kwargs):
+        started = self._started.pop(kwargs.get('run_id'), None)
+        if started is not None:
+            start, model = started
+            self.router.record_success(model, time.perf_counter() - start)
+            self.router.record_route(self.task, model, model != self.primary_model)
+
+    def on_llm_error(self, error, **kwargs):
+        started = self._started.pop(kwargs.get('run_id'), None)
+        if started is not None:
+            self.router.record_failure(started[1], error)
@@ -0,0 +1,146 @@
+"""Tìm kiếm lai cho RAGTool: BM25 trên inverted index từ khóa kết hợp với FAISS bằng
+reciprocal rank fusion (RRF).
+
+Câu hỏi ngữ pháp thường xoay quanh đúng một cụm từ ("past perfect continuous", "had been")
+mà embedding MiniLM dễ bỏ sót; BM25 bắt được các cụm đó, còn FAISS bắt được câu diễn đạt khác.
+"""
+import math
+import os
+from array import array
+import pickle
+import re
+import tempfile
+from collections import Counter
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+# Đổi tên file khi đổi cách lưu postings để không unpickle nhầm index định dạng cũ
+KEYWORD_INDEX_NAME = 'keyword_index.v2.pkl'
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+(?:'[^\W_]+)?")
+
+
+def tokenize(text):
+    """Từ đơn và cặp từ liền nhau (bigram) để cụm như 'present perfect' được ưu tiên khi khớp nguyên cụm."""
+    words = TOKEN_PATTERN.findall(text.lower().replace('’', "'").replace('‘', "'"))
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+class BM25Index:
+    """Inverted index từ khóa -> (mảng vị trí chunk, mảng tần suất), chấm điểm theo BM25.
+    Vị trí chunk trùng với vị trí vector trong FAISS (index_to_docstore_id).
+
+    Postings là array số nguyên thay vì list tuple: nhỏ hơn nhiều lần, và các worker của server (agent/server.py)
+    đọc được index nạp trước khi fork mà không phải sao chép trang nhớ chỉ vì cập nhật refcount của từng tuple."""
+
+    def __init__(self, doc_ids, texts, k1=BM25_K1, b=BM25_B):
+        self.doc_ids = list(doc_ids)
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.doc_lengths = array('I')
+        for position, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, freq in counts.items():
+                positions, freqs = self.postings.setdefault(term, (array('I'), array('I')))
+                positions.append(position)
+                freqs.append(freq)
+        self.avg_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore):
+        doc_ids = [vectorstore.index_to_docstore_id[i] for i in range(len(vectorstore.index_to_docstore_id))]
+        return cls(doc_ids, [vectorstore.docstore.search(doc_id).page_content for doc_id in doc_ids])
+
+    def search(self, query, k):
+        """[(vị trí chunk, điểm), ...] của k chunk điểm cao nhất."""
+        num_docs = len(self.doc_ids)
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            positions, freqs = postings
+            idf = math.log(1 + (num_docs - len(positions) + 0.5) / (len(positions) + 0.5))
+            for position, freq in zip(positions, freqs):
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[position] / self.avg_length)
+                scores[position] = scores.get(position, 0.0) + idf * freq * (self.k1 + 1) / (freq + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def load_or_build_keyword_index(vectorstore, index_path=None):
+    """Nạp inverted index đã lưu cạnh FAISS index (keyword_index.pkl) hoặc build từ docstore.
+    Ingestion ghi lại cả thư mục index khi tài liệu đổi nên file cũ không bao giờ bị dùng nhầm."""
+    path = os.path.join(index_path, KEYWORD_INDEX_NAME) if index_path else None
+    if path and os.path.exists(path):
+        # File do chính ứng dụng ghi ra nên có thể tin cậy khi unpickle
+        with open(path, 'rb') as f:
+            keyword_index = pickle.load(f)
+        if len(keyword_index) == len(vectorstore.index_to_docstore_id):
+            return keyword_index
+
+    keyword_index = BM25Index.from_vectorstore(vectorstore)
+    if path:
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix='.keyword-', dir=index_path)
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(keyword_index, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return keyword_index
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Gộp nhiều danh sách xếp hạng: điểm = tổng 1 / (k + thứ hạng). Không cần chuẩn hóa điểm gốc."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever:
+    """Lấy `candidates` kết quả từ mỗi nguồn (FAISS và BM25) rồi gộp bằng RRF, trả về k chunk."""
+
+    def __init__(self, vectorstore, keyword_index=None, candidates=20, rrf_k=RRF_K):
+        self.vectorstore = vectorstore
+        self.keyword_index = keyword_index if keyword_index is not None else BM25Index.from_vectorstore(vectorstore)
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+
+    def _vector_rankings(self, queries):
+        """Embed tất cả truy vấn trong một lần gọi và tìm trong FAISS bằng một lần search theo lô."""
+        import faiss
+        import numpy as np
+
+        # _embed_documents của LangChain xử lý cả Embeddings lẫn hàm embed thuần
+        vectors = np.asarray(self.vectorstore._embed_documents(list(queries)), dtype='float32')
+        if getattr(self.vectorstore, '_normalize_L2', False):
+            faiss.normalize_L2(vectors)
+        _, positions = self.vectorstore.index.search(vectors, self.candidates)
+        return [[int(p) for p in row if p != -1] for row in positions]
+
+    def search_many(self, queries, k=3):
+        """Danh sách Document cho từng truy vấn, theo đúng thứ tự queries."""
+        if not queries:
+            return []
+        results = []
+        for query, vector_ranking in zip(queries, self._vector_rankings(queries)):
+            keyword_ranking = [position for position, _ in self.keyword_index.search(query, self.candidates)]
+            fused = reciprocal_rank_fusion([vector_ranking, keyword_ranking], self.rrf_k)[:k]
+            results.append([
+                self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[position])
+                for position in fused
+            ])
+        return results
+
+    def search(self, query, k=3):
+        return self.search_many([query], k)[0]
@@ -0,0 +1,160 @@
+"""Phân loại nhanh tin nhắn để trả lời các yêu cầu đơn giản mà không cần vòng lặp ReAct."""
+import re
+import threading
+
+ROUTE_AGENT = 'agent'
+ROUTE_TIME = 'time'
+ROUTE_CALENDAR = 'calendar'
+ROUTE_SMALL_TALK = 'small_talk'
+ROUTE_STUDY_PLAN = 'study_plan'
+# Không phải route của router: câu trả lời lấy từ semantic cache (dùng cho thống kê/đo đạc)
+ROUTE_SEMANTIC_CACHE = 'semantic_cache'
+# Không phải route của router: câu trả lời lấy nguyên từ gói bài học soạn sẵn, hoặc một lời gọi LLM
+# dùng bài soạn sẵn làm căn cứ (agent/lesson_pack.py)
+ROUTE_LESSON_PACK = 'lesson_pack'
+ROUTE_LESSON_GROUNDED = 'lesson_grounded'
+
+# Số lời gọi LLM tối thiểu nếu cùng yêu cầu đi qua AgentExecutor:
+# dùng tool thì cần 1 lượt Thought/Action + 1 lượt Final Answer sau Observation.
+REACT_BASELINE_LLM_CALLS = {
+    ROUTE_TIME: 2,
+    ROUTE_CALENDAR: 2,
+    # Agent gọi Study Plan Schedule một lần cho cả lịch; trước đó là một lượt Action cho mỗi buổi học
+    ROUTE_STUDY_PLAN: 2,
+    ROUTE_SMALL_TALK: 1,
+    # Agent tra English Material Search rồi mới soạn câu trả lời
+    ROUTE_LESSON_PACK: 2,
+    ROUTE_LESSON_GROUNDED: 2,
+}
+
+TIME_PATTERNS = [
+    r"\bwhat time is it\b",
+    r"\bwhat(?:'s| is) the (?:time|date)\b",
+    r"\bwhat(?:'s| is)? (?:the )?(?:date|day) (?:is it )?today\b",
+    r"\bwhat day is (?:it|today)\b",
+    r"\btoday'?s date\b",
+    r"\bcurrent (?:time|date)\b",
+    r"\bmấy giờ\b",
+    r"\bhôm nay (?:là )?(?:ngày|thứ) (?:mấy|bao nhiêu|gì)\b",
+    r"\bngày bao nhiêu\b",
+    r"\bbây giờ là\b",
+]
+
+# Động từ/cụm đặt lịch. Chỉ đi đường tắt khi tin nhắn còn có mốc thời gian (WHEN_PATTERNS) hoặc lịch lặp lại
+# (RECURRING_PATTERNS): "plan my study of the present perfect", "the word calendar", "remind me of" là câu hỏi
+# tiếng Anh, trích xuất sự kiện cho chúng chỉ tốn thêm một lời gọi LLM trước khi quay về agent
+CALENDAR_PATTERNS = [
+    r"\b(?:schedule|book|plan|set up|arrange)(?![\w-]).*\b(?:lesson|class|session|study|meeting|event|exam|test)\b",
+    r"\badd (?:an? )?(?:event|lesson|reminder)\b",
+    r"\b(?:add|put) .+ (?:to|in|on|into) (?:my )?(?:google )?calendar\b",
+    r"\bremind me (?:to|about)\b",
+    r"\bđặt lịch\b",
+    r"\blên lịch\b",
+    r"\bnhắc (?:tôi|mình)\b",
+    r"\bthêm (?:sự kiện|lịch)\b",
+]
+
+# Yêu cầu lập lịch học không nói rõ "lesson/class" nhưng có thời lượng mỗi buổi ("schedule 30 minutes ...")
+STUDY_PLAN_PATTERNS = [
+    r"\b(?:schedule|book|plan|set up)(?![\w-]).*\b\d+ ?(?:minutes?|mins?|hours?)\b",
+    r"\bstudy (?:plan|schedule|routine)\b",
+    r"\blịch học\b",
+    r"\bkế hoạch học\b",
+]
+
+_MONTHS = (r"(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?|"
+           r"oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)")
+# Mốc thời gian của một sự kiện: ngày, thứ, giờ
+WHEN_PATTERNS = [
+    r"\b(?:today|tonight|tomorrow)\b",
+    r"\b(?:mon|tues|wednes|thurs|fri|satur|sun)days?\b",
+    r"\b(?:next|this) (?:week|weekend|month|morning|afternoon|evening)\b",
+    r"\b\d{1,2}(?::\d{2})? ?(?:am|pm|a\.m\.|p\.m\.)",
+    r"\b(?:at|from|by) \d{1,2}(?::\d{2})?\b",
+    r"\b\d{1,2}:\d{2}\b",
+    r"\b\d{1,2}/\d{1,2}(?:/\d{2,4})?\b",
+    r"\b\d{4}-\d{2}-\d{2}\b",
+    rf"\b{_MONTHS} \d{{1,2}}(?:st|nd|rd|th)?\b",
+    rf"\b\d{{1,2}}(?:st|nd|rd|th)? (?:of )?{_MONTHS}\b",
+    r"\bin \d+ (?:minutes?|hours?|days?)\b",
+    r"\b(?:hôm nay|ngày mai|tối nay|sáng mai|chiều mai|tối mai|tuần sau|tuần tới|cuối tuần)\b",
+    r"\bthứ (?:hai|ba|tư|năm|sáu|bảy)\b",
+    r"\bchủ nhật\b",
+    r"\b\d{1,2} ?(?:giờ|h)(?:\d{2})?\b",
+    r"\bngày \d{1,2}\b",
+]
+
+# Lịch lặp lại (nhiều sự kiện) được trích xuất thành một kế hoạch và khai triển tại chỗ (agent/study_plan.py)
+RECURRING_PATTERNS = [
+    r"\bevery\b", r"\bdaily\b", r"\bweekly\b", r"\bweekdays\b", r"\beach (?:day|week)\b",
+    r"\bfor \d+ (?:days|weeks|months)\b",
+    r"\bmỗi\b", r"\bhằng ngày\b", r"\bhàng ngày\b", r"\bhàng tuần\b", r"\btrong \d+ (?:ngày|tuần|tháng)\b",
+]
+
+SMALL_TALK_PATTERN = re.compile(
+    r"^(?:hi|hello|hey|yo|good (?:morning|afternoon|evening|night)|how are you(?: doing)?(?: today)?|"
+    r"nice to meet you|thanks?(?: you)?(?: so much| a lot| very much)?|ok(?:ay)?|cool|great|bye|goodbye|"
+    r"see you(?: later| tomorrow)?|xin chào|chào(?: bạn| thầy| cô)?|cảm ơn(?: bạn| thầy| cô)?|"
+    r"tạm biệt|bạn khỏe không)"
+    r"(?:[\s,]+(?:there|teacher|tutor|bạn|thầy|cô|nhé|nha|ạ))*[\s!.?,:)]*$",
+    re.IGNORECASE,
+)
+
+
+def _matches(patterns, text):
+    return any(re.search(pattern, text) for pattern in patterns)
+
+
+def classify_message(message):
+    """Trả về route cho tin nhắn. Chỉ những câu chắc chắn đơn giản mới được đi đường tắt,
+    còn lại (kể cả câu hỏi ngữ pháp có chữ 'time') đều đi qua agent."""
+    text = re.sub(r'\s+', ' ', message.strip().lower())
+    if not text:
+        return ROUTE_AGENT
+    if SMALL_TALK_PATTERN.match(text):
+        return ROUTE_SMALL_TALK
+    if len(text.split()) <= 12 and _matches(TIME_PATTERNS, text):
+        return ROUTE_TIME
+    if _matches(CALENDAR_PATTERNS, text) or _matches(STUDY_PLAN_PATTERNS, text):
+        if _matches(RECURRING_PATTERNS, text):
+            return ROUTE_STUDY_PLAN
+        if _matches(WHEN_PATTERNS, text):
+            return ROUTE_CALENDAR
+    return ROUTE_AGENT
+
+
+class RouterStats:
+    """Đếm số yêu cầu và số lời gọi LLM theo từng route, ước lượng số lời gọi đã tiết kiệm
+    so với việc cho mọi yêu cầu đi qua AgentExecutor. Lần đi nhầm đường tắt (trích xuất thất bại rồi vẫn phải chạy
+    agent) được đếm riêng và lời gọi LLM của nó bị trừ khỏi số đã tiết kiệm."""
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, llm_calls, answered=True):
+        with self._lock:
+            counters = self._routes.setdefault(
+                route, {'requests': 0, 'llm_calls': 0, 'fallbacks': 0, 'fallback_llm_calls': 0},
+            )
+            if answered:
+                counters['requests'] += 1
+                counters['llm_calls'] += llm_calls
+            else:
+                counters['fallbacks'] += 1
+                counters['fallback_llm_calls'] += llm_calls
+
+    def stats(self):
+        with self._lock:
+            routes = {route: dict(counters) for route, counters in self._routes.items()}
+        total_saved = 0
+        for route, counters in routes.items():
+            counters['llm_calls_per_request'] = (
+                counters['llm_calls'] / counters['requests'] if counters['requests'] else 0.0
+            )
+            baseline = REACT_BASELINE_LLM_CALLS.get(route)
+            if baseline is not None:
+                counters['llm_calls_saved'] = (baseline * counters['requests'] - counters['llm_calls']
+                                               - counters['fallback_llm_calls'])
+                total_saved += counters['llm_calls_saved']
+        return {'routes': routes, 'llm_calls_saved': total_saved}
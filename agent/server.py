@@ -0,0 +1,348 @@
+"""Server HTTP không giao diện cho English AI Tutor: trò chuyện, phân tích bài viết và tra cứu tài liệu qua JSON.
+
+    python run_app.py serve --port 8000 --workers 4
+    curl -s localhost:8000/chat -d '{"message": "When do I use the present perfect?", "level": "beginner"}'
+
+Mô hình pre-fork: process cha nạp sẵn các tài nguyên chỉ-đọc tốn bộ nhớ (model embedding, FAISS index đọc bằng
+mmap, chỉ mục BM25), mở socket rồi fork N worker cùng nhận kết nối trên socket đó. Trang bộ nhớ của model và
+docstore được chia sẻ copy-on-write, vector của index nằm trong page cache dùng chung. Kết nối SQLite, client LLM,
+cache... được mỗi worker tạo lại sau fork. Lịch sử trò chuyện nằm ngoài worker (ConversationStore SQLite,
+TUTOR_CONVERSATION_DB) nên request kế tiếp của một phiên rơi vào worker nào cũng tiếp tục được hội thoại.
+
+Endpoints:
+    GET  /health                                                  -> {"status", "pid"}
+    POST /chat      {"message", "session_id"?, "user_id"?, "level"?} -> {"session_id", "answer", "route",
+                                                                      "study_plan"?: {"file_name", "ics"}}
+    POST /analyze   {"text", "level"?}                            -> {"analysis"}
+    POST /retrieve  {"query", "k"?}                               -> {"results": [{"content", "source"}]}
+"""
+import collections
+import contextlib
+import gc
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.helper import (
+    configure_genai,
+    get_embedding_model,
+    get_hybrid_retriever,
+    get_rag_index_key,
+    get_vectorstore,
+    registry,
+)
+
+DEFAULT_CONVERSATION_DB = os.path.join(os.path.dirname(__file__), '..', 'data', 'conversations.sqlite3')
+# Tài nguyên nạp ở process cha và giữ lại trong worker sau fork (chỉ đọc, không giữ kết nối hay thread)
+SHARED_RESOURCES = ('genai_config', 'embedding_model', 'ann_index_config', 'vectorstore', 'hybrid_retriever',
+                    'rag_index_key')
+# Số phiên (EnglishTutorAgent) mỗi worker giữ trong bộ nhớ; phiên bị đẩy ra được nạp lại từ ConversationStore
+MAX_SESSIONS = int(os.getenv('TUTOR_SERVER_MAX_SESSIONS', '256'))
+MAX_BODY_BYTES = 1_000_000
+MAX_RETRIEVE_K = 20
+# Worker chết sớm hơn ngưỡng này sau khi khởi động thì chờ một chút trước khi fork lại, tránh vòng fork liên tục
+MIN_WORKER_UPTIME_S = 1.0
+
+
+class RequestError(ValueError):
+    """Request không hợp lệ; message (tiếng Việt) được trả về cho client cùng mã HTTP `status`."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def preload_shared_resources():
+    """Nạp các tài nguyên dùng chung trước khi fork worker. FAISS index được đọc bằng mmap (TUTOR_RAG_MMAP=1)
+    để các worker dùng chung page cache thay vì mỗi worker một bản; raise ValueError nếu thiếu GOOGLE_API_KEY."""
+    # Import LangChain/agent một lần ở process cha để mã đã nạp được dùng chung thay vì mỗi worker import lại
+    import agent.tutor_agent  # noqa: F401
+
+    os.environ.setdefault('TUTOR_RAG_MMAP', '1')
+    configure_genai()
+    get_embedding_model()
+    get_vectorstore()
+    get_hybrid_retriever()
+    get_rag_index_key()
+
+
+def limit_native_threads():
+    """Mỗi worker tính toán bằng một thread: N worker đã dùng hết N core, và thread pool OpenMP của torch/FAISS
+    kế thừa từ process cha không an toàn sau fork."""
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(1)
+    if 'faiss' in sys.modules:
+        sys.modules['faiss'].omp_set_num_threads(1)
+
+
+class SessionPool:
+    """Các EnglishTutorAgent đang hoạt động của một worker, theo (user_id, session_id), đẩy ra theo LRU.
+    Mỗi phiên chỉ chạy một lượt tại một thời điểm (lock riêng từng phiên) vì memory của phiên không thread-safe."""
+
+    def __init__(self, max_sessions=MAX_SESSIONS, factory=None):
+        self.max_sessions = max_sessions
+        self.factory = factory or self._new_agent
+        self._sessions = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _new_agent(user_id, session_id):
+        from agent.tutor_agent import EnglishTutorAgent
+
+        return EnglishTutorAgent(user_id=user_id, session_id=session_id)
+
+    @contextlib.contextmanager
+    def checkout(self, user_id, session_id):
+        key = (user_id, session_id)
+        with self._lock:
+            entry = self._sessions.pop(key, None) or {'agent': None, 'lock': threading.Lock()}
+            self._sessions[key] = entry
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        with entry['lock']:
+            if entry['agent'] is None:
+                entry['agent'] = self.factory(user_id, session_id)
+            yield entry['agent']
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class TutorService:
+    """Xử lý các endpoint của server trên payload JSON đã giải mã; dùng chung cho mọi thread của một worker."""
+
+    def __init__(self, sessions=None):
+        self.sessions = sessions or SessionPool()
+        self._analyzers = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _text_field(payload, name, required=True):
+        value = payload.get(name)
+        if value is None and not required:
+            return None
+        if not isinstance(value, str) or not value.strip():
+            raise RequestError(f"Thiếu trường '{name}' (chuỗi khác rỗng).")
+        return value
+
+    @staticmethod
+    def _level_field(payload):
+        from agent.tutor_agent import USER_LEVELS
+
+        level = payload.get('level')
+        if level is not None and level not in USER_LEVELS:
+            raise RequestError(f"Trình độ không hợp lệ. Chọn: {', '.join(USER_LEVELS)}.")
+        return level
+
+    def _analyzer(self, level):
+        """Agent không trạng thái dùng để phân tích bài viết, một agent cho mỗi trình độ."""
+        from agent.tutor_agent import EnglishTutorAgent
+
+        level = level or 'beginner'
+        with self._lock:
+            if level not in self._analyzers:
+                analyzer = EnglishTutorAgent()
+                analyzer.update_user_level(level)
+                self._analyzers[level] = analyzer
+            return self._analyzers[level]
+
+    def health(self, payload=None):
+        return {'status': 'ok', 'pid': os.getpid(), 'sessions': len(self.sessions)}
+
+    def chat(self, payload):
+        message = self._text_field(payload, 'message')
+        level = self._level_field(payload)
+        user_id = self._text_field(payload, 'user_id', required=False) or 'anonymous'
+        session_id = self._text_field(payload, 'session_id', required=False) or uuid.uuid4().hex
+        with self.sessions.checkout(user_id, session_id) as tutor:
+            if level:
+                tutor.update_user_level(level)
+            answer = tutor.run_agent_chat(message)
+            result = {'session_id': session_id, 'answer': answer, 'route': (tutor.last_turn or {}).get('route')}
+            if tutor.last_study_plan is not None:
+                # File .ics nằm trên máy chủ nên nội dung được gửi kèm cho client
+                result['study_plan'] = {'file_name': tutor.last_study_plan.file_name,
+                                        'ics': tutor.last_study_plan.to_ics()}
+        return result
+
+    def analyze(self, payload):
+        text = self._text_field(payload, 'text')
+        return {'analysis': self._analyzer(self._level_field(payload)).analyze_text(text)}
+
+    def retrieve(self, payload):
+        query = self._text_field(payload, 'query')
+        k = payload.get('k', 3)
+        if not isinstance(k, int) or isinstance(k, bool) or not 1 <= k <= MAX_RETRIEVE_K:
+            raise RequestError(f"'k' phải là số nguyên từ 1 đến {MAX_RETRIEVE_K}.")
+        retriever = get_hybrid_retriever()
+        docs = retriever.search(query, k) if retriever is not None else get_vectorstore().similarity_search(query, k=k)
+        return {'results': [{'content': doc.page_content, 'source': doc.metadata.get('source')} for doc in docs]}
+
+
+ROUTES = {
+    ('GET', '/health'): 'health',
+    ('POST', '/chat'): 'chat',
+    ('POST', '/analyze'): 'analyze',
+    ('POST', '/retrieve'): 'retrieve',
+}
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Đóng kết nối keep-alive bỏ không quá lâu để không giữ thread của worker
+        timeout = 60
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body):
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _read_payload(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            if length > MAX_BODY_BYTES:
+                raise RequestError("Request quá lớn.", status=413)
+            if not length:
+                return {}
+            try:
+                payload = json.loads(self.rfile.read(length))
+            except ValueError:
+                raise RequestError("Body phải là JSON hợp lệ.")
+            if not isinstance(payload, dict):
+                raise RequestError("Body phải là một object JSON.")
+            return payload
+
+        def _dispatch(self, method):
+            path = self.path.split('?')[0]
+            endpoint = ROUTES.get((method, path))
+            try:
+                if endpoint is None:
+                    known = any(route_path == path for _, route_path in ROUTES)
+                    raise RequestError(f"Không hỗ trợ {method} {path}.", status=405 if known else 404)
+                payload = self._read_payload() if method == 'POST' else {}
+                self._send(200, getattr(service, endpoint)(payload))
+            except RequestError as e:
+                self._send(e.status, {'error': str(e)})
+            except Exception as e:
+                print(f"\n--- LỖI TRONG {method} {path}: ---\n{e}\n-----------------------------------\n")
+                self._send(500, {'error': "Lỗi máy chủ, vui lòng thử lại sau."})
+
+        def do_GET(self):
+            self._dispatch('GET')
+
+        def do_POST(self):
+            self._dispatch('POST')
+
+    return Handler
+
+
+def serve_socket(sock, service=None):
+    """Phục vụ trên socket đã listen (có thể đang được process khác dùng chung) cho tới khi process bị dừng."""
+    server = ThreadingHTTPServer(sock.getsockname()[:2], make_handler(service or TutorService()),
+                                 bind_and_activate=False)
+    server.socket.close()
+    server.socket = sock
+    server.daemon_threads = True
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def _run_worker(sock, index, shared, worker_init):
+    registry.retain(shared)
+    limit_native_threads()
+    # Process cha điều phối việc dừng; Ctrl+C gửi SIGINT cho cả nhóm process nên worker bỏ qua
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    metrics_port = os.getenv('TUTOR_METRICS_PORT')
+    if metrics_port:
+        # Mỗi worker có registry metrics riêng nên mở /metrics ở một port riêng
+        os.environ['TUTOR_METRICS_PORT'] = str(int(metrics_port) + index)
+    if worker_init is not None:
+        worker_init()
+    serve_socket(sock)
+
+
+def serve(host='127.0.0.1', port=8000, workers=None, shared=SHARED_RESOURCES, worker_init=None):
+    """Chạy server với `workers` process (mặc định bằng số core). workers=1 phục vụ ngay trong process hiện tại.
+
+    shared: tên các tài nguyên trong registry được giữ lại trong worker sau fork, ngoài ra mọi tài nguyên khác
+    được tạo lại; worker_init: hàm gọi trong mỗi worker trước khi nhận request (benchmark dùng để đăng ký LLM giả)."""
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and not hasattr(os, 'fork'):
+        raise ValueError("Chạy nhiều worker cần os.fork (Linux/macOS); dùng --workers 1 trên hệ điều hành này.")
+    os.environ.setdefault('TUTOR_CONVERSATION_DB', DEFAULT_CONVERSATION_DB)
+    preload_shared_resources()
+
+    sock = socket.create_server((host, port), backlog=128)
+    # Các worker cùng chờ trên một socket: worker không nhận được kết nối thì quay lại vòng chờ thay vì bị chặn
+    sock.setblocking(False)
+    print(f"English AI Tutor đang phục vụ tại http://{host}:{sock.getsockname()[1]} với {workers} worker",
+          file=sys.stderr, flush=True)
+    if workers == 1:
+        if worker_init is not None:
+            worker_init()
+        try:
+            serve_socket(sock)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    children = {}
+    stopping = []
+
+    def _spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(sock, index, shared, worker_init)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = (index, time.monotonic())
+
+    def _stop(signum, frame):
+        stopping.append(signum)
+        for pid in list(children):
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    # Đưa các object đã nạp ra khỏi tầm quét của GC: GC ghi vào header của mọi object nó duyệt, làm worker
+    # phải sao chép (copy-on-write) gần như toàn bộ docstore/chỉ mục BM25 dù chỉ đọc
+    gc.freeze()
+    for index in range(workers):
+        _spawn(index)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index, started = children.pop(pid, (None, None))
+        if index is None or stopping:
+            continue
+        print(f"Worker {pid} đã dừng (mã {os.waitstatus_to_exitcode(status)}), khởi động lại.",
+              file=sys.stderr, flush=True)
+        if time.monotonic() - started < MIN_WORKER_UPTIME_S:
+            time.sleep(MIN_WORKER_UPTIME_S)
+        _spawn(index)
+    sock.close()
@@ -0,0 +1,242 @@
+"""Lịch học nhiều buổi từ một kế hoạch có cấu trúc: quy tắc lặp kiểu RRULE (RFC 5545) được khai triển ngay tại
+chỗ thành mọi buổi học theo giờ Asia/Ho_Chi_Minh, rồi xuất thành một file ICS và một liên kết Google Calendar cho
+cả chuỗi buổi học.
+
+"Mỗi tối thứ 2-6 lúc 19:00 trong 8 tuần" là một kế hoạch (FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR;COUNT=40) thay vì 40
+lần agent gọi tool Calendar, mỗi lần một lời gọi LLM.
+"""
+import hashlib
+import itertools
+import os
+import re
+from datetime import datetime, timedelta
+from urllib.parse import quote_plus
+
+import pytz
+
+LOCAL_TIMEZONE = 'Asia/Ho_Chi_Minh'
+DATETIME_FORMATS = [
+    "%Y-%m-%d %H:%M",  # "2025-12-25 10:00"
+    "%d/%m/%Y %H:%M",  # "25/12/2025 10:00"
+    "%d-%m-%Y %H:%M",  # "25-12-2025 10:00"
+    "%Y-%m-%d %H:%M:%S",  # "2025-12-25 10:00:00"
+]
+GOOGLE_CALENDAR_URL = "https://calendar.google.com/calendar/render"
+# Giới hạn số buổi của một kế hoạch: quy tắc thiếu COUNT/UNTIL sẽ lặp vô hạn
+MAX_OCCURRENCES = int(os.getenv('TUTOR_STUDY_PLAN_MAX_EVENTS', '366'))
+STUDY_PLAN_DIR = os.getenv('TUTOR_STUDY_PLAN_DIR') or os.path.join(os.path.dirname(__file__), '..', 'data',
+                                                                    'study_plans')
+MAX_DURATION_MINUTES = 24 * 60
+# Lịch học theo giờ/phút không có nghĩa và dễ sinh hàng nghìn buổi
+SUPPORTED_FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+WEEKDAY_NAMES = ['Thứ Hai', 'Thứ Ba', 'Thứ Tư', 'Thứ Năm', 'Thứ Sáu', 'Thứ Bảy', 'Chủ Nhật']
+ICS_UTC_FORMAT = "%Y%m%dT%H%M%SZ"
+ICS_LOCAL_FORMAT = "%Y%m%dT%H%M%S"
+
+
+def parse_local_datetime(text):
+    """datetime (không kèm múi giờ, hiểu là giờ Việt Nam) từ các định dạng thường gặp; None nếu không đọc được."""
+    for fmt in DATETIME_FORMATS:
+        try:
+            return datetime.strptime(str(text).strip(), fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def to_utc(local_dt):
+    return pytz.timezone(LOCAL_TIMEZONE).localize(local_dt, is_dst=None).astimezone(pytz.utc)
+
+
+def google_calendar_link(title, start_local, end_local, description="", recurrence=None):
+    """Liên kết mở form "thêm sự kiện" của Google Calendar. Với `recurrence` (RRULE không có tiền tố), giờ được
+    ghi theo giờ địa phương kèm ctz để Google khai triển BYDAY theo ngày ở Việt Nam, không phải theo ngày UTC."""
+    if recurrence:
+        dates = f"{start_local.strftime(ICS_LOCAL_FORMAT)}/{end_local.strftime(ICS_LOCAL_FORMAT)}"
+    else:
+        dates = f"{to_utc(start_local).strftime(ICS_UTC_FORMAT)}/{to_utc(end_local).strftime(ICS_UTC_FORMAT)}"
+    params = {
+        "action": "TEMPLATE",
+        "text": title,
+        "dates": dates,
+        "details": description,
+        "sf": "true",
+        "output": "xml",
+    }
+    if recurrence:
+        params["recur"] = f"RRULE:{recurrence}"
+        params["ctz"] = LOCAL_TIMEZONE
+    query_string = "&".join([f"{key}={quote_plus(str(value))}" for key, value in params.items()])
+    return f"{GOOGLE_CALENDAR_URL}?{query_string}"
+
+
+def normalize_rrule(rrule):
+    """Chuẩn hóa quy tắc lặp về dạng dateutil đọc được với DTSTART giờ địa phương: bỏ tiền tố RRULE:, UNTIL theo
+    UTC (...Z) đổi sang giờ Việt Nam, UNTIL chỉ có ngày được hiểu là hết ngày đó."""
+    rule = re.sub(r"\s+", "", str(rrule or "")).upper()
+    rule = rule[len("RRULE:"):] if rule.startswith("RRULE:") else rule
+    parts = [part for part in rule.split(";") if part]
+    if not parts:
+        raise ValueError("Thiếu quy tắc lặp 'rrule' (ví dụ: FREQ=WEEKLY;BYDAY=MO,WE,FR;COUNT=24).")
+    normalized = []
+    for part in parts:
+        name, _, value = part.partition("=")
+        if name == "FREQ" and value not in SUPPORTED_FREQUENCIES:
+            raise ValueError(f"Chỉ hỗ trợ lịch lặp theo {', '.join(SUPPORTED_FREQUENCIES)}, không hỗ trợ FREQ={value}.")
+        if name == "UNTIL":
+            if re.fullmatch(r"\d{8}", value):
+                value += "T235959"
+            elif re.fullmatch(r"\d{8}T\d{6}Z", value):
+                until = pytz.utc.localize(datetime.strptime(value, ICS_UTC_FORMAT))
+                value = until.astimezone(pytz.timezone(LOCAL_TIMEZONE)).strftime(ICS_LOCAL_FORMAT)
+        normalized.append(f"{name}={value}")
+    if not any(part.startswith("FREQ=") for part in normalized):
+        raise ValueError("Quy tắc lặp thiếu FREQ (DAILY, WEEKLY, MONTHLY hoặc YEARLY).")
+    return ";".join(normalized)
+
+
+def escape_ics_text(text):
+    return (str(text).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def fold_ics_line(line, limit=75):
+    """Gấp dòng dài hơn 75 byte theo RFC 5545 (dòng tiếp theo bắt đầu bằng dấu cách), không cắt giữa ký tự UTF-8."""
+    if len(line.encode('utf-8')) <= limit:
+        return line
+    folded, current, size = [], "", 0
+    for char in line:
+        width = len(char.encode('utf-8'))
+        if size + width > limit:
+            folded.append(current)
+            # Dòng tiếp theo đã tốn một byte cho dấu cách ở đầu
+            current, size = char, width + 1
+        else:
+            current += char
+            size += width
+    folded.append(current)
+    return "\r\n ".join(folded)
+
+
+class StudyPlan:
+    """Một lịch học lặp lại: buổi đầu tiên `start` (giờ Việt Nam), quy tắc lặp `rrule` và thời lượng mỗi buổi.
+    Mọi buổi học được khai triển ngay khi tạo (raise ValueError với thông báo tiếng Việt nếu kế hoạch không hợp lệ)."""
+
+    def __init__(self, title, start, rrule, duration_minutes=60, description=""):
+        from dateutil.rrule import rrulestr
+
+        if not title or not str(title).strip():
+            raise ValueError("Thiếu tiêu đề 'title' của lịch học.")
+        try:
+            duration_minutes = int(duration_minutes)
+        except (TypeError, ValueError):
+            raise ValueError(f"'duration_minutes' phải là số phút, nhận được: {duration_minutes!r}.")
+        if not 0 < duration_minutes <= MAX_DURATION_MINUTES:
+            raise ValueError(f"Thời lượng mỗi buổi phải từ 1 đến {MAX_DURATION_MINUTES} phút.")
+
+        self.title = str(title).strip()
+        self.start = start
+        self.duration = timedelta(minutes=duration_minutes)
+        self.description = description or ""
+        self.rule = normalize_rrule(rrule)
+        try:
+            rule = rrulestr(self.rule, dtstart=start)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Quy tắc lặp không hợp lệ '{self.rule}': {e}")
+        # Khai triển một lượt; quá MAX_OCCURRENCES buổi coi như quy tắc thiếu điểm dừng
+        self.occurrences = list(itertools.islice(rule, MAX_OCCURRENCES + 1))
+        if len(self.occurrences) > MAX_OCCURRENCES:
+            raise ValueError(f"Lịch học có hơn {MAX_OCCURRENCES} buổi; hãy thêm COUNT (số buổi) hoặc UNTIL "
+                             "(ngày kết thúc) vào quy tắc lặp.")
+        if not self.occurrences:
+            raise ValueError("Quy tắc lặp không tạo ra buổi học nào sau thời điểm bắt đầu.")
+
+    @classmethod
+    def from_params(cls, params):
+        """Tạo từ JSON của tool: title, start_datetime_str, rrule, duration_minutes (mặc định 60), description."""
+        if not isinstance(params, dict):
+            raise ValueError("Đầu vào phải là một object JSON.")
+        start_datetime_str = params.get("start_datetime_str")
+        if not params.get("title") or not start_datetime_str:
+            raise ValueError("Đầu vào JSON thiếu 'title' hoặc 'start_datetime_str' bắt buộc.")
+        start = parse_local_datetime(start_datetime_str)
+        if start is None:
+            raise ValueError(f"Không thể hiểu định dạng thời gian bắt đầu: '{start_datetime_str}'. "
+                             "Vui lòng dùng định dạng 'YYYY-MM-DD HH:MM'.")
+        return cls(params["title"], start, params.get("rrule"), params.get("duration_minutes") or 60,
+                   params.get("description", ""))
+
+    @property
+    def plan_id(self):
+        """Định danh ổn định: nhập lại cùng một kế hoạch thì lịch cập nhật các buổi cũ thay vì tạo bản trùng."""
+        key = "|".join([self.title, self.start.isoformat(), self.rule, str(self.duration)])
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+    @property
+    def recurrence(self):
+        """RRULE tương đương đúng với các buổi đã khai triển: điểm dừng được ghi bằng COUNT thay vì UNTIL."""
+        parts = [part for part in self.rule.split(";") if not part.startswith(("COUNT=", "UNTIL="))]
+        return ";".join(parts + [f"COUNT={len(self.occurrences)}"])
+
+    def google_link(self):
+        first = self.occurrences[0]
+        return google_calendar_link(self.title, first, first + self.duration, self.description, self.recurrence)
+
+    def to_ics(self, now=None):
+        """Nội dung file .ics: mỗi buổi học là một VEVENT theo giờ UTC (mọi ứng dụng lịch đọc được mà không cần
+        VTIMEZONE), UID cố định theo kế hoạch và số thứ tự buổi."""
+        stamp = (now or datetime.now(pytz.utc)).astimezone(pytz.utc).strftime(ICS_UTC_FORMAT)
+        lines = [
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            "PRODID:-//English AI Tutor//Study Plan//VI",
+            "CALSCALE:GREGORIAN",
+            "METHOD:PUBLISH",
+            f"X-WR-CALNAME:{escape_ics_text(self.title)}",
+            f"X-WR-TIMEZONE:{LOCAL_TIMEZONE}",
+        ]
+        for index, occurrence in enumerate(self.occurrences, 1):
+            lines += [
+                "BEGIN:VEVENT",
+                f"UID:{self.plan_id}-{index}@english-ai-tutor",
+                f"DTSTAMP:{stamp}",
+                f"DTSTART:{to_utc(occurrence).strftime(ICS_UTC_FORMAT)}",
+                f"DTEND:{to_utc(occurrence + self.duration).strftime(ICS_UTC_FORMAT)}",
+                f"SUMMARY:{escape_ics_text(self.title)}",
+            ]
+            if self.description:
+                lines.append(f"DESCRIPTION:{escape_ics_text(self.description)}")
+            lines.append("END:VEVENT")
+        lines.append("END:VCALENDAR")
+        return "\r\n".join(fold_ics_line(line) for line in lines) + "\r\n"
+
+    @property
+    def file_name(self):
+        slug = re.sub(r"[^a-z0-9]+", "-", self.title.lower()).strip("-")[:40] or "study-plan"
+        return f"{slug}-{self.plan_id[:8]}.ics"
+
+    def save_ics(self, directory=None):
+        """Ghi file .ics vào `directory` (mặc định TUTOR_STUDY_PLAN_DIR hoặc data/study_plans); trả về đường dẫn."""
+        directory = directory or STUDY_PLAN_DIR
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.file_name)
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write(self.to_ics())
+        return path
+
+    def summary(self, ics_path=None, max_listed=5):
+        """Câu trả lời cho học viên: số buổi, khoảng thời gian, vài buổi đầu, file ICS và liên kết Google Calendar."""
+        first, last = self.occurrences[0], self.occurrences[-1]
+        minutes = int(self.duration.total_seconds() // 60)
+        listed = ", ".join(f"{WEEKDAY_NAMES[occurrence.weekday()]} {occurrence:%d/%m %H:%M}"
+                           for occurrence in self.occurrences[:max_listed])
+        more = f" và {len(self.occurrences) - max_listed} buổi nữa" if len(self.occurrences) > max_listed else ""
+        lines = [
+            f"Đã tạo lịch học '{self.title}': {len(self.occurrences)} buổi, mỗi buổi {minutes} phút, "
+            f"từ {first:%d/%m/%Y %H:%M} đến {last:%d/%m/%Y %H:%M} (giờ Việt Nam).",
+            f"Các buổi: {listed}{more}.",
+        ]
+        if ics_path:
+            lines.append(f"File lịch .ics (nhập được vào Google Calendar, Outlook, Apple Calendar): {ics_path}")
+        lines.append(f"Hoặc thêm cả chuỗi buổi học vào Google Calendar bằng một liên kết: {self.google_link()}")
+        return "\n".join(lines)
@@ -1,79 +1,183 @@
+import asyncio
+import functools
 import os
+import queue
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-import google.generativeai as genai
 
 # Import LangChain components
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.memory import ConversationBufferWindowMemory 
-from langchain_core.output_parsers import StrOutputParser 
-from langchain.agents import AgentExecutor, create_react_agent, Tool
-from wikipedia import exceptions as wikipedia_exceptions # Thêm import này
-from langchain_community.utilities import WikipediaAPIWrapper 
-from langchain.vectorstores import FAISS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.embeddings import HuggingFaceEmbeddings
-
-#Google Calendar Tools
-from urllib.parse import quote_plus
-import pytz
+# Các thư viện nặng (google.generativeai, langchain.agents, FAISS, fitz, wikipedia...)
+# được import trễ bên trong hàm sử dụng để giảm thời gian khởi động.
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+from langchain_core.tools import Tool
+
 import json
-import fitz
 
+from agent.context import (
+    DEFAULT_OBSERVATION_TOKENS,
+    SUMMARY_TEMPERATURE,
+    BudgetedConversationMemory,
+    estimate_tokens,
+    truncate_to_tokens,
+)
+from agent.conversation import SQLiteChatMessageHistory
+from agent.essay_analysis import (
+    MAX_PARALLEL_CHUNKS,
+    AnalysisPlan,
+    chunk_hints,
+    merge_report,
+    report_footer,
+    report_header,
+    report_section,
+    should_chunk,
+)
+from agent.instrumentation import TurnRecorder, TurnTrace, activate_trace
+from agent.lesson_pack import (
+    LESSON_GROUNDED,
+    LESSON_SERVED,
+    choose_lesson_mode,
+    format_lesson,
+    lesson_grounding,
+    match_lessons,
+)
+from agent.llm_gateway import classify_error
+from agent.model_router import TASK_ANALYSIS, TASK_CHAT, TASK_TOOLS, TIER_AUTO
+from agent.router import (
+    ROUTE_AGENT,
+    ROUTE_CALENDAR,
+    ROUTE_LESSON_GROUNDED,
+    ROUTE_LESSON_PACK,
+    ROUTE_SEMANTIC_CACHE,
+    ROUTE_SMALL_TALK,
+    ROUTE_STUDY_PLAN,
+    ROUTE_TIME,
+    classify_message,
+)
+from agent.study_plan import StudyPlan, google_calendar_link, parse_local_datetime
+from utils.cache import make_cache_key, normalize_text
+from utils.metrics import current_trace, record_cache_event
+from utils.helper import (
+    configure_genai,
+    get_chat_llm,
+    get_concurrency_limiter,
+    get_conversation_store,
+    get_generative_model,
+    get_hybrid_retriever,
+    get_knowledge_pack,
+    get_lesson_pack,
+    get_metrics,
+    get_model_router,
+    get_rag_index_key,
+    get_response_cache,
+    get_router_stats,
+    get_semantic_cache,
+    get_vectorstore,
+    get_wiki_mode,
+    get_wikipedia_wrapper,
+)
 
 load_dotenv()
 
         
-def extract_blocks_from_pdf(pdf_path):
-    doc = fitz.open(pdf_path)
-    texts = []
-
-    for page in doc:
-        blocks = page.get_text("blocks")
-        for block in blocks:
-            text = block[4].strip()
-            if text:
-                texts.append(text)
-    return texts
-    
-def split_chunks(blocks, chunk_size=500, chunk_overlap=50):
-    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-    return splitter.create_documents(blocks)
-
 class RAGTool:
-    def __init__(self):
-        PDF_PATH = os.path.join(os.path.dirname(__file__), '..', 'docs', 'tense_grammar.pdf')
-        blocks = extract_blocks_from_pdf(PDF_PATH)
-        
-        docs = split_chunks(blocks)
-         
-        embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        vectorstore = FAISS.from_documents(docs, embedding_model)
+    def __init__(self, vectorstore=None, cache=None, retriever=None, max_output_tokens=DEFAULT_OBSERVATION_TOKENS):
+        # Mặc định dùng FAISS index chung của process thay vì nạp lại cho mỗi phiên
+        if vectorstore is None:
+            vectorstore = get_vectorstore()
+            # Kết quả cache gắn với index hiện tại, index build lại thì cache cũ không còn dùng
+            self.cache_scope = get_rag_index_key()
+            if retriever is None:
+                retriever = get_hybrid_retriever()
+        else:
+            self.cache_scope = f"custom-{id(vectorstore)}"
         self.vectorstore = vectorstore
+        self.retriever = retriever
+        self.cache = cache if cache is not None else get_response_cache()
+        self.max_output_tokens = max_output_tokens
+
+    def _cache_parts(self, query):
+        return [self.cache_scope, 'hybrid' if self.retriever else 'vector', normalize_text(query, lowercase=True), 3]
+
+    def run_many(self, queries):
+        """Tìm nhiều truy vấn một lúc: truy vấn chưa có trong cache được embed chung một lô."""
+        parts = [self._cache_parts(query) for query in queries]
+        results = [self.cache.get('rag', key_parts) for key_parts in parts]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            pending = [queries[i] for i in missing]
+            if self.retriever is not None:
+                found = self.retriever.search_many(pending, k=3)
+            else:
+                found = [self.vectorstore.similarity_search(query, k=3) for query in pending]
+            for i, docs in zip(missing, found):
+                results[i] = "\n".join([doc.page_content for doc in docs])
+                self.cache.set('rag', parts[i], results[i])
+        return results
 
-    
     def run(self, query: str) -> str:
-        docs = self.vectorstore.similarity_search(query, k=3)
-        return "\n".join([doc.page_content for doc in docs])
+        # Agent có thể tra nhiều chủ đề trong một lần gọi tool, phân cách bằng dấu ';'
+        queries = [part.strip() for part in query.split(';') if part.strip()] or [query]
+        results = self.run_many(queries)
+        if self.max_output_tokens:
+            # Observation được gửi lại ở mọi vòng ReAct sau đó: chia đều ngân sách cho từng truy vấn,
+            # chunk liên quan nhất đứng đầu nên phần bị cắt là phần ít liên quan nhất
+            budget = max(self.max_output_tokens // len(queries), 50)
+            results = [truncate_to_tokens(result, budget) for result in results]
+        if len(queries) == 1:
+            return results[0]
+        return "\n\n".join(f"[{q}]\n{result}" for q, result in zip(queries, results))
+
+    async def arun(self, query: str) -> str:
+        # FAISS nhả GIL khi tìm kiếm và chỉ được đọc, nên có thể chạy song song trong thread pool
+        return await asyncio.to_thread(self.run, query)
 
 
 class WikipediaTool:
-    def __init__(self):
-        self.wrapper = WikipediaAPIWrapper(top_k_results=1, doc_content_chars_max=500)
+    def __init__(self, wrapper=None, cache=None, max_output_tokens=DEFAULT_OBSERVATION_TOKENS, pack=None, mode=None):
+        self.wrapper = wrapper if wrapper is not None else get_wikipedia_wrapper()
+        self.cache = cache if cache is not None else get_response_cache()
+        self.max_output_tokens = max_output_tokens
+        # Gói kiến thức offline (SQLite FTS5) được tra trước, API Wikipedia chỉ là phương án dự phòng
+        self.mode = mode or get_wiki_mode()
+        self.pack = pack if pack is not None else get_knowledge_pack()
 
     def run(self, query: str) -> str:
         """Tìm kiếm thông tin trên Wikipedia. Sử dụng khi cần tra cứu các khái niệm, từ vựng, sự kiện. 
         Đầu vào là một chuỗi truy vấn."""
+        if self.pack is not None and self.mode != 'live':
+            result = self.pack.lookup(query, self.wrapper.top_k_results, self.wrapper.doc_content_chars_max)
+            record_cache_event('wiki_pack', result is not None)
+            if result is not None:
+                return truncate_to_tokens(result, self.max_output_tokens)
+        if self.mode == 'offline':
+            return "Không tìm thấy thông tin trong gói kiến thức offline cho truy vấn này."
+
+        from wikipedia import exceptions as wikipedia_exceptions
+
         try:
-            return self.wrapper.run(query)
+            # Chỉ cache kết quả thành công; lỗi mạng/không tìm thấy sẽ được thử lại ở lần sau
+            result = self.cache.get_or_compute(
+                'wikipedia',
+                [normalize_text(query, lowercase=True), self.wrapper.top_k_results, self.wrapper.doc_content_chars_max],
+                lambda: self.wrapper.run(query),
+            )
+            return truncate_to_tokens(result, self.max_output_tokens)
         except wikipedia_exceptions.PageError:
             return "Không tìm thấy thông tin trên Wikipedia cho truy vấn này."
         except wikipedia_exceptions.DisambiguationError as e:
             return f"Truy vấn quá mơ hồ. Vui lòng cụ thể hơn. Các lựa chọn: {e.options[:5]}..."
         except Exception as e:
             return f"Có lỗi khi tìm kiếm Wikipedia: {str(e)}"
+
+    async def arun(self, query: str) -> str:
+        # Thư viện wikipedia chỉ có API đồng bộ, chạy trong thread để không chặn event loop
+        return await asyncio.to_thread(self.run, query)
     
 class CurrentDateTimeTool:
     def run(self, _: str) -> str: 
@@ -105,60 +209,225 @@ class GoogleCalendarAddEventTool:
             if not title or not start_datetime_str:
                 return "Lỗi: Đầu vào JSON thiếu 'title' hoặc 'start_datetime_str' bắt buộc."
 
-            # --- Phần còn lại của logic xử lý ngày giờ và tạo URL (giữ nguyên) ---
-            parsed_start_dt = None
-            formats_to_try = [
-                "%Y-%m-%d %H:%M",  # "2025-12-25 10:00"
-                "%d/%m/%Y %H:%M",  # "25/12/2025 10:00"
-                "%d-%m-%Y %H:%M",  # "25-12-2025 10:00"
-                "%Y-%m-%d %H:%M:%S", # "2025-12-25 10:00:00"
-            ]
-            
-            for fmt in formats_to_try:
-                try:
-                    parsed_start_dt = datetime.strptime(start_datetime_str, fmt)
-                    break
-                except ValueError:
-                    continue
-            
+            # Giờ được hiểu theo múi giờ Asia/Ho_Chi_Minh (xem agent/study_plan.py)
+            parsed_start_dt = parse_local_datetime(start_datetime_str)
             if parsed_start_dt is None:
                 return f"Không thể hiểu định dạng thời gian bắt đầu: '{start_datetime_str}'. Vui lòng cung cấp định dạng rõ ràng hơn như 'YYYY-MM-DD HH:MM'."
 
-            local_tz = pytz.timezone('Asia/Ho_Chi_Minh') 
-            local_dt = local_tz.localize(parsed_start_dt, is_dst=None)
-            utc_dt = local_dt.astimezone(pytz.utc)
+            end_dt = parsed_start_dt + timedelta(minutes=duration_minutes)
+            link = google_calendar_link(title, parsed_start_dt, end_dt, description)
+            return f"Bạn có thể thêm sự kiện '{title}' vào lịch của mình bằng liên kết này: {link}"
+        except json.JSONDecodeError:
+            return "Lỗi: Đầu vào cho công cụ Lịch không phải là định dạng JSON hợp lệ. Vui lòng kiểm tra lại cấu trúc JSON."
+        except Exception as e:
+            return f"Có lỗi khi tạo liên kết lịch: {str(e)}. Vui lòng kiểm tra định dạng thời gian hoặc các tham số."
 
-            end_dt = utc_dt + timedelta(minutes=duration_minutes)
 
-            start_time_gcal = utc_dt.strftime("%Y%m%dT%H%M%SZ")
-            end_time_gcal = end_dt.strftime("%Y%m%dT%H%M%SZ")
+class StudyPlanTool:
+    """Tạo cả một lịch học nhiều buổi trong một lần gọi: mọi buổi được khai triển tại chỗ từ quy tắc lặp,
+    ghi thành một file .ics và một liên kết Google Calendar cho cả chuỗi (thay vì gọi tool Calendar từng buổi)."""
 
-            base_url = "https://calendar.google.com/calendar/render"
-            gcal_params = { # Đổi tên biến để tránh trùng với 'params' đã phân tích
-                "action": "TEMPLATE",
-                "text": title,
-                "dates": f"{start_time_gcal}/{end_time_gcal}",
-                "details": description,
-                "sf": "true",
-                "output": "xml" 
-            }
+    def __init__(self, on_plan=None, directory=None):
+        # on_plan(plan) được gọi với StudyPlan vừa tạo, để giao diện cho tải file .ics
+        self.on_plan = on_plan
+        self.directory = directory
 
-            query_string = "&".join([f"{key}={quote_plus(str(value))}" for key, value in gcal_params.items()])
-            
-            return f"Bạn có thể thêm sự kiện '{title}' vào lịch của mình bằng liên kết này: {base_url}?{query_string}"
+    def run(self, tool_input: str) -> str:
+        """tool_input là JSON: title, start_datetime_str (buổi đầu tiên, giờ Việt Nam), rrule (ví dụ
+        "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR;COUNT=40"), duration_minutes (mặc định 60), description."""
+        try:
+            plan = StudyPlan.from_params(json.loads(tool_input))
         except json.JSONDecodeError:
-            return "Lỗi: Đầu vào cho công cụ Lịch không phải là định dạng JSON hợp lệ. Vui lòng kiểm tra lại cấu trúc JSON."
-        except Exception as e:
-            return f"Có lỗi khi tạo liên kết lịch: {str(e)}. Vui lòng kiểm tra định dạng thời gian hoặc các tham số."
+            return "Lỗi: Đầu vào cho công cụ lịch học không phải là định dạng JSON hợp lệ. Vui lòng kiểm tra lại cấu trúc JSON."
+        except ValueError as e:
+            return f"Lỗi: {e}"
+        return self.create(plan)
+
+    def create(self, plan):
+        """Ghi file .ics của `plan` (StudyPlan đã khai triển) và trả về câu trả lời cho học viên."""
+        try:
+            ics_path = plan.save_ics(self.directory)
+        except OSError as e:
+            print(f"Không ghi được file lịch học: {e}")
+            ics_path = None
+        if self.on_plan is not None:
+            self.on_plan(plan)
+        return plan.summary(ics_path)
+
+
+ANALYSIS_GENERATION_CONFIG = {
+    'temperature': 0.3, # Ít sáng tạo, tập trung vào độ chính xác
+    'max_output_tokens': 800,
+}
+# Mỗi phần của bài viết dài chỉ vài câu nên câu trả lời ngắn hơn; tổng cả bài không còn bị cắt ở 800 token
+ANALYSIS_CHUNK_GENERATION_CONFIG = {
+    'temperature': 0.3,
+    'max_output_tokens': 400,
+}
+
+
+USER_LEVELS = ('beginner', 'intermediate', 'advanced')
+
+# Phần tĩnh (system prompt, mô tả tool, định dạng ReAct) đứng trước và không đổi giữa các lượt/vòng lặp
+# để Gemini cache được prefix; phần thay đổi (lịch sử đã rút gọn, câu hỏi, scratchpad) nằm cuối.
+# Template không thụt lề: khoảng trắng đầu dòng cũng là token bị gửi lại ở mỗi vòng ReAct.
+# "tools", "tool_names", "chat_history", "input" và "agent_scratchpad" là các placeholder bắt buộc của agent ReAct.
+AGENT_PROMPT_TEMPLATE = """({system_prompt})Answer the following questions as best you can, but speaking as compasionate medical professional. You have access to the following tools:
+
+{tools}
+
+Use the following format:
+
+Question: the input question you must answer
+Thought: you should always think about what to do.
+(If you need to use a tool, follow the Action/Observation format. Otherwise, proceed directly to Final Answer.)
+Action: the action to take, should be one of [{tool_names}]
+Action Input: the input to the action
+Observation: the result of the action
+... (this Thought/Action/Action Input/Observation can repeat N times)
+Thought: I now know the final answer
+Final Answer: the final answer to the original input question
+
+Begin! Remember to speak as a compasionate medical professional when giving your final answer. If the condition is serious advise they speak to a doctor.
+
+Previous conversation history:
+{chat_history}
+
+User question: {input}
+{agent_scratchpad}"""
+
+
+@functools.lru_cache(maxsize=64)
+def compile_agent_prompt(system_prompt, tools_text, tool_names):
+    """Prompt ReAct đã điền sẵn phần tĩnh, dùng chung giữa các phiên có cùng system prompt và tool.
+    Trả về (prompt, số token của phần tĩnh)."""
+    prompt = ChatPromptTemplate.from_template(AGENT_PROMPT_TEMPLATE).partial(
+        system_prompt=system_prompt, tools=tools_text, tool_names=tool_names
+    )
+    return prompt, estimate_tokens(prompt.format(chat_history="", input="", agent_scratchpad=""))
+
+
+OVERLOADED_MESSAGE = (
+    "Xin lỗi, hệ thống đang quá tải (Gemini giới hạn số yêu cầu). Vui lòng thử lại sau ít phút."
+)
+
+
+def chat_error_message(error):
+    """Thông báo lỗi cho học viên: lỗi quá tải/giới hạn tần suất có thông báo riêng, dễ hiểu hơn nội dung lỗi API."""
+    if classify_error(error) == 'rate_limit':
+        return OVERLOADED_MESSAGE
+    return f"Xin lỗi, có lỗi xảy ra khi trò chuyện: {str(error)}. Vui lòng thử lại hoặc kiểm tra cấu hình."
+
+
+# Câu trả lời có dùng các tool này phụ thuộc thời điểm hỏi nên không được đưa vào semantic cache
+NON_CACHEABLE_TOOLS = {"Current Time", "Google Calendar Add Event", "Study Plan Schedule"}
+
+# Các từ cho thấy câu hỏi dựa vào lượt trò chuyện trước (khi đó không dùng semantic cache)
+CONTEXT_REFERENCE_WORDS = {
+    'it', 'this', 'that', 'these', 'those', 'they', 'them', 'he', 'she', 'his', 'her',
+    'above', 'previous', 'again', 'more', 'another', 'same', 'example', 'why',
+    'nó', 'đó', 'này', 'trên', 'nữa', 'lại', 'vậy',
+}
+
+
+def is_context_dependent(question, has_history):
+    """Ước lượng câu hỏi có cần lịch sử hội thoại để hiểu không (câu ngắn hoặc có đại từ chỉ định)."""
+    if not has_history:
+        return False
+    words = re.findall(r"\w+", question.lower())
+    return len(words) < 4 or any(word in CONTEXT_REFERENCE_WORDS for word in words)
+
+
+class AgentStreamHandler(TurnRecorder):
+    """Callback đẩy token của phần Final Answer và trạng thái tool vào một queue.
+    Các bước Thought/Action trung gian của ReAct không được gửi cho người dùng."""
+
+    FINAL_ANSWER_MARKER = "Final Answer:"
+
+    def __init__(self, events, trace=None):
+        super().__init__(trace)
+        self.events = events
+        self._buffer = ""
+        self._in_answer = False
+        self._answer_started = False
+
+    def _reset(self):
+        self._buffer = ""
+        self._in_answer = False
+        self._answer_started = False
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        super().on_llm_start(serialized, prompts, **kwargs)
+        self._reset()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        super().on_chat_model_start(serialized, messages, **kwargs)
+        self._reset()
+
+    def on_llm_new_token(self, token, **kwargs):
+        if not self._in_answer:
+            self._buffer += token
+            index = self._buffer.find(self.FINAL_ANSWER_MARKER)
+            if index == -1:
+                return
+            self._in_answer = True
+            token = self._buffer[index + len(self.FINAL_ANSWER_MARKER):]
+
+        if not self._answer_started:
+            token = token.lstrip()
+            if not token:
+                return
+            self._answer_started = True
+        self.events.put({"type": "token", "content": token})
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        super().on_tool_start(serialized, input_str, **kwargs)
+        self.events.put({"type": "tool_start", "tool": (serialized or {}).get("name", ""), "input": input_str})
+
+    def on_tool_end(self, output, **kwargs):
+        super().on_tool_end(output, **kwargs)
+        self.events.put({"type": "tool_end", "tool": kwargs.get("name", "")})
+
+
+class LazyTool:
+    """Bọc một tool và chỉ khởi tạo nó ở lần gọi đầu tiên (hoặc khi warm_up),
+    để học viên chỉ trò chuyện thì không phải chờ nạp FAISS/Wikipedia."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._tool = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self):
+        return self._tool is not None
+
+    def warm_up(self):
+        if self._tool is None:
+            with self._lock:
+                if self._tool is None:
+                    self._tool = self._factory()
+        return self._tool
+
+    def run(self, tool_input: str) -> str:
+        return self.warm_up().run(tool_input)
+
+    async def arun(self, tool_input: str) -> str:
+        tool = self._tool if self._tool is not None else await asyncio.to_thread(self.warm_up)
+        if hasattr(tool, 'arun'):
+            return await tool.arun(tool_input)
+        return tool.run(tool_input)
+
+
 class EnglishTutorAgent:
-    def __init__(self):
-        """Initialize the English Tutor Agent with Google Gemini and LangChain Memory using LCEL."""
-        
-        gemini_api_key = os.getenv('GOOGLE_API_KEY')
-        if not gemini_api_key:
-            raise ValueError("GOOGLE_API_KEY environment variable not set. Please set it in your .env file.")
+    def __init__(self, user_id=None, session_id=None):
+        """Initialize the English Tutor Agent with Google Gemini and LangChain Memory using LCEL.
+
+        user_id/session_id identify the conversation in the durable store (TUTOR_CONVERSATION_DB);
+        passing an existing session_id resumes that conversation."""
         
-        genai.configure(api_key=gemini_api_key)
+        # Cấu hình Gemini một lần cho cả process (raise ValueError nếu thiếu GOOGLE_API_KEY)
+        configure_genai()
         
         self.user_profile = {
             'level': 'beginner',
@@ -167,114 +436,463 @@ class EnglishTutorAgent:
             'goals': 'general_english'
         }
         
-        self.available_models = {
-            'fast': 'gemini-2.0-flash',
-            'balanced': 'gemini-2.0-flash',
-            'smart': 'gemini-2.0-flash',
-            'coding': 'gemini-2.0-flash'
-        }
+        # Mỗi lời gọi LLM được router chọn model theo tác vụ, độ dài đầu vào và độ trễ/lỗi gần đây;
+        # model_tier = 'auto' để router tự chọn, hoặc một tier để luôn thử tier đó trước
+        self.model_router = get_model_router()
+        self.available_models = {tier: self.model_router.model_for(tier) for tier in self.model_router.tiers}
+        self.model_tier = TIER_AUTO
         self.current_model_name = self.available_models['balanced']
         
-        # Khởi tạo LLM cho LangChain
-        self.llm = ChatGoogleGenerativeAI(model=self.current_model_name, temperature=0.3)
+        # LLM cho LangChain được dùng chung giữa các phiên
+        self.llm = get_chat_llm(self.current_model_name)
         
+        # Đặt False để luôn chạy agent, kể cả khi semantic cache đang bật (TUTOR_SEMANTIC_CACHE=1)
+        self.use_semantic_cache = True
+        # Đặt False để mọi tin nhắn (kể cả hỏi giờ, chào hỏi) đều đi qua AgentExecutor
+        self.use_fast_path = True
+        # Đặt False để không trả lời từ gói bài học soạn sẵn (TUTOR_LESSON_PACK), kể cả khi gói đã được build
+        self.use_lesson_pack = True
+        # Số liệu đo đạc của lượt gần nhất (TurnTrace.to_dict), dùng cho debug panel
+        self.last_turn = None
+        # Lịch học (StudyPlan) tạo ở lượt gần nhất, để giao diện cho tải file .ics
+        self.last_study_plan = None
+
         # Khởi tạo Memory
-        self.memory = ConversationBufferWindowMemory(
-            memory_key="chat_history", 
-            input="human_input",
-            return_messages=True,
-            k=5
+        self.user_id = user_id or 'anonymous'
+        self.session_id = session_id or uuid.uuid4().hex
+        memory_kwargs = {}
+        conversation_store = get_conversation_store()
+        if conversation_store is not None:
+            # Lưu lịch sử trên SQLite, mỗi lượt chỉ nạp đúng cửa sổ k lượt gần nhất
+            memory_kwargs['chat_memory'] = SQLiteChatMessageHistory(
+                conversation_store, self.user_id, self.session_id, window=2 * 5
+            )
+        # k lượt gần nhất được giữ nguyên văn trong ngân sách token (TUTOR_HISTORY_TOKENS),
+        # các lượt cũ hơn được gộp dần vào một bản tóm tắt thay vì bị bỏ đi
+        self.memory = BudgetedConversationMemory(
+            memory_key="chat_history",
+            k=5,
+            summarizer=self.model_router.chat_model(TASK_CHAT, temperature=SUMMARY_TEMPERATURE),
+            **memory_kwargs
         )
         
+        # Các tool chỉ được khởi tạo khi agent gọi tới lần đầu
+        self.tool_runners = {
+            "Wikipedia Search": LazyTool(WikipediaTool),
+            "Current Time": LazyTool(CurrentDateTimeTool),
+            "Google Calendar Add Event": LazyTool(GoogleCalendarAddEventTool),
+            "Study Plan Schedule": LazyTool(functools.partial(StudyPlanTool, on_plan=self._remember_study_plan)),
+            "EnglishMaterialSearch": LazyTool(RAGTool),
+        }
+
         self.tools = [
             Tool(
                 name="Wikipedia Search",
-                func=WikipediaTool().run,
+                func=self.tool_runners["Wikipedia Search"].run,
+                coroutine=self.tool_runners["Wikipedia Search"].arun,
                 description="Hữu ích khi bạn cần tra cứu thông tin chung, khái niệm, hoặc sự kiện. Sử dụng nó để tìm kiếm các chủ đề mà người dùng hỏi đến.",
             ),
             Tool(
                 name="Current Time",
-                func=CurrentDateTimeTool().run,
+                func=self.tool_runners["Current Time"].run,
+                coroutine=self.tool_runners["Current Time"].arun,
                 description="Hữu ích khi bạn cần biết ngày và giờ hiện tại.",
             ),
             Tool(
                 name="Google Calendar Add Event",
-                func=GoogleCalendarAddEventTool().run,
+                func=self.tool_runners["Google Calendar Add Event"].run,
+                coroutine=self.tool_runners["Google Calendar Add Event"].arun,
                 description="Hữu ích khi người dùng muốn đặt lịch học hoặc một sự kiện. Cần các tham số: title (tiêu đề sự kiện), start_datetime_str (thời gian bắt đầu, ví dụ: '2025-12-25 10:00'), duration_minutes (thời lượng bằng phút, mặc định 60), description (mô tả).",
             ),
+            Tool(
+                name="Study Plan Schedule",
+                func=self.tool_runners["Study Plan Schedule"].run,
+                coroutine=self.tool_runners["Study Plan Schedule"].arun,
+                description="Dùng cho lịch học lặp lại nhiều buổi (ví dụ: mỗi tối thứ 2-6 trong 8 tuần): gọi MỘT lần cho cả lịch, không gọi Google Calendar Add Event cho từng buổi. Đầu vào JSON: title, start_datetime_str (buổi đầu tiên, ví dụ: '2025-12-25 19:00'), rrule (quy tắc lặp RFC 5545, ví dụ: 'FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR;COUNT=40'), duration_minutes (mặc định 60), description.",
+            ),
             Tool(
             name="EnglishMaterialSearch",
-            func=RAGTool().run,
-            description="Trả lời các câu hỏi dựa trên tài liệu học tiếng Anh"
+            func=self.tool_runners["EnglishMaterialSearch"].run,
+                coroutine=self.tool_runners["EnglishMaterialSearch"].arun,
+            description="Trả lời các câu hỏi dựa trên tài liệu học tiếng Anh. Dùng đúng thuật ngữ ngữ pháp trong truy vấn (ví dụ: 'present perfect just'); cần tra nhiều chủ đề thì gộp vào một lần gọi, phân cách bằng dấu ';'."
         )
         ]
 
+        from langchain.tools.render import render_text_description
+
+        self._tools_text = render_text_description(self.tools)
+        self._tool_names = ", ".join(tool.name for tool in self.tools)
+
         # Khởi tạo Chain ban đầu với LCEL (sẽ không dùng .with_history() nữa)
         self._initialize_agent()
         
     def _initialize_agent(self):
         """
-        Initializes the LangChain Agent with the current LLM, tools, and memory.
+        Initializes the LangChain Agent with the tools and memory.
         This method sets up the Agent's prompt, creates the ReAct agent,
         and initializes the AgentExecutor which orchestrates the agent's reasoning,
-        tool usage, and memory management.
+        tool usage, and memory management. It only needs to run once: the level's prompt
+        and the model's LLM client are looked up on every call, so update_user_level and
+        switch_model take effect without rebuilding anything.
         """
 
-        # Custom system prompt for the Agent, based on user profile
-        system_prompt = self.set_system_prompt()
-
-        # Define the prompt template for the Agent.
-        # This template guides the LLM on its role, available tools,
-        # how to use them (JSON format), and includes chat history and current input.
-        # IMPORTANT: "tools", "chat_history", "input", and "agent_scratchpad"
-        # are required placeholders for a ReAct agent.
-        prompt = ChatPromptTemplate.from_template(
-            f"""({system_prompt})Answer the following questions as best you can, but speaking as compasionate medical professional. You have access to the following tools:
-
-            {{tools}}
-
-            Use the following format:
+        # Prompt cho mọi trình độ được dựng sẵn (và dùng chung giữa các phiên), LLM được router chọn theo
+        # độ dài prompt ở mỗi vòng ReAct: đổi trình độ/model chỉ là đổi một thuộc tính, executor và memory giữ nguyên
+        for level in USER_LEVELS:
+            self._agent_prompt_for(level)
 
-            Question: the input question you must answer
-            Thought: you should always think about what to do.
-            (If you need to use a tool, follow the Action/Observation format. Otherwise, proceed directly to Final Answer.)
-            Action: the action to take, should be one of [{{tool_names}}]
-            Action Input: the input to the action
-            Observation: the result of the action
-            ... (this Thought/Action/Action Input/Observation can repeat N times)
-            Thought: I now know the final answer
-            Final Answer: the final answer to the original input question
+        from langchain.agents import AgentExecutor
+        from langchain.agents.format_scratchpad import format_log_to_str
+        from langchain.agents.output_parsers import ReActSingleInputOutputParser
 
-            Begin! Remember to speak as a compasionate medical professional when giving your final answer. If the condition is serious advise they speak to a doctor.
-
-            Previous conversation history:
-            {{chat_history}}
+        # Giống create_react_agent, nhưng prompt và LLM được chọn lúc chạy thay vì cố định khi dựng
+        agent = (
+            RunnablePassthrough.assign(agent_scratchpad=lambda x: format_log_to_str(x["intermediate_steps"]))
+            | RunnableLambda(lambda _: self._agent_prompt_for(self.user_profile['level'])[0], name="LevelPrompt")
+            | RunnableLambda(self._agent_llm, name="ModelSelector")
+            | ReActSingleInputOutputParser()
+        )
 
-            User question: {{input}}
-            {{agent_scratchpad}}""")
-        
-        agent = create_react_agent(self.llm, self.tools, prompt)
-        
         self.agent_executor = AgentExecutor(
             agent=agent,
             tools=self.tools,
-            verbose=True,
+            # Log từng bước ra stdout rất tốn kém; thông tin này đã có trong TurnTrace (TUTOR_TURN_LOG)
+            verbose=os.getenv('TUTOR_AGENT_VERBOSE') == '1',
             memory=self.memory,
             handle_parsing_errors=True
         )
+
+    def _agent_prompt_for(self, level):
+        """(prompt, static prefix token count) for the given level, compiled once per process."""
+        return compile_agent_prompt(self.set_system_prompt(level), self._tools_text, self._tool_names)
+
+    def _agent_llm(self, prompt_value):
+        """Routed chat model (with fallbacks) for one ReAct step, bound to the ReAct stop sequence.
+        Long prompts (many observations) go to a stronger tier."""
+        return self.model_router.chat_model(
+            TASK_TOOLS, len(prompt_value.to_string()), self.model_tier, stop=("\nObservation",)
+        )
+
+    @property
+    def static_prompt_tokens(self):
+        """Token count of the static prompt prefix (system prompt, tools, format) for the current level."""
+        return self._agent_prompt_for(self.user_profile['level'])[1]
     
+    def warm_up(self, background=False):
+        """Khởi tạo trước các tool nặng (FAISS, Wikipedia). Với background=True,
+        việc này chạy trong một thread riêng để có thể gọi ngay sau khi trang đã hiển thị."""
+        if background:
+            thread = threading.Thread(target=self._warm_up_safely, name="tutor-warm-up", daemon=True)
+            thread.start()
+            return thread
+
+        for runner in self.tool_runners.values():
+            runner.warm_up()
+
+    def _warm_up_safely(self):
+        try:
+            self.warm_up()
+        except Exception as e:
+            # Lỗi sẽ xuất hiện lại khi tool thật sự được gọi, không làm hỏng phiên hiện tại
+            print(f"Warm-up thất bại: {e}")
+
+    def _answer_without_agent(self, user_message):
+        """Trả lời qua đường tắt của router, gói bài học soạn sẵn hoặc semantic cache nếu được.
+        Trả về (câu trả lời, route); câu trả lời None nghĩa là cần chạy agent."""
+        answer, route = self._run_fast_path(user_message)
+        if answer is None:
+            answer, route = self._answer_from_lesson_pack(user_message)
+        if answer is None:
+            answer, route = self._lookup_semantic_cache(user_message), ROUTE_SEMANTIC_CACHE
+        return answer, route
+
+    def _new_trace(self):
+        self.last_study_plan = None
+        # Ở chế độ auto, model thật của từng lời gọi LLM được ghi trong llm_calls
+        model = self.model_tier if self.model_tier == TIER_AUTO else self.current_model_name
+        return TurnTrace(self.user_id, self.session_id, model)
+
+    def _finish_trace(self, trace, route, error=None):
+        self.last_turn = trace.finish(route, error)
+
+    def _finish_agent_turn(self, user_message, answer, recorder):
+        get_router_stats().record(ROUTE_AGENT, recorder.llm_calls)
+        self._store_semantic_cache(user_message, answer, recorder.tools_used)
+        self._finish_trace(recorder.trace, ROUTE_AGENT)
+
+    def _trace_config(self):
+        """Config cho lời gọi LLM ngoài AgentExecutor để lời gọi đó vẫn được ghi vào lượt hiện tại."""
+        trace = current_trace.get()
+        return {"callbacks": [TurnRecorder(trace)]} if trace is not None else None
+
+    def _run_fast_path(self, user_message):
+        """Trả lời trực tiếp các yêu cầu đơn giản (hỏi giờ, đặt một lịch, lịch học lặp lại, chào hỏi)
+        mà không vào vòng lặp ReAct."""
+        if not self.use_fast_path:
+            return None, None
+
+        route = classify_message(user_message)
+        if route == ROUTE_TIME:
+            answer, llm_calls = self.tool_runners["Current Time"].run(user_message), 0
+        elif route == ROUTE_SMALL_TALK:
+            answer, llm_calls = self._small_talk(user_message), 1
+        elif route == ROUTE_CALENDAR:
+            answer, llm_calls = self._quick_calendar_event(user_message), 1
+        elif route == ROUTE_STUDY_PLAN:
+            answer, llm_calls = self._quick_study_plan(user_message), 1
+        else:
+            return None, None
+        if answer is None:
+            # Lời gọi trích xuất đã tốn mà yêu cầu vẫn phải đi qua agent
+            get_router_stats().record(route, llm_calls, answered=False)
+            return None, None
+
+        get_router_stats().record(route, llm_calls)
+        self.memory.save_context({"input": user_message}, {"output": answer})
+        return answer, route
+
+    def _small_talk(self, user_message):
+        """Một lời gọi LLM duy nhất với system prompt và lịch sử hội thoại, không kèm mô tả tool."""
+        from langchain_core.messages import HumanMessage, SystemMessage
+
+        history = self.memory.buffer_as_messages
+        messages = [
+            SystemMessage(content=self.set_system_prompt() + "\n\nĐây là câu chào hỏi/xã giao: trả lời ngắn gọn (1-3 câu)."),
+            *history,
+            HumanMessage(content=user_message),
+        ]
+        llm = self.model_router.chat_model(TASK_CHAT, len(user_message), self.model_tier)
+        return llm.invoke(messages, config=self._trace_config()).content
+
+    def _answer_from_lesson_pack(self, user_message):
+        """Trả lời nguyên văn bằng bài học soạn sẵn cho trình độ hiện tại (không gọi LLM), hoặc bằng một lời gọi LLM
+        dùng bài soạn sẵn làm căn cứ nếu câu hỏi cụ thể hơn. Trả về (None, None) nếu không có bài phù hợp."""
+        pack = get_lesson_pack()
+        if pack is None or not self.use_lesson_pack:
+            return None, None
+
+        level = self.user_profile['level']
+        start = time.perf_counter()
+        lessons = match_lessons(pack, user_message, level)
+        context_dependent = is_context_dependent(user_message, bool(self.memory.chat_memory.messages))
+        mode = choose_lesson_mode(user_message, lessons, context_dependent)
+        metrics = get_metrics()
+        metrics.observe('tutor_lesson_pack_lookup_seconds', time.perf_counter() - start)
+        metrics.inc('tutor_lesson_pack_requests_total', result=mode or 'miss', level=level)
+        record_cache_event('lesson_pack', mode is not None)
+
+        if mode == LESSON_SERVED:
+            answer, route, llm_calls = format_lesson(lessons[0]), ROUTE_LESSON_PACK, 0
+        elif mode == LESSON_GROUNDED:
+            answer, route, llm_calls = self._grounded_answer(user_message, lessons), ROUTE_LESSON_GROUNDED, 1
+        else:
+            return None, None
+        get_router_stats().record(route, llm_calls)
+        self.memory.save_context({"input": user_message}, {"output": answer})
+        return answer, route
+
+    def _grounded_answer(self, user_message, lessons):
+        """Một lời gọi LLM với system prompt, bài soạn sẵn làm căn cứ và lịch sử hội thoại, không kèm mô tả tool."""
+        from langchain_core.messages import HumanMessage, SystemMessage
+
+        system_prompt = (
+            self.set_system_prompt()
+            + "\n\nBài học soạn sẵn cho trình độ này từ tài liệu của lớp. Trả lời dựa trên các bài này, "
+            + "chỉ bổ sung khi câu hỏi cần:\n\n" + lesson_grounding(lessons)
+        )
+        messages = [SystemMessage(content=system_prompt), *self.memory.buffer_as_messages,
+                    HumanMessage(content=user_message)]
+        llm = self.model_router.chat_model(TASK_CHAT, len(system_prompt) + len(user_message), self.model_tier)
+        return llm.invoke(messages, config=self._trace_config()).content
+
+    def _quick_calendar_event(self, user_message):
+        """Trích xuất một sự kiện bằng một lời gọi LLM rồi gọi thẳng GoogleCalendarAddEventTool.
+        Trả về None nếu không trích xuất được, khi đó yêu cầu sẽ đi qua agent như bình thường."""
+        now = datetime.now().strftime("%A, %Y-%m-%d %H:%M")
+        extraction_prompt = f"""Extract the study event from the learner's message as a JSON object with keys:
+"title" (string), "start_datetime_str" (format "YYYY-MM-DD HH:MM", Asia/Ho_Chi_Minh time),
+"duration_minutes" (integer, default 60) and "description" (string).
+Current time: {now}.
+If the message does not say both the day and the time of a single event, answer exactly NONE.
+
+Message: {user_message}"""
+        llm = self.model_router.chat_model(TASK_CHAT, len(user_message), self.model_tier)
+        content = llm.invoke(extraction_prompt, config=self._trace_config()).content
+        match = re.search(r"\{.*\}", content, re.DOTALL)
+        if not match:
+            return None
+        try:
+            params = json.loads(match.group(0))
+        except json.JSONDecodeError:
+            return None
+        if not params.get("title") or not params.get("start_datetime_str"):
+            return None
+        return self.tool_runners["Google Calendar Add Event"].run(json.dumps(params, ensure_ascii=False))
+
+    def _quick_study_plan(self, user_message):
+        """Trích xuất cả lịch học lặp lại thành một kế hoạch (RRULE) bằng một lời gọi LLM, rồi khai triển mọi buổi
+        tại chỗ bằng StudyPlanTool. Trả về None nếu không trích xuất được, khi đó yêu cầu sẽ đi qua agent."""
+        now = datetime.now().strftime("%A, %Y-%m-%d %H:%M")
+        extraction_prompt = f"""Extract the learner's recurring study schedule as a JSON object with keys:
+"title" (string), "start_datetime_str" (first session, format "YYYY-MM-DD HH:MM", Asia/Ho_Chi_Minh time),
+"rrule" (RFC 5545 recurrence rule without the "RRULE:" prefix: FREQ, optional INTERVAL and BYDAY, and always COUNT
+or UNTIL=YYYYMMDD), "duration_minutes" (integer, default 60) and "description" (string).
+Examples: "every weekday for 8 weeks" -> "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR;COUNT=40";
+"every day until June 30" -> "FREQ=DAILY;UNTIL=<year>0630".
+Current time: {now}. If no time of day is given, use 19:00.
+If the message is not a recurring study schedule, answer exactly NONE.
+
+Message: {user_message}"""
+        llm = self.model_router.chat_model(TASK_CHAT, len(user_message), self.model_tier)
+        content = llm.invoke(extraction_prompt, config=self._trace_config()).content
+        match = re.search(r"\{.*\}", content, re.DOTALL)
+        if not match:
+            return None
+        try:
+            plan = StudyPlan.from_params(json.loads(match.group(0)))
+        except (json.JSONDecodeError, ValueError):
+            return None
+        return self.tool_runners["Study Plan Schedule"].warm_up().create(plan)
+
+    def _remember_study_plan(self, plan):
+        self.last_study_plan = plan
+
+    def _semantic_cache_scope(self):
+        # Chỉ dùng lại câu trả lời cho cùng trình độ và tier (học viên beginner không nhận câu trả lời advanced)
+        return f"{self.user_profile['level']}:{self.model_tier}"
+
+    def _lookup_semantic_cache(self, user_message):
+        """Tìm câu trả lời cho câu hỏi tương tự trong semantic cache; None nếu không có hoặc cache bị bỏ qua."""
+        cache = get_semantic_cache()
+        if cache is None or not self.use_semantic_cache:
+            return None
+        if is_context_dependent(user_message, bool(self.memory.chat_memory.messages)):
+            cache.record_bypass()
+            return None
+
+        answer = cache.lookup(user_message, self._semantic_cache_scope())
+        record_cache_event('semantic', answer is not None)
+        if answer is not None:
+            # Vẫn ghi vào memory để các lượt sau có đủ ngữ cảnh
+            self.memory.save_context({"input": user_message}, {"output": answer})
+        return answer
+
+    def _store_semantic_cache(self, user_message, answer, tools_used):
+        cache = get_semantic_cache()
+        if cache is None or not self.use_semantic_cache:
+            return
+        if NON_CACHEABLE_TOOLS.intersection(tools_used):
+            return
+        # Lịch sử lúc này đã gồm lượt vừa trả lời, nên chỉ xét các lượt trước đó
+        has_history = len(self.memory.chat_memory.messages) > 2
+        if is_context_dependent(user_message, has_history):
+            return
+        cache.store(user_message, self._semantic_cache_scope(), answer)
+
+    def stream_agent_chat(self, user_message):
+        """Process user message like run_agent_chat, but yield events while the agent is running:
+
+        - {"type": "token", "content": ...}: a piece of the Final Answer
+        - {"type": "tool_start", "tool": ..., "input": ...} / {"type": "tool_end", "tool": ...}
+        - {"type": "final", "content": ...}: the complete answer (always the last event on success)
+        - {"type": "error", "content": ...}: error message, same text as run_agent_chat returns
+        """
+        trace = self._new_trace()
+        try:
+            with activate_trace(trace):
+                quick_answer, route = self._answer_without_agent(user_message)
+        except Exception as e:
+            print(f"\n--- LỖI TRONG stream_agent_chat: ---\n{e}\n-----------------------------------\n")
+            self._finish_trace(trace, ROUTE_AGENT, error=e)
+            yield {"type": "error", "content": chat_error_message(e)}
+            return
+        if quick_answer is not None:
+            self._finish_trace(trace, route)
+            yield {"type": "final", "content": quick_answer}
+            return
+
+        events = queue.Queue()
+        handler = AgentStreamHandler(events, trace)
+
+        def _run():
+            try:
+                with activate_trace(trace):
+                    response = self.agent_executor.invoke({"input": user_message}, config={"callbacks": [handler]})
+                self._finish_agent_turn(user_message, response['output'], handler)
+                events.put({"type": "final", "content": response['output']})
+            except Exception as e:
+                print(f"\n--- LỖI TRONG stream_agent_chat: ---\n{e}\n-----------------------------------\n")
+                self._finish_trace(trace, ROUTE_AGENT, error=e)
+                events.put({"type": "error", "content": chat_error_message(e)})
+            finally:
+                events.put(None)
+
+        # AgentExecutor chạy đồng bộ nên đặt trong thread riêng, còn generator này đọc sự kiện từ queue
+        threading.Thread(target=_run, name="tutor-agent-stream", daemon=True).start()
+        while True:
+            event = events.get()
+            if event is None:
+                return
+            yield event
+
     def run_agent_chat(self, user_message):
         """Process user message using the LangChain Agent and return AI response."""
+        trace = self._new_trace()
         try:
-            response = self.agent_executor.invoke({"input": user_message})
+            with activate_trace(trace):
+                quick_answer, route = self._answer_without_agent(user_message)
+                if quick_answer is not None:
+                    self._finish_trace(trace, route)
+                    return quick_answer
+
+                recorder = TurnRecorder(trace)
+                response = self.agent_executor.invoke({"input": user_message}, config={"callbacks": [recorder]})
+            self._finish_agent_turn(user_message, response['output'], recorder)
             return response['output']
 
         except Exception as e:
             print(f"\n--- LỖI TRONG run_agent_chat: ---\n{e}\n-----------------------------------\n")
-            return f"Xin lỗi, có lỗi xảy ra khi trò chuyện: {str(e)}. Vui lòng thử lại hoặc kiểm tra cấu hình."
+            self._finish_trace(trace, ROUTE_AGENT, error=e)
+            return chat_error_message(e)
+
+    async def arun_agent_chat(self, user_message, user_id=None):
+        """Async version of run_agent_chat for serving many learners from one event loop.
+        Calls go through the shared concurrency limiter; user_id (default: this session)
+        is used for fair scheduling, and one session never runs two turns at the same time."""
+        trace = self._new_trace()
+        try:
+            async with get_concurrency_limiter().slot(user_id or id(self)):
+                with activate_trace(trace):
+                    quick_answer, route = await asyncio.to_thread(self._answer_without_agent, user_message)
+                    if quick_answer is not None:
+                        self._finish_trace(trace, route)
+                        return quick_answer
+
+                    recorder = TurnRecorder(trace)
+                    response = await self.agent_executor.ainvoke({"input": user_message}, config={"callbacks": [recorder]})
+                await asyncio.to_thread(self._finish_agent_turn, user_message, response['output'], recorder)
+                return response['output']
+
+        except Exception as e:
+            print(f"\n--- LỖI TRONG arun_agent_chat: ---\n{e}\n-----------------------------------\n")
+            self._finish_trace(trace, ROUTE_AGENT, error=e)
+            return chat_error_message(e)
         
-    def set_system_prompt(self):
-        """Create system prompt based on user profile"""
+    def get_chat_history(self, limit=50):
+        """Return up to `limit` recent messages as [{"role": "user"|"assistant", "content": ...}] for display."""
+        conversation_store = get_conversation_store()
+        if conversation_store is not None:
+            rows = conversation_store.recent_messages(self.session_id, limit)
+        else:
+            rows = [(message.type, message.content) for message in self.memory.chat_memory.messages[-limit:]]
+        return [
+            {"role": "assistant" if role == "ai" else "user", "content": content}
+            for role, content in rows
+        ]
+
+    def set_system_prompt(self, level=None):
+        """Create system prompt based on user profile (or for `level` instead of the current level)"""
+        level = level or self.user_profile['level']
         level_descriptions = {
             'beginner': 'sử dụng từ vựng đơn giản, ngữ pháp cơ bản',
             'intermediate': 'sử dụng cấu trúc câu phức tạp hơn, từ vựng đa dạng',
@@ -284,7 +902,7 @@ class EnglishTutorAgent:
         return f"""Bạn là một giáo viên tiếng Anh AI thân thiện và kiên nhẫn. 
 
 Học viên của bạn:
-- Trình độ: {self.user_profile['level']} ({level_descriptions[self.user_profile['level']]})
+- Trình độ: {level} ({level_descriptions[level]})
 - Ngôn ngữ mẹ đẻ: Tiếng Việt
 - Mục tiêu: {self.user_profile['goals']}
 
@@ -326,8 +944,10 @@ Phong cách:
         except Exception as e:
             return f"Xin lỗi, có lỗi xảy ra khi trò chuyện: {str(e)}. Vui lòng thử lại hoặc kiểm tra cấu hình."
     
-    def analyze_text(self, text):
-        """Analyze user's English text for errors and improvements using a direct LLM call."""
+    def _build_analysis_request(self, text):
+        """Tạo nội dung và cấu hình generate_content cho việc phân tích text."""
+        import google.generativeai as genai
+
         analysis_prompt = f"""Bạn là chuyên gia phân tích tiếng Anh. Phân tích đoạn text tiếng Anh này của học viên:
 
 Text: "{text}"
@@ -341,56 +961,259 @@ Hãy cung cấp:
 
 Trả lời bằng tiếng Việt để học viên dễ hiểu."""
 
-        try:
-            model_instance = genai.GenerativeModel(self.available_models['balanced']) # Dùng model cân bằng cho phân tích
-            response = model_instance.generate_content(
-                [
-                    {"role": "user", "parts": [{"text": analysis_prompt}]}
-                ],
-                generation_config=genai.GenerationConfig(
-                    temperature=0.3, # Ít sáng tạo, tập trung vào độ chính xác
-                    max_output_tokens=800
-                )
+        contents = [
+            {"role": "user", "parts": [{"text": analysis_prompt}]}
+        ]
+        generation_config = genai.GenerationConfig(**ANALYSIS_GENERATION_CONFIG)
+        return contents, generation_config
+
+    def _build_chunk_analysis_request(self, chunk, prepass):
+        """Tạo nội dung và cấu hình generate_content cho một phần của bài viết dài."""
+        import google.generativeai as genai
+
+        hints = chunk_hints(chunk, prepass)
+        hints_text = (
+            "\nKiểm tra tự động đã thấy các lỗi sau (hãy xác nhận, và tìm cả lỗi khác vì kiểm tra tự động "
+            "không bắt được mọi lỗi):\n" + "\n".join(f"- {hint}" for hint in hints) + "\n"
+        ) if hints else ""
+        chunk_prompt = f"""Bạn là chuyên gia phân tích tiếng Anh. Đây là một phần trong bài viết dài của học viên \
+(trình độ {self.user_profile['level']}):
+
+Text: "{chunk}"
+{hints_text}
+Chỉ phân tích phần này, ngắn gọn:
+1. Lỗi ngữ pháp (nếu có) và cách sửa
+2. Gợi ý từ vựng tốt hơn
+3. Cải thiện cấu trúc câu
+Dòng cuối cùng ghi đúng dạng "Điểm: X/10".
+
+Trả lời bằng tiếng Việt để học viên dễ hiểu."""
+
+        contents = [
+            {"role": "user", "parts": [{"text": chunk_prompt}]}
+        ]
+        generation_config = genai.GenerationConfig(**ANALYSIS_CHUNK_GENERATION_CONFIG)
+        return contents, generation_config
+
+    def _analysis_cache_key(self, text):
+        """Khóa cache cho analyze_text: cùng text (đã chuẩn hóa), tier, trình độ và cấu hình thì dùng lại kết quả."""
+        key = [
+            normalize_text(text),
+            self.model_tier,
+            self.user_profile['level'],
+            ANALYSIS_GENERATION_CONFIG,
+        ]
+        if should_chunk(text):
+            key.append(ANALYSIS_CHUNK_GENERATION_CONFIG)
+        return key
+
+    def _chunk_cache_key(self, chunk, prepass):
+        return [normalize_text(chunk), self.model_tier, self.user_profile['level'], ANALYSIS_CHUNK_GENERATION_CONFIG,
+                chunk_hints(chunk, prepass)]
+
+    def _analyze_chunk(self, chunk, prepass):
+        """Phân tích một phần của bài viết dài; mỗi phần được cache riêng nên sửa một đoạn chỉ phân tích lại đoạn đó."""
+        cache_key = self._chunk_cache_key(chunk, prepass)
+
+        def _generate():
+            contents, generation_config = self._build_chunk_analysis_request(chunk, prepass)
+            return self.model_router.call(
+                TASK_ANALYSIS, len(chunk),
+                lambda model: get_generative_model(model).generate_content(
+                    contents, generation_config=generation_config
+                ).text,
+                self.model_tier,
+                key=make_cache_key('analyze_chunk', cache_key),
+            )
+
+        return get_response_cache().get_or_compute('analyze_chunk', cache_key, _generate)
+
+    async def _aanalyze_chunk(self, chunk, prepass):
+        cache = get_response_cache()
+        cache_key = self._chunk_cache_key(chunk, prepass)
+        cached = cache.get('analyze_chunk', cache_key)
+        if cached is not None:
+            return cached
+        contents, generation_config = self._build_chunk_analysis_request(chunk, prepass)
+
+        async def _generate(model):
+            response = await get_generative_model(model).generate_content_async(
+                contents, generation_config=generation_config
             )
-            
             return response.text
+
+        analysis = await self.model_router.acall(
+            TASK_ANALYSIS, len(chunk), _generate, self.model_tier, key=make_cache_key('analyze_chunk', cache_key)
+        )
+        cache.set('analyze_chunk', cache_key, analysis)
+        return analysis
+
+    def _analyze_chunks(self, plan):
+        """Phân tích song song các phần của bài viết dài; kết quả theo đúng thứ tự các phần."""
+        if not plan.chunks:
+            return []
+        with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_CHUNKS, len(plan.chunks))) as pool:
+            return list(pool.map(self._analyze_chunk, plan.chunks, [plan.prepass] * len(plan.chunks)))
+
+    def analyze_text(self, text):
+        """Analyze user's English text for errors and improvements using a direct LLM call.
+        Long texts are split into parts analyzed in parallel (common mistakes found by the local
+        pre-pass are passed to each part as hints, repeated sentences are analyzed once) and merged
+        into one report with one overall score."""
+        cache_key = self._analysis_cache_key(text)
+
+        def _generate_chunked():
+            plan = AnalysisPlan(text)
+            return merge_report(plan, self._analyze_chunks(plan))
+
+        def _generate():
+            contents, generation_config = self._build_analysis_request(text)
+            return self.model_router.call(
+                TASK_ANALYSIS, len(text),
+                lambda model: get_generative_model(model).generate_content(
+                    contents, generation_config=generation_config
+                ).text,
+                self.model_tier,
+                # Cùng bài viết được gửi đồng thời (nhiều tab, nhiều học viên) chỉ gọi Gemini một lần
+                key=make_cache_key('analyze_text', cache_key),
+            )
+
+        try:
+            return get_response_cache().get_or_compute(
+                'analyze_text', cache_key, _generate_chunked if should_chunk(text) else _generate
+            )
             
         except Exception as e:
             return f"Không thể phân tích text: {str(e)}. Vui lòng thử lại."
+
+    async def aanalyze_text(self, text, user_id=None, raise_errors=False):
+        """Async version of analyze_text, using the shared cache and concurrency limiter.
+        With raise_errors=True, API errors are raised instead of returned as a message
+        (used by batch jobs that retry on rate limits)."""
+        cache = get_response_cache()
+        cache_key = self._analysis_cache_key(text)
+        try:
+            cached = cache.get('analyze_text', cache_key)
+            if cached is not None:
+                return cached
+
+            async def _generate(model):
+                response = await get_generative_model(model).generate_content_async(
+                    contents, generation_config=generation_config
+                )
+                return response.text
+
+            async with get_concurrency_limiter().slot(user_id or id(self)):
+                if should_chunk(text):
+                    plan = AnalysisPlan(text)
+                    analyses = await asyncio.gather(
+                        *(self._aanalyze_chunk(chunk, plan.prepass) for chunk in plan.chunks)
+                    )
+                    analysis = merge_report(plan, analyses)
+                    cache.set('analyze_text', cache_key, analysis)
+                    return analysis
+                contents, generation_config = self._build_analysis_request(text)
+                analysis = await self.model_router.acall(
+                    TASK_ANALYSIS, len(text), _generate, self.model_tier,
+                    key=make_cache_key('analyze_text', cache_key),
+                )
+            cache.set('analyze_text', cache_key, analysis)
+            return analysis
+
+        except Exception as e:
+            if raise_errors:
+                raise
+            return f"Không thể phân tích text: {str(e)}. Vui lòng thử lại."
+
+    def stream_analyze_text(self, text):
+        """Same as analyze_text, but yields the analysis in text chunks as soon as Gemini returns them."""
+        cache = get_response_cache()
+        cache_key = self._analysis_cache_key(text)
+        try:
+            cached = cache.get('analyze_text', cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+            if should_chunk(text):
+                chunks = []
+                for chunk in self._stream_chunked_analysis(AnalysisPlan(text)):
+                    chunks.append(chunk)
+                    yield chunk
+                cache.set('analyze_text', cache_key, "".join(chunks))
+                return
+
+            contents, generation_config = self._build_analysis_request(text)
+
+            def _generate(model):
+                response = get_generative_model(model).generate_content(
+                    contents, generation_config=generation_config, stream=True
+                )
+                return (chunk.text for chunk in response if chunk.text)
+
+            chunks = []
+            for chunk in self.model_router.stream(TASK_ANALYSIS, len(text), _generate, self.model_tier):
+                chunks.append(chunk)
+                yield chunk
+            cache.set('analyze_text', cache_key, "".join(chunks))
+
+        except Exception as e:
+            yield f"Không thể phân tích text: {str(e)}. Vui lòng thử lại."
     
-    def switch_model(self, model_tier='balanced'):
-        """Switch between different model tiers and re-initialize the Chain."""
+    def _stream_chunked_analysis(self, plan):
+        """Các phần của báo cáo theo thứ tự, mỗi phần được yield ngay khi phân tích xong (các phần chạy song song)."""
+        yield report_header(plan)
+        analyses = []
+        if plan.chunks:
+            with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_CHUNKS, len(plan.chunks))) as pool:
+                futures = [pool.submit(self._analyze_chunk, chunk, plan.prepass) for chunk in plan.chunks]
+                for index, (chunk, future) in enumerate(zip(plan.chunks, futures)):
+                    analyses.append(future.result())
+                    yield report_section(index, chunk, analyses[-1])
+        yield report_footer(plan, analyses)
+
+    def switch_model(self, model_tier=TIER_AUTO):
+        """Switch between model tiers. 'auto' lets the router pick a tier per request; a fixed tier is always
+        tried first, with the other tiers as fallbacks. Takes effect on the next call without rebuilding anything."""
+        if model_tier == TIER_AUTO:
+            self.model_tier = TIER_AUTO
+            self.current_model_name = self.available_models['balanced']
+            self.llm = get_chat_llm(self.current_model_name)
+            return "Đã chuyển sang chế độ tự chọn model theo từng yêu cầu (auto)"
         if model_tier in self.available_models:
+            self.model_tier = model_tier
             self.current_model_name = self.available_models[model_tier]
-            self.llm = ChatGoogleGenerativeAI(model=self.current_model_name, temperature=0.3)
-            
-            # Cần khởi tạo lại Chain khi đổi model
-            self._initialize_agent() 
-            
+            self.llm = get_chat_llm(self.current_model_name)
             return f"Đã chuyển sang model: {model_tier} ({self.current_model_name})"
-        return "Model tier không hợp lệ. Chọn: fast, balanced, smart, coding"
+        return f"Model tier không hợp lệ. Chọn: {TIER_AUTO}, {', '.join(self.available_models)}"
     
     
     
     def get_model_info(self):
         """Get information about available models"""
+        descriptions = {
+            TIER_AUTO: 'Tự chọn theo tác vụ, độ dài đầu vào và độ trễ hiện tại của từng model',
+            'fast': 'Nhanh nhất, phù hợp hội thoại',
+            'balanced': 'Cân bằng tốc độ và chất lượng',
+            'smart': 'Thông minh, context dài',
+            'coding': 'Tốt nhất cho giải thích phức tạp',
+        }
         return {
             'current_model': self.current_model_name,
+            'current_tier': self.model_tier,
             'available_models': self.available_models,
             'model_info': {
-                'fast': 'gemini-2.0-flash - Nhanh nhất, phù hợp hội thoại',
-                'balanced': 'gemini-2.0-flash - Cân bằng tốc độ và chất lượng',
-                'smart': 'gemini-2.0-flash - Thông minh, context dài',
-                'coding': 'gemini-2.0-flash - Tốt nhất cho giải thích phức tạp'
+                tier: f"{self.available_models[tier]} - {description}" if tier in self.available_models else description
+                for tier, description in descriptions.items()
+                if tier == TIER_AUTO or tier in self.available_models
             },
+            'model_stats': self.model_router.stats(),
             'cost': 'Phụ thuộc vào gói sử dụng Gemini API của bạn (có thể có tier miễn phí giới hạn).'
         }
     
     def update_user_level(self, new_level):
-        """Update user's English level and re-initialize the Chain (as system prompt depends on level)."""
-        if new_level in ['beginner', 'intermediate', 'advanced']:
+        """Update user's English level. The prompt for every level is precompiled, so no rebuild is needed."""
+        if new_level in USER_LEVELS:
             self.user_profile['level'] = new_level
-            # Cần khởi tạo lại Chain để cập nhật system prompt dựa trên trình độ mới
-            self._initialize_agent()
             return f"Đã cập nhật trình độ thành: {new_level}"
-        return "Trình độ không hợp lệ"
\ No newline at end of file
+        return "Trình độ không hợp lệ"
@@ -0,0 +1,133 @@
+"""Benchmark các loại FAISS index cho RAGTool: recall@k so với exact search, độ trễ mỗi truy vấn,
+kích thước index và thời gian build.
+
+    python benchmarks/bench_ann_index.py --vectors 50000 --queries 500
+    python benchmarks/bench_ann_index.py --from-index data/faiss_index/<key> --json results.json
+
+Mặc định dùng vector tổng hợp dạng cụm (đã chuẩn hóa, 384 chiều như MiniLM) để đo được ở quy mô
+lớn hơn corpus hiện tại; --from-index dùng vector thật của index đã build bằng setup_database.py.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+import numpy as np
+
+from agent.ann_index import AnnIndexConfig, build_ann_index, index_vectors, set_search_params
+
+# (cấu hình build, tham số tìm kiếm cần quét)
+SWEEPS = [
+    (dict(index_type='flat', quantization='none'), []),
+    (dict(index_type='flat', quantization='int8'), []),
+    (dict(index_type='flat', quantization='pq'), []),
+    (dict(index_type='hnsw', quantization='none'), [('ef_search', v) for v in (16, 32, 64, 128)]),
+    (dict(index_type='hnsw', quantization='int8'), [('ef_search', v) for v in (32, 64, 128)]),
+    (dict(index_type='ivf', quantization='none'), [('nprobe', v) for v in (1, 4, 16, 64)]),
+    (dict(index_type='ivf', quantization='int8'), [('nprobe', v) for v in (4, 16, 64)]),
+    (dict(index_type='ivf', quantization='pq'), [('nprobe', v) for v in (4, 16, 64)]),
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def synthetic_vectors(count, dim, clusters, seed):
+    """Vector dạng cụm, chuẩn hóa L2 - gần với phân bố embedding câu hơn là nhiễu đều."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype('float32')
+    labels = rng.integers(0, clusters, size=count)
+    vectors = centers[labels] + 0.35 * rng.normal(size=(count, dim)).astype('float32')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def make_queries(vectors, count, seed):
+    """Truy vấn là các vector trong corpus bị nhiễu nhẹ (giống câu hỏi diễn đạt lại nội dung tài liệu)."""
+    rng = np.random.default_rng(seed + 1)
+    picks = rng.choice(len(vectors), size=count, replace=False)
+    queries = vectors[picks] + 0.05 * rng.normal(size=(count, vectors.shape[1])).astype('float32')
+    faiss.normalize_L2(queries)
+    return queries
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(row_found) & set(row_truth)) for row_found, row_truth in zip(found, truth))
+    return hits / truth.size
+
+
+def measure(name, index, queries, truth, k, build_s):
+    # RAGTool tìm từng câu hỏi một nên đo độ trễ theo từng truy vấn đơn lẻ
+    latencies, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - start)
+        found.append(ids[0])
+    result = {
+        'index': name,
+        'recall_at_k': recall_at_k(np.array(found), truth),
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'size_mb': len(faiss.serialize_index(index)) / 1e6,
+        'build_s': build_s,
+    }
+    print(f"{name:<36} recall@{k}: {result['recall_at_k']:.3f}   p50: {result['p50_ms']:7.3f} ms   "
+          f"p99: {result['p99_ms']:7.3f} ms   size: {result['size_mb']:8.2f} MB   build: {build_s:6.2f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vectors', type=int, default=50_000, help="Số vector tổng hợp.")
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--clusters', type=int, default=200)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--k', type=int, default=3, help="Số chunk RAGTool lấy về mỗi câu hỏi.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--from-index', help="Thư mục index đã build (chứa index.faiss) để dùng vector thật.")
+    parser.add_argument('--only', nargs='*', choices=['flat', 'hnsw', 'ivf'], help="Chỉ chạy các loại index này.")
+    parser.add_argument('--json', help="Ghi kết quả ra file JSON.")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(1)
+    if args.from_index:
+        vectors = index_vectors(faiss.read_index(os.path.join(args.from_index, 'index.faiss')))
+    else:
+        vectors = synthetic_vectors(args.vectors, args.dim, args.clusters, args.seed)
+    queries = make_queries(vectors, min(args.queries, len(vectors)), args.seed)
+    print(f"{len(vectors)} vector x {vectors.shape[1]} chiều, {len(queries)} truy vấn, k={args.k}")
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    results = []
+    for build_params, search_sweep in SWEEPS:
+        if args.only and build_params['index_type'] not in args.only:
+            continue
+        config = AnnIndexConfig(**build_params)
+        start = time.perf_counter()
+        index = exact if config.is_exact else build_ann_index(vectors, config)
+        build_s = 0.0 if config.is_exact else time.perf_counter() - start
+        for param, value in search_sweep or [(None, None)]:
+            if param:
+                setattr(config, param, value)
+                set_search_params(index, config)
+            results.append(measure(config.cache_key, index, queries, truth, args.k, build_s))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'vectors': len(vectors), 'dim': int(vectors.shape[1]), 'k': args.k, 'results': results}, f,
+                      indent=2)
+
+
+if __name__ == "__main__":
+    main()
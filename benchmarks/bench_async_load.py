@@ -0,0 +1,75 @@
+"""Load test cho API async (arun_agent_chat) với LLM giả: đo p50/p99 và throughput
+khi số phiên đồng thời tăng dần.
+
+    python benchmarks/bench_async_load.py --sessions 1 2 4 8 16 32 --turns 5 --latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import register_offline_resources
+
+# Mỗi lượt: một lần gọi tool tài liệu rồi Final Answer (2 lời gọi LLM)
+REACT_RESPONSES = [
+    "Thought: I should check the study material.\nAction: EnglishMaterialSearch\nAction Input: present perfect",
+    "Thought: I now know the final answer\nFinal Answer: Use the present perfect for life experiences.",
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_session(tutor, turns, latencies):
+    for turn in range(turns):
+        start = time.perf_counter()
+        await tutor.arun_agent_chat(f"Question {turn}: when do I use the present perfect?")
+        latencies.append(time.perf_counter() - start)
+
+
+async def run_level(num_sessions, turns):
+    from agent.tutor_agent import EnglishTutorAgent
+
+    tutors = []
+    for _ in range(num_sessions):
+        tutor = EnglishTutorAgent()
+        tutor.agent_executor.verbose = False
+        tutor.use_semantic_cache = False
+        tutors.append(tutor)
+
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_session(tutor, turns, latencies) for tutor in tutors))
+    elapsed = time.perf_counter() - start
+    return latencies, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--turns', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.2, help="Độ trễ mỗi lời gọi LLM giả (s).")
+    args = parser.parse_args()
+
+    register_offline_resources(responses=REACT_RESPONSES, latency=args.latency)
+
+    from utils.helper import get_concurrency_limiter
+
+    limiter = get_concurrency_limiter()
+    print(f"max_concurrency={limiter.max_concurrency}, per_user_limit={limiter.per_user_limit}")
+    print(f"{'sessions':>8} {'requests':>9} {'p50 (ms)':>10} {'p99 (ms)':>10} {'req/s':>8}")
+    for num_sessions in args.sessions:
+        latencies, elapsed = asyncio.run(run_level(num_sessions, args.turns))
+        print(f"{num_sessions:>8} {len(latencies):>9} {statistics.median(latencies) * 1000:>10.1f} "
+              f"{percentile(latencies, 99) * 1000:>10.1f} {len(latencies) / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
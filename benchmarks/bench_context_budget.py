@@ -0,0 +1,136 @@
+"""Phát lại các hội thoại mẫu qua agent (LLM, embedding và Wikipedia giả) và so sánh số token prompt mỗi lượt
+giữa cách cũ (ConversationBufferWindowMemory k=5, kết quả tool giữ nguyên) và ngân sách token hiện tại
+(lịch sử gần nhất + bản tóm tắt, kết quả tool được rút gọn).
+
+    python benchmarks/bench_context_budget.py
+    python benchmarks/bench_context_budget.py --history-tokens 600 --observation-tokens 400 --json budget.json
+
+Mỗi hội thoại trong benchmarks/data/conversations.jsonl là một chuỗi lượt; lượt có "tool" được mô phỏng bằng
+hai lời gọi LLM (Action rồi Final Answer) nên prompt của vòng thứ hai còn chứa cả Observation. Token được ước
+lượng từ độ dài prompt thật gửi tới model (TurnTrace, ~4 ký tự/token), cộng dồn qua các vòng ReAct của lượt.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import (
+    FakeChatModel,
+    FakeWikipediaWrapper,
+    load_jsonl,
+    register_chat_model,
+    register_offline_resources,
+)
+from utils.helper import registry
+
+CONVERSATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'conversations.jsonl')
+
+
+def scripted_responses(conversation):
+    """Các câu trả lời của LLM giả theo đúng thứ tự lời gọi trong hội thoại."""
+    responses = []
+    for turn in conversation['turns']:
+        if turn['tool']:
+            responses.append(f"Thought: I should look this up.\nAction: {turn['tool']}\nAction Input: {turn['tool_input']}")
+        responses.append(f"Thought: I now know the final answer\nFinal Answer: {turn['answer']}")
+    return responses
+
+
+def use_baseline_context(tutor):
+    """Cấu hình như trước khi có ngân sách token: cửa sổ 5 lượt đầy đủ, kết quả tool không rút gọn."""
+    from langchain.memory import ConversationBufferWindowMemory
+
+    tutor.memory = ConversationBufferWindowMemory(memory_key="chat_history", return_messages=True, k=5)
+    for name in ("Wikipedia Search", "EnglishMaterialSearch"):
+        tutor.tool_runners[name].warm_up().max_output_tokens = None
+    tutor._initialize_agent()
+
+
+def replay(conversation, mode, args):
+    from agent.tutor_agent import EnglishTutorAgent
+
+    # Mỗi hội thoại có kịch bản riêng nên LLM giả được đăng ký lại trước khi tạo agent
+    register_chat_model(FakeChatModel(responses=scripted_responses(conversation)))
+    tutor = EnglishTutorAgent()
+    tutor.use_fast_path = False
+    tutor.use_semantic_cache = False
+    if mode == 'baseline':
+        use_baseline_context(tutor)
+    else:
+        tutor.memory.max_history_tokens = args.history_tokens
+        # Tóm tắt ngay trong lượt để kết quả không phụ thuộc thời điểm thread nền chạy xong
+        tutor.memory.summarize_in_background = False
+        for name in ("Wikipedia Search", "EnglishMaterialSearch"):
+            tutor.tool_runners[name].warm_up().max_output_tokens = args.observation_tokens
+
+    turns = []
+    for turn in conversation['turns']:
+        answer = tutor.run_agent_chat(turn['input'])
+        if tutor.last_turn['error'] or answer != turn['answer']:
+            raise RuntimeError(f"Lượt phát lại không khớp kịch bản ({conversation['id']}): {answer[:200]}")
+        turns.append({
+            'prompt_tokens': tutor.last_turn['prompt_tokens'],
+            'llm_calls': len(tutor.last_turn['llm_calls']),
+        })
+    return turns, tutor.static_prompt_tokens
+
+
+def summarize(mode, results):
+    per_turn = [turn['prompt_tokens'] for turns in results for turn in turns]
+    per_call = [turn['prompt_tokens'] / turn['llm_calls'] for turns in results for turn in turns]
+    by_index = {}
+    for turns in results:
+        for index, turn in enumerate(turns, 1):
+            by_index.setdefault(index, []).append(turn['prompt_tokens'])
+    return {
+        'mode': mode,
+        'turns': len(per_turn),
+        'prompt_tokens_per_turn': statistics.mean(per_turn),
+        'prompt_tokens_per_call': statistics.mean(per_call),
+        'p95_prompt_tokens_per_turn': sorted(per_turn)[min(len(per_turn) - 1, int(0.95 * len(per_turn)))],
+        'by_turn_index': {index: statistics.mean(values) for index, values in sorted(by_index.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--conversations', default=CONVERSATIONS)
+    parser.add_argument('--history-tokens', type=int, default=800, help="Ngân sách token cho lịch sử nguyên văn.")
+    parser.add_argument('--observation-tokens', type=int, default=600, help="Ngân sách token cho mỗi kết quả tool.")
+    parser.add_argument('--wikipedia-chars', type=int, default=2000,
+                        help="doc_content_chars_max của Wikipedia giả (ứng dụng mặc định dùng 500).")
+    parser.add_argument('--json', help="Ghi kết quả ra file JSON.")
+    args = parser.parse_args()
+
+    register_offline_resources()
+    registry.register('wikipedia_wrapper', FakeWikipediaWrapper(args.wikipedia_chars))
+    conversations = load_jsonl(args.conversations)
+
+    results = {}
+    for mode in ('baseline', 'budgeted'):
+        replays = [replay(conversation, mode, args) for conversation in conversations]
+        results[mode] = summarize(mode, [turns for turns, _ in replays])
+        results[mode]['static_prompt_tokens'] = replays[0][1]
+
+    baseline, budgeted = results['baseline'], results['budgeted']
+    print(f"{len(conversations)} hội thoại, {baseline['turns']} lượt; phần tĩnh của prompt: "
+          f"{budgeted['static_prompt_tokens']} token (giống nhau ở mọi lượt, có thể được cache)")
+    print(f"{'lượt':>5} {'trước':>9} {'sau':>9} {'giảm':>7}")
+    for index, before in baseline['by_turn_index'].items():
+        after = budgeted['by_turn_index'][index]
+        print(f"{index:>5} {before:>9.0f} {after:>9.0f} {1 - after / before:>7.1%}")
+    for key, label in (('prompt_tokens_per_turn', 'token prompt/lượt'), ('prompt_tokens_per_call', 'token prompt/lời gọi'),
+                       ('p95_prompt_tokens_per_turn', 'p95 token prompt/lượt')):
+        print(f"{label:<24} trước: {baseline[key]:8.0f}   sau: {budgeted[key]:8.0f}   "
+              f"giảm {1 - budgeted[key] / baseline[key]:.1%}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Benchmark ConversationStore: độ trễ ghi một lượt và đọc cửa sổ lịch sử khi đã có nhiều lượt được lưu.
+
+    python benchmarks/bench_conversation_store.py --turns 100000 --samples 1000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db_manager import ConversationStore
+
+HUMAN_TEXT = "Can you explain when I should use the present perfect instead of the past simple?"
+AI_TEXT = "Sure! We use the present perfect for experiences and for actions that continue until now. " * 3
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def report(name, samples):
+    print(f"{name:<22} p50: {statistics.median(samples) * 1000:7.3f} ms   "
+          f"p99: {percentile(samples, 99) * 1000:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--turns', type=int, default=100_000, help="Số lượt (user + AI) nạp sẵn.")
+    parser.add_argument('--sessions', type=int, default=5_000)
+    parser.add_argument('--samples', type=int, default=1_000)
+    parser.add_argument('--window', type=int, default=10, help="Số tin nhắn đọc mỗi lượt (k=5 -> 10).")
+    parser.add_argument('--db', help="File SQLite (mặc định: file tạm).")
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'conversations.sqlite3')
+    store = ConversationStore(db_path)
+    sessions = [(f"user-{i % 1000}", f"session-{i}") for i in range(args.sessions)]
+
+    start = time.perf_counter()
+    for turn in range(args.turns):
+        user_id, session_id = sessions[turn % len(sessions)]
+        store.append(user_id, session_id, [('human', HUMAN_TEXT), ('ai', AI_TEXT)])
+    elapsed = time.perf_counter() - start
+    print(f"Nạp {args.turns} lượt ({store.count()} tin nhắn) trong {elapsed:.1f}s "
+          f"({args.turns / elapsed:.0f} lượt/s) - {db_path}")
+
+    write_times, read_times = [], []
+    for _ in range(args.samples):
+        user_id, session_id = random.choice(sessions)
+        start = time.perf_counter()
+        store.recent_messages(session_id, args.window)
+        read_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        store.append(user_id, session_id, [('human', HUMAN_TEXT), ('ai', AI_TEXT)])
+        write_times.append(time.perf_counter() - start)
+
+    report("append turn", write_times)
+    report(f"read window ({args.window})", read_times)
+
+
+if __name__ == "__main__":
+    main()
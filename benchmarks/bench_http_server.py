@@ -0,0 +1,292 @@
+"""Tạo tải cho server HTTP (run_app.py serve) với 1..N worker process: request/giây, độ trễ p50/p95, hiệu quả
+mở rộng so với 1 worker, và bộ nhớ của cả nhóm process (tổng RSS so với tổng PSS - phần dùng chung như FAISS index
+mmap và model nạp trước khi fork chỉ được tính một lần trong PSS).
+
+    python benchmarks/bench_http_server.py
+    python benchmarks/bench_http_server.py --workers 1 2 4 8 --clients 4 --threads 8 --duration 15 --json http.json
+
+Server chạy offline trong process con: FAISS index tổng hợp (--chunks chunk, vector 384 chiều) được lưu ra thư mục
+tạm rồi đọc bằng mmap, embedding và LLM giả (--latency giây mỗi lời gọi). Tải gồm /retrieve (tốn CPU: embed, FAISS,
+BM25), /chat và /analyze (chủ yếu chờ LLM) theo tỉ lệ --mix. Client chạy trên cùng máy nên chiếm một phần CPU: số
+liệu mở rộng chỉ có ý nghĩa khi máy có nhiều core hơn số worker.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import load_jsonl
+
+ESSAYS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'essays.jsonl')
+RAG_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'rag_corpus')
+EMBEDDING_DIM = 384
+QUERIES = [
+    "present perfect", "past simple irregular verbs", "formal email greeting", "since and for",
+    "question word order", "articles a an the", "future with going to", "phrasal verbs with get",
+]
+
+
+def corpus_sentences():
+    from agent.essay_analysis import split_sentences
+
+    sentences = [sentence for essay in load_jsonl(ESSAYS) for sentence in split_sentences(essay['text'])]
+    for name in sorted(os.listdir(RAG_CORPUS)):
+        with open(os.path.join(RAG_CORPUS, name), encoding='utf-8') as f:
+            sentences.extend(split_sentences(f.read().replace('#', ' ')))
+    return sentences
+
+
+def build_index(path, chunks, seed=0):
+    """FAISS index tổng hợp: mỗi chunk ghép vài câu ngẫu nhiên của corpus mẫu, vector dạng cụm đã chuẩn hóa."""
+    from langchain_community.embeddings import FakeEmbeddings
+    from langchain_community.vectorstores import FAISS
+
+    from benchmarks.bench_ann_index import synthetic_vectors
+
+    rng = random.Random(seed)
+    sentences = corpus_sentences()
+    texts = [" ".join(rng.sample(sentences, 4)) + f" (Unit {i})" for i in range(chunks)]
+    vectors = synthetic_vectors(chunks, EMBEDDING_DIM, clusters=max(1, chunks // 100), seed=seed)
+    metadatas = [{'source': f"unit-{i // 50}.md"} for i in range(chunks)]
+    vectorstore = FAISS.from_embeddings(zip(texts, vectors.tolist()), FakeEmbeddings(size=EMBEDDING_DIM),
+                                        metadatas=metadatas)
+    vectorstore.save_local(path)
+
+
+def run_server(args):
+    """Process server: nạp index (mmap) và tài nguyên giả vào registry rồi chạy agent.server.serve."""
+    from langchain_community.embeddings import FakeEmbeddings
+    from langchain_community.vectorstores import FAISS
+
+    from agent.ann_index import read_index_mmap
+    from agent.retrieval import HybridRetriever
+    from agent.server import SHARED_RESOURCES, serve
+    from benchmarks.fakes import FakeChatModel, FakeGenerativeModel, register_chat_model, register_generative_model
+    from utils.helper import registry
+
+    embedding_model = FakeEmbeddings(size=EMBEDDING_DIM)
+    vectorstore = FAISS.load_local(args.index_dir, embedding_model, allow_dangerous_deserialization=True)
+    if not args.no_mmap:
+        vectorstore.index = read_index_mmap(os.path.join(args.index_dir, 'index.faiss'))
+    registry.register('genai_config', 'offline')
+    registry.register('embedding_model', embedding_model)
+    registry.register('vectorstore', vectorstore)
+    registry.register('hybrid_retriever', HybridRetriever(vectorstore))
+    registry.register('rag_index_key', 'bench-http')
+
+    def _register_fakes():
+        # Mỗi worker có LLM giả riêng (như client LLM thật được tạo lại sau fork)
+        registry.register('knowledge_pack', None)
+        register_chat_model(FakeChatModel(latency=args.latency))
+        register_chat_model(FakeChatModel(latency=args.latency), temperature=0.0)
+        register_generative_model(FakeGenerativeModel(latency=args.latency))
+
+    serve('127.0.0.1', args.port, args.server_workers, shared=SHARED_RESOURCES, worker_init=_register_fakes)
+
+
+def wait_ready(port, timeout=300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server ở port {port} không sẵn sàng sau {timeout}s")
+
+
+def process_tree(pid):
+    """pid của server và các worker con."""
+    pids = [pid]
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            pids += [int(child) for child in f.read().split()]
+    except OSError:
+        pass
+    return pids
+
+
+def memory_mb(pids):
+    """(tổng RSS, tổng PSS) MB của các process, đọc từ /proc/<pid>/smaps_rollup (Linux)."""
+    rss = pss = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/smaps_rollup') as f:
+                for line in f:
+                    name, _, value = line.partition(':')
+                    if name == 'Rss':
+                        rss += int(value.split()[0])
+                    elif name == 'Pss':
+                        pss += int(value.split()[0])
+        except OSError:
+            return None, None
+    return rss / 1024, pss / 1024
+
+
+def parse_mix(mix):
+    endpoints = []
+    for part in mix.split(','):
+        name, _, weight = part.partition(':')
+        endpoints += [name.strip()] * int(weight or 1)
+    return endpoints
+
+
+def request_body(endpoint, rng, client_id, counter):
+    if endpoint == 'retrieve':
+        return {'query': rng.choice(QUERIES), 'k': 3}
+    if endpoint == 'chat':
+        # Mỗi luồng client là một phiên; request của một phiên có thể rơi vào bất kỳ worker nào
+        return {'message': f"Can you explain {rng.choice(QUERIES)}? ({counter})",
+                'session_id': f"bench-{client_id}", 'level': 'intermediate'}
+    # Số thứ tự khác nhau để không lấy kết quả từ cache phân tích
+    return {'text': f"Yesterday I go to school and my friends is happy. Essay number {client_id}-{counter}."}
+
+
+def client_worker(task):
+    """Một process client: `threads` luồng, mỗi luồng giữ một kết nối keep-alive và gửi request tới hết giờ."""
+    import threading
+
+    port, duration, threads, endpoints, client_id = task
+    deadline = time.perf_counter() + duration
+    samples = []
+    lock = threading.Lock()
+
+    def _run(thread_id):
+        rng = random.Random(f"{client_id}-{thread_id}")
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        counter = 0
+        while time.perf_counter() < deadline:
+            counter += 1
+            endpoint = rng.choice(endpoints)
+            body = json.dumps(request_body(endpoint, rng, f"{client_id}-{thread_id}", counter))
+            start = time.perf_counter()
+            try:
+                conn.request('POST', f'/{endpoint}', body=body, headers={'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+                status = 0
+            with lock:
+                samples.append((endpoint, status, time.perf_counter() - start))
+
+    pool = [threading.Thread(target=_run, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return samples
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))] if ordered else None
+
+
+def run(workers, args, port):
+    env = {**os.environ, 'GOOGLE_API_KEY': os.getenv('GOOGLE_API_KEY', 'offline'),
+           'TUTOR_CONVERSATION_DB': os.path.join(args.tmp_dir, f'conversations-{workers}.sqlite3')}
+    command = [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(port),
+               '--server-workers', str(workers), '--index-dir', args.index_dir, '--latency', str(args.latency)]
+    if args.no_mmap:
+        command.append('--no-mmap')
+    server = subprocess.Popen(command, env=env)
+    try:
+        wait_ready(port)
+        endpoints = parse_mix(args.mix)
+        tasks = [(port, args.duration, args.threads, endpoints, client) for client in range(args.clients)]
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.clients) as pool:
+            samples = [sample for result in pool.map(client_worker, tasks) for sample in result]
+        elapsed = time.perf_counter() - start
+        rss, pss = memory_mb(process_tree(server.pid))
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+    ok = [latency for _, status, latency in samples if status == 200]
+    by_endpoint = {}
+    for endpoint in sorted(set(endpoints)):
+        latencies = [latency for name, status, latency in samples if name == endpoint and status == 200]
+        by_endpoint[endpoint] = {'requests': len(latencies), 'p50_ms': (percentile(latencies, 50) or 0) * 1000}
+    return {
+        'workers': workers,
+        'requests': len(samples),
+        'errors': len(samples) - len(ok),
+        'req_per_s': len(ok) / elapsed,
+        'p50_ms': (percentile(ok, 50) or 0) * 1000,
+        'p95_ms': (percentile(ok, 95) or 0) * 1000,
+        'rss_mb': rss,
+        'pss_mb': pss,
+        'endpoints': by_endpoint,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help="Số worker cần đo (mặc định 1, 2, 4... tới số core).")
+    parser.add_argument('--clients', type=int, default=2, help="Số process client tạo tải.")
+    parser.add_argument('--threads', type=int, default=8, help="Số luồng (kết nối) mỗi process client.")
+    parser.add_argument('--duration', type=float, default=10.0, help="Số giây tạo tải cho mỗi cấu hình.")
+    parser.add_argument('--chunks', type=int, default=50000, help="Số chunk của FAISS index tổng hợp.")
+    parser.add_argument('--latency', type=float, default=0.2, help="Giây mỗi lời gọi LLM giả.")
+    parser.add_argument('--mix', default='retrieve:6,chat:2,analyze:2', help="Tỉ lệ endpoint, dạng tên:trọng số.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--no-mmap', action='store_true', help="Đọc FAISS index vào RAM thay vì mmap.")
+    parser.add_argument('--json', help="Ghi kết quả ra file JSON.")
+    # Dùng nội bộ: chạy chính script này làm process server
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--server-workers', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--index-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        run_server(args)
+        return
+
+    cores = os.cpu_count() or 1
+    workers_list = args.workers or sorted({1, *[2 ** i for i in range(1, cores.bit_length()) if 2 ** i <= cores], cores})
+    with tempfile.TemporaryDirectory(prefix='bench-http-') as tmp_dir:
+        args.tmp_dir = tmp_dir
+        args.index_dir = os.path.join(tmp_dir, 'index')
+        start = time.perf_counter()
+        build_index(args.index_dir, args.chunks)
+        index_mb = os.path.getsize(os.path.join(args.index_dir, 'index.faiss')) / 2 ** 20
+        print(f"Index {args.chunks} chunk ({index_mb:.0f} MB) dựng trong {time.perf_counter() - start:.1f}s; "
+              f"{cores} core, {args.clients}x{args.threads} kết nối, {args.duration:g}s mỗi cấu hình, "
+              f"{'không mmap' if args.no_mmap else 'mmap'}")
+        print(f"{'worker':>6} {'req/s':>8} {'hiệu quả':>9} {'p50':>8} {'p95':>8} {'lỗi':>5} {'RSS':>8} {'PSS':>8}")
+        results = []
+        for i, workers in enumerate(workers_list):
+            result = run(workers, args, args.port + i)
+            base = results[0]['req_per_s'] if results else result['req_per_s']
+            result['scaling_efficiency'] = result['req_per_s'] / (base * workers / workers_list[0]) if base else None
+            results.append(result)
+            memory = (f"{result['rss_mb']:>7.0f}M {result['pss_mb']:>7.0f}M" if result['rss_mb'] is not None
+                      else f"{'-':>8} {'-':>8}")
+            print(f"{workers:>6} {result['req_per_s']:>8.1f} {result['scaling_efficiency']:>8.0%} "
+                  f"{result['p50_ms']:>6.0f}ms {result['p95_ms']:>6.0f}ms {result['errors']:>5} {memory}")
+
+    if cores < max(workers_list):
+        print(f"Lưu ý: máy chỉ có {cores} core, cấu hình nhiều worker hơn số core không thể mở rộng tuyến tính.")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
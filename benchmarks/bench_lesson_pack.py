@@ -0,0 +1,181 @@
+"""Gói bài học soạn sẵn: chi phí build (và build lại khi tài liệu đổi), tỉ lệ câu hỏi được trả lời từ gói,
+số lời gọi LLM và độ trễ mỗi lượt khi tắt/bật gói.
+
+    python benchmarks/bench_lesson_pack.py
+    python benchmarks/bench_lesson_pack.py --latency 0.5 --gen-latency 0.2 --json lesson_pack.json
+
+Chạy trên bản sao của docs/ với embedding tất định và LLM giả (--latency giây mỗi lời gọi khi trả lời,
+--gen-latency giây mỗi bài khi build). Lần build thứ hai không đổi gì, lần thứ ba sau khi thêm một lỗi vào mục Common
+Mistakes trong doc.txt: chỉ các chủ đề có đoạn tài liệu nguồn thay đổi mới được soạn lại.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import ReplayChatModel, register_chat_model, register_offline_resources
+from utils.helper import registry
+
+LEVELS = ('beginner', 'intermediate')
+# (câu hỏi, cách trả lời mong đợi khi bật gói: served / grounded / agent)
+QUESTIONS = [
+    ("Explain the present perfect", 'served'),
+    ("What is the past continuous?", 'served'),
+    ("When do I use going to?", 'served'),
+    ("Giải thích thì hiện tại đơn", 'served'),
+    ("Give me some exercises on irregular verbs", 'served'),
+    ("What are articles?", 'served'),
+    ("How do I use should and must?", 'served'),
+    ("Tell me about question formation", 'served'),
+    ("What's subject-verb agreement?", 'served'),
+    ("How to use the present continuous for future arrangements", 'served'),
+    ("What is the difference between the present perfect and the past simple?", 'grounded'),
+    ("Is it correct to say 'I have seen him yesterday' in the present perfect?", 'grounded'),
+    ("Why do we say an hour? Articles are confusing", 'grounded'),
+    ("Can you give me examples of the past continuous and past simple together?", 'grounded'),
+    ("Which is right for habits, present simple or present continuous?", 'grounded'),
+    ("Tell me about the history of London", 'agent'),
+    ("Who was William Shakespeare?", 'agent'),
+    ("Search the class notes for adjectives", 'agent'),
+    ("What's the weather like in Hanoi?", 'agent'),
+    ("I want to improve my speaking for job interviews", 'agent'),
+]
+DOC_EDIT = ("- Correct: I go to school every day.",
+            "- Correct: I go to school every day.\n- Using the past simple with 'yesterday' in present perfect "
+            "sentences.\n- Example (wrong): I have seen him yesterday.\n- Correct: I saw him yesterday.")
+
+
+def fake_generator(latency, calls):
+    def generate(prompt):
+        calls.append(prompt)
+        time.sleep(latency)
+        title = prompt.split('"')[1]
+        level = prompt.split("trình độ ")[1].split(':')[0]
+        return (f"EXPLANATION:\n{title} ({level}): cách dùng, cấu trúc và ví dụ.\n"
+                f"EXERCISES:\n1. Complete the sentence.\nĐáp án: 1. ...", 'fake-model')
+    return generate
+
+
+def build(pack, docs_dir, latency, force=False):
+    from langchain_community.embeddings import DeterministicFakeEmbedding
+
+    from agent.ingestion import compute_index_key
+    from agent.lesson_pack import build_lesson_pack, load_topics
+
+    # Index được build lại từ docs_dir để lần sửa tài liệu thay đổi đúng các chunk tương ứng
+    register_offline_resources(docs_dir=docs_dir, embedding_model=DeterministicFakeEmbedding(size=384))
+    calls = []
+    report = build_lesson_pack(pack, load_topics(), registry.get('hybrid_retriever', lambda: None),
+                               fake_generator(latency, calls), compute_index_key(docs_dir))
+    report['llm_calls'] = len(calls)
+    return report
+
+
+def ask(question, level, use_lesson_pack):
+    from agent.tutor_agent import EnglishTutorAgent
+
+    tutor = EnglishTutorAgent()
+    tutor.user_profile['level'] = level
+    tutor.use_lesson_pack = use_lesson_pack
+    start = time.perf_counter()
+    tutor.run_agent_chat(question)
+    elapsed = time.perf_counter() - start
+    turn = tutor.last_turn
+    return {'route': turn['route'], 'llm_calls': len(turn['llm_calls']), 'latency_s': elapsed}
+
+
+def run_questions(use_lesson_pack):
+    results = []
+    for question, expected in QUESTIONS:
+        for level in LEVELS:
+            result = ask(question, level, use_lesson_pack)
+            results.append({'question': question, 'level': level, 'expected': expected, **result})
+    return results
+
+
+def summarize(results):
+    latencies = sorted(result['latency_s'] for result in results)
+    routes = {}
+    for result in results:
+        routes[result['route']] = routes.get(result['route'], 0) + 1
+    return {
+        'turns': len(results),
+        'routes': routes,
+        'served_ratio': routes.get('lesson_pack', 0) / len(results),
+        'llm_calls': sum(result['llm_calls'] for result in results),
+        'latency_mean_s': statistics.mean(latencies),
+        'latency_p50_s': latencies[len(latencies) // 2],
+        'latency_p95_s': latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.3, help="Giây mỗi lời gọi LLM giả khi trả lời.")
+    parser.add_argument('--gen-latency', type=float, default=0.05, help="Giây mỗi bài khi build gói.")
+    parser.add_argument('--json', help="Ghi kết quả ra file JSON.")
+    args = parser.parse_args()
+
+    from agent.ingestion import DOCS_DIR, compute_index_key
+    from database.db_manager import LessonPack
+
+    work_dir = tempfile.mkdtemp(prefix='lesson-pack-')
+    docs_dir = os.path.join(work_dir, 'docs')
+    shutil.copytree(DOCS_DIR, docs_dir)
+    pack = LessonPack(os.path.join(work_dir, 'lesson_pack.sqlite3'))
+
+    builds = {}
+    builds['initial'] = build(pack, docs_dir, args.gen_latency)
+    builds['unchanged'] = build(pack, docs_dir, args.gen_latency)
+    doc_path = os.path.join(docs_dir, 'doc.txt')
+    with open(doc_path, encoding='utf-8') as f:
+        text = f.read()
+    with open(doc_path, 'w', encoding='utf-8') as f:
+        f.write(text.replace(*DOC_EDIT))
+    builds['doc_edited'] = build(pack, docs_dir, args.gen_latency)
+
+    print(f"{'build':<12} {'bài soạn':>9} {'giữ nguyên':>11} {'lời gọi LLM':>12} {'thời gian':>10}")
+    for name, report in builds.items():
+        print(f"{name:<12} {report['generated']:>9} {report['unchanged']:>11} {report['llm_calls']:>12} "
+              f"{report['elapsed_s']:>9.2f}s" + (f"  lỗi: {report['failed']}" if report['failed'] else ""))
+
+    turns = [
+        {'input': question, 'tool': "English Material Search", 'tool_input': question,
+         'answer': f"Here is what the class notes say about: {question}"}
+        for question, _ in QUESTIONS
+    ]
+    register_chat_model(ReplayChatModel(turns=turns, latency=args.latency))
+    runs = {}
+    registry.register('lesson_pack', LessonPack(pack.db_path, index_key=compute_index_key(docs_dir)))
+    runs['pack_off'] = run_questions(use_lesson_pack=False)
+    runs['pack_on'] = run_questions(use_lesson_pack=True)
+
+    expected_routes = {'served': 'lesson_pack', 'grounded': 'lesson_grounded', 'agent': 'agent'}
+    mismatches = [result for result in runs['pack_on'] if result['route'] != expected_routes[result['expected']]]
+    summaries = {name: summarize(results) for name, results in runs.items()}
+    print(f"\n{'cách':<9} {'lượt':>5} {'từ gói':>7} {'căn cứ':>7} {'agent':>6} {'lời gọi LLM':>12} "
+          f"{'trung bình':>11} {'p50':>7} {'p95':>7}")
+    for name, summary in summaries.items():
+        routes = summary['routes']
+        print(f"{name:<9} {summary['turns']:>5} {routes.get('lesson_pack', 0):>7} {routes.get('lesson_grounded', 0):>7} "
+              f"{routes.get('agent', 0):>6} {summary['llm_calls']:>12} {summary['latency_mean_s']:>10.2f}s "
+              f"{summary['latency_p50_s']:>6.2f}s {summary['latency_p95_s']:>6.2f}s")
+    print(f"Tỉ lệ trả lời thẳng từ gói: {summaries['pack_on']['served_ratio']:.0%}; "
+          f"route khác mong đợi: {len(mismatches)}")
+    for result in mismatches:
+        print(f"  {result['level']}: {result['question']!r} -> {result['route']} (mong đợi {result['expected']})")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'builds': builds, 'summaries': summaries, 'runs': runs}, f, indent=2, ensure_ascii=False)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
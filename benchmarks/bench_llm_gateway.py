@@ -0,0 +1,142 @@
+"""Throughput thực tế dưới quota: nhiều luồng gọi Gemini (server giả lập cục bộ có độ trễ và trả 429 khi vượt quota)
+trực tiếp qua ChatGoogleGenerativeAI như trước, so với qua LLMGateway (token bucket, thử lại có jitter, circuit
+breaker, gộp yêu cầu trùng). Đo số câu trả lời thành công mỗi giây, số request thật tới server, số 429, số lỗi
+trả về người gọi và độ trễ p50/p95.
+
+    python benchmarks/bench_llm_gateway.py
+    python benchmarks/bench_llm_gateway.py --requests 300 --threads 32 --quota 20 --window 2 --json gateway.json
+
+Quota thu nhỏ: --quota request mỗi --window giây cho mỗi model (mặc định 20 request / 2 giây, tức 600 RPM).
+--duplicates là tỉ lệ yêu cầu trùng một trong vài câu hỏi phổ biến (nhiều học viên hỏi cùng một câu).
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_gemini_server import StubGemini, start_stub_server
+from utils.helper import registry
+
+MODEL = 'gemini-2.0-flash'
+POPULAR_QUESTIONS = [
+    "When do I use the present perfect?",
+    "What is the difference between make and do?",
+    "How do I write a formal email?",
+]
+
+
+def build_prompts(requests, duplicates):
+    """Yêu cầu thứ i trùng một câu hỏi phổ biến nếu rơi vào tỉ lệ --duplicates, còn lại là câu hỏi riêng."""
+    every = round(1 / duplicates) if duplicates else 0
+    return [
+        POPULAR_QUESTIONS[i % len(POPULAR_QUESTIONS)] if every and i % every == 0 else f"Question {i}: explain tense {i}"
+        for i in range(requests)
+    ]
+
+
+def run(mode, llm, stub, prompts, threads, args):
+    from agent.llm_gateway import LLMGateway
+
+    stub.reset()
+    gateway = None
+    model = llm
+    if mode == 'gateway':
+        # Giữ tốc độ dưới quota: burst token đầu cộng tốc độ nạp không vượt quota trong một cửa sổ
+        rate_per_window = max(1, args.quota - args.burst)
+        gateway = LLMGateway(requests_per_minute=rate_per_window / args.window * 60, burst=args.burst,
+                             max_retries=args.retries, base_delay=args.window / 4, max_delay=args.window * 2)
+        model = gateway.chat_model(llm, MODEL)
+
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def _one(prompt):
+        start = time.perf_counter()
+        try:
+            model.invoke(prompt)
+        except Exception as e:
+            with lock:
+                errors.append(type(e).__name__)
+            return
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(_one, prompts))
+    elapsed = time.perf_counter() - start
+
+    ordered = sorted(latencies)
+    return {
+        'mode': mode,
+        'requests': len(prompts),
+        'succeeded': len(latencies),
+        'errors': len(errors),
+        'elapsed_s': elapsed,
+        'effective_per_s': len(latencies) / elapsed,
+        'upstream_requests': stub.counts['requests'],
+        'upstream_429': stub.counts['429'],
+        'p50_ms': statistics.median(ordered) * 1000 if ordered else None,
+        'p95_ms': ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] * 1000 if ordered else None,
+        'gateway': gateway.stats() if gateway else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--quota', type=int, default=20, help="Số request được phép mỗi cửa sổ quota.")
+    parser.add_argument('--window', type=float, default=2.0, help="Độ dài cửa sổ quota (giây).")
+    parser.add_argument('--latency', type=float, default=0.05, help="Giây xử lý mỗi request ở server giả.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Tỉ lệ request server giả trả 503.")
+    parser.add_argument('--duplicates', type=float, default=0.3, help="Tỉ lệ yêu cầu trùng câu hỏi phổ biến.")
+    parser.add_argument('--burst', type=int, default=2, help="Độ dài burst của token bucket.")
+    parser.add_argument('--retries', type=int, default=4, help="Số lần thử lại của gateway.")
+    parser.add_argument('--modes', nargs='+', choices=['client', 'gateway'], default=['client', 'gateway'])
+    parser.add_argument('--json', help="Ghi kết quả ra file JSON.")
+    args = parser.parse_args()
+
+    stub = StubGemini(rpm=args.quota, latency=args.latency, error_rate=args.error_rate, window_s=args.window)
+    server, endpoint = start_stub_server(stub)
+    os.environ['TUTOR_GEMINI_ENDPOINT'] = endpoint
+    os.environ.setdefault('GOOGLE_API_KEY', 'stub-key')
+    registry.clear()
+    # Client LangChain tự thử lại 429 một lần và log mỗi lần; số 429 đã được đếm ở server
+    logging.getLogger('langchain_google_genai').setLevel(logging.ERROR)
+
+    from utils.helper import get_chat_llm
+
+    llm = get_chat_llm(MODEL)
+    prompts = build_prompts(args.requests, args.duplicates)
+    print(f"{args.requests} yêu cầu, {args.threads} luồng, quota {args.quota} request / {args.window:g}s "
+          f"({args.quota / args.window:.1f}/s), {args.duplicates:.0%} trùng")
+    results = []
+    for mode in args.modes:
+        result = run(mode, llm, stub, prompts, args.threads, args)
+        results.append(result)
+        latency = (f"p50 {result['p50_ms']:7.1f}  p95 {result['p95_ms']:7.1f} ms" if result['p50_ms'] is not None
+                   else "không có yêu cầu thành công")
+        print(f"  {mode:<8} thành công {result['succeeded']:4d}/{result['requests']}  lỗi {result['errors']:4d}  "
+              f"{result['effective_per_s']:6.2f} câu trả lời/s  request tới server {result['upstream_requests']:4d}  "
+              f"429: {result['upstream_429']:4d}  {latency}")
+        if result['gateway']:
+            stats = result['gateway']
+            print(f"  {'':<8} gộp {stats['coalesced']}  thử lại {stats['retries']}  "
+                  f"bị breaker từ chối {stats['rejected']}")
+    server.shutdown()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""So sánh phân tích bài viết dài bằng một lời gọi (như trước) với phân tích theo phần song song, có và không có bước
+kiểm tra cục bộ (gợi ý lỗi phổ biến cho LLM, bỏ câu lặp lại): độ trễ, token đầu vào/đầu ra trên 1.000 từ, số lời gọi
+LLM và số câu trả lời bị cắt ở max_output_tokens.
+
+    python benchmarks/bench_long_analysis.py
+    python benchmarks/bench_long_analysis.py --words 500 1000 2000 --ttft 0.5 --tokens-per-s 80 --json analysis.json
+
+Hai kịch bản: 'unique' là bài không có câu nào lặp lại (các bài mẫu trong benchmarks/data/essays.jsonl, nối thêm câu
+sinh ngẫu nhiên có seed, khoảng 15% câu mắc lỗi chia động từ) như bài viết thật; 'repeated' ghép lặp lại chính các
+bài mẫu nên mọi câu sau vòng đầu là câu lặp nguyên văn, để đo riêng hiệu quả của việc bỏ câu lặp.
+
+LLM giả trả lời dài tỉ lệ với phần text được gửi (tối đa max_output_tokens của lời gọi), thời gian trả lời = thời
+gian tới token đầu + số token / tốc độ sinh token, nên đo được cả hiệu quả song song lẫn việc câu trả lời một lời gọi
+bị cắt.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_replay import reset_caches
+from benchmarks.fakes import load_jsonl, register_generative_model, register_offline_resources
+
+ESSAYS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'essays.jsonl')
+MODES = ('single', 'chunked', 'chunked_no_prepass')
+SCENARIOS = ('unique', 'repeated')
+SENTENCES_PER_PARAGRAPH = 6
+MISTAKE_RATE = 0.15
+
+# (chủ ngữ, ngôi thứ ba số ít?) và (động từ nguyên mẫu, dạng -s, tân ngữ) cho câu sinh thêm
+SUBJECTS = [
+    ("He", True), ("She", True), ("My brother", True), ("Our teacher", True), ("The new manager", True),
+    ("My best friend", True), ("A tourist from Japan", True), ("The bus driver", True),
+    ("I", False), ("We", False), ("They", False), ("My parents", False), ("The students in my class", False),
+    ("Many people in my city", False), ("My classmates", False), ("Most tourists", False),
+]
+VERB_PHRASES = [
+    ("visit", "visits", ("the old market", "their grandparents", "the history museum")),
+    ("cook", "cooks", ("fried rice", "a big dinner for the family", "fresh fish from the river")),
+    ("read", "reads", ("English novels", "the morning newspaper", "short stories on the train")),
+    ("watch", "watches", ("football matches", "documentaries about nature", "the evening news")),
+    ("study", "studies", ("new vocabulary", "grammar for the exam", "the history of the city")),
+    ("write", "writes", ("long emails to colleagues", "a diary in English", "reports for the office")),
+    ("play", "plays", ("badminton in the park", "the guitar with friends", "chess with the neighbours")),
+    ("take", "takes", ("the bus to work", "photos of the old town", "a short walk by the lake")),
+]
+TIMES = ["every Sunday", "after work", "in the evening", "before breakfast", "on rainy days",
+         "during the summer holiday", "twice a week", "at the weekend"]
+
+
+class SizedGenerativeModel:
+    """genai.GenerativeModel giả: câu trả lời dài `output_ratio` lần phần bài viết trong prompt, cắt ở
+    max_output_tokens; ghi lại token đầu vào/đầu ra của mọi lời gọi."""
+
+    def __init__(self, ttft=0.4, tokens_per_s=100.0, output_ratio=1.5):
+        self.ttft = ttft
+        self.tokens_per_s = tokens_per_s
+        self.output_ratio = output_ratio
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _respond(self, contents, generation_config):
+        from agent.context import estimate_tokens
+
+        prompt = contents[0]['parts'][0]['text']
+        # Phần bài viết kết thúc ở dấu nháy cuối dòng Text (gợi ý lỗi phía sau cũng có dấu nháy)
+        text = prompt.split('Text: "', 1)[-1].split('"\n', 1)[0]
+        limit = getattr(generation_config, 'max_output_tokens', None) or 8192
+        wanted = int(estimate_tokens(text) * self.output_ratio) + 40
+        output_tokens = min(limit, wanted)
+        with self._lock:
+            self.calls.append({'input': estimate_tokens(prompt), 'output': output_tokens, 'truncated': wanted > limit})
+        # Dòng điểm nằm cuối câu trả lời nên bị mất khi câu trả lời bị cắt
+        body = "Lỗi: 'I goes' -> 'I go'. " * max(1, (output_tokens - 10) // 8)
+        response = body if wanted > limit else body + "\nĐiểm: 7/10"
+        return response, output_tokens
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        response, output_tokens = self._respond(contents, generation_config)
+        time.sleep(self.ttft + output_tokens / self.tokens_per_s)
+        return SimpleNamespace(text=response)
+
+    async def generate_content_async(self, contents, generation_config=None):
+        import asyncio
+
+        response, output_tokens = self._respond(contents, generation_config)
+        await asyncio.sleep(self.ttft + output_tokens / self.tokens_per_s)
+        return SimpleNamespace(text=response)
+
+
+def generated_sentences(seed=0):
+    """Câu ngẫu nhiên (có seed) không lặp lại, khoảng MISTAKE_RATE câu dùng sai dạng động từ theo chủ ngữ."""
+    rng = random.Random(seed)
+    seen = set()
+    while True:
+        subject, third_person = rng.choice(SUBJECTS)
+        base, third, objects = rng.choice(VERB_PHRASES)
+        verb = third if third_person else base
+        if rng.random() < MISTAKE_RATE:
+            verb = base if third_person else third
+        sentence = f"{subject} {verb} {rng.choice(objects)} {rng.choice(TIMES)}."
+        if sentence.lower() not in seen:
+            seen.add(sentence.lower())
+            yield sentence
+
+
+def build_unique_text(essays, words):
+    """Bài dài khoảng `words` từ không có câu nào lặp lại: các bài mẫu (mỗi bài một đoạn) rồi câu sinh thêm."""
+    from agent.essay_analysis import sentence_key, split_sentences
+
+    paragraphs, total, seen = [], 0, set()
+    for essay in essays:
+        sentences = [sentence for sentence in split_sentences(essay['text']) if sentence_key(sentence) not in seen]
+        seen.update(sentence_key(sentence) for sentence in sentences)
+        if not sentences or total >= words:
+            continue
+        paragraphs.append(" ".join(sentences))
+        total += len(paragraphs[-1].split())
+    generator = generated_sentences()
+    while total < words:
+        paragraph = []
+        while len(paragraph) < SENTENCES_PER_PARAGRAPH:
+            sentence = next(generator)
+            if sentence_key(sentence) not in seen:
+                seen.add(sentence_key(sentence))
+                paragraph.append(sentence)
+        paragraphs.append(" ".join(paragraph))
+        total += len(paragraphs[-1].split())
+    return "\n\n".join(paragraphs)
+
+
+def build_repeated_text(essays, words):
+    """Ghép lặp lại các bài mẫu thành một bài dài khoảng `words` từ, mỗi bài mẫu là một đoạn. Bài mẫu lặp lại được
+    đảo thứ tự câu để các phần không trùng nhau (phần trùng được lấy từ cache), nhưng từng câu vẫn là câu lặp."""
+    from agent.essay_analysis import split_sentences
+
+    paragraphs, total = [], 0
+    while total < words:
+        index = len(paragraphs)
+        sentences = split_sentences(essays[index % len(essays)]['text'])
+        shift = index // len(essays) % len(sentences)
+        paragraphs.append(" ".join(sentences[shift:] + sentences[:shift]))
+        total += len(paragraphs[-1].split())
+    return "\n\n".join(paragraphs)
+
+
+def run(scenario, mode, text, model, runs):
+    import agent.essay_analysis as essay_analysis
+    from agent.tutor_agent import EnglishTutorAgent
+
+    essay_analysis.CHUNKED_MIN_WORDS = 10 ** 9 if mode == 'single' else 0
+    essay_analysis.PREPASS_ENABLED = mode != 'chunked_no_prepass'
+    tutor = EnglishTutorAgent()
+    latencies, calls = [], []
+    for _ in range(runs):
+        reset_caches()
+        model.calls.clear()
+        start = time.perf_counter()
+        tutor.analyze_text(text)
+        latencies.append(time.perf_counter() - start)
+        calls.append(list(model.calls))
+
+    per_1k = 1000 / len(text.split())
+    last = calls[-1]
+    return {
+        'scenario': scenario,
+        'mode': mode,
+        'words': len(text.split()),
+        'latency_s': statistics.median(latencies),
+        'latency_per_1k_words_s': statistics.median(latencies) * per_1k,
+        'llm_calls': len(last),
+        'input_tokens_per_1k_words': sum(call['input'] for call in last) * per_1k,
+        'output_tokens_per_1k_words': sum(call['output'] for call in last) * per_1k,
+        'truncated_calls': sum(call['truncated'] for call in last),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--words', type=int, nargs='+', default=[300, 1000, 2000], help="Độ dài các bài thử (từ).")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS),
+                        help="unique: bài không lặp câu; repeated: bài ghép lặp lại các bài mẫu.")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--ttft', type=float, default=0.4, help="Giây tới token đầu tiên của LLM giả.")
+    parser.add_argument('--tokens-per-s', type=float, default=100.0, help="Tốc độ sinh token của LLM giả.")
+    parser.add_argument('--json', help="Ghi kết quả ra file JSON.")
+    args = parser.parse_args()
+
+    register_offline_resources()
+    model = SizedGenerativeModel(args.ttft, args.tokens_per_s)
+    register_generative_model(model)
+    essays = load_jsonl(ESSAYS)
+
+    results = []
+    builders = {'unique': build_unique_text, 'repeated': build_repeated_text}
+    print(f"{'bài':<9} {'từ':>6} {'cách':<20} {'độ trễ':>8} {'/1k từ':>8} {'lời gọi':>8} {'token vào/1k':>13} "
+          f"{'token ra/1k':>12} {'bị cắt':>7}")
+    for scenario in args.scenarios:
+        for words in args.words:
+            text = builders[scenario](essays, words)
+            for mode in MODES:
+                result = run(scenario, mode, text, model, args.runs)
+                results.append(result)
+                print(f"{scenario:<9} {result['words']:>6} {mode:<20} {result['latency_s']:>7.2f}s "
+                      f"{result['latency_per_1k_words_s']:>7.2f}s {result['llm_calls']:>8} "
+                      f"{result['input_tokens_per_1k_words']:>13.0f} {result['output_tokens_per_1k_words']:>12.0f} "
+                      f"{result['truncated_calls']:>7}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
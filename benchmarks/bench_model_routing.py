@@ -0,0 +1,173 @@
+"""So sánh cách chọn model cũ (một model cố định cho mọi yêu cầu, lỗi là lỗi) với router theo tác vụ (auto):
+độ trễ p50/p95 theo loại tác vụ, số lỗi trả về người dùng, số lần chuyển sang model dự phòng, phân bố tier
+và chi phí tương đối. Mỗi tier là một model giả với độ trễ riêng, chạy hoàn toàn offline.
+
+    python benchmarks/bench_model_routing.py
+    python benchmarks/bench_model_routing.py --requests 120 --scenario rate_limit --json routing.json
+
+Kịch bản: normal; rate_limit (model balanced trả lỗi 429 cho một đoạn yêu cầu ở giữa);
+slow (model balanced chậm gấp 10 lần ở đoạn giữa, vượt ngân sách độ trễ).
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import (
+    DEFAULT_CHAT_RESPONSES,
+    FakeChatModel,
+    FakeGenerativeModel,
+    register_chat_model,
+    register_offline_resources,
+)
+from utils.helper import registry
+
+# Độ trễ (giây) mỗi lời gọi, tỉ lệ giống các tier Gemini thật nhưng thu nhỏ để benchmark chạy nhanh
+TIER_LATENCY = {'fast': 0.02, 'balanced': 0.05, 'smart': 0.12, 'coding': 0.3}
+# Ngân sách độ trễ thu nhỏ theo cùng tỉ lệ với DEFAULT_LATENCY_BUDGETS
+LATENCY_BUDGETS = {'chat': 0.04, 'tool_reasoning': 0.1, 'analysis': 0.2}
+# Backoff của gateway thu nhỏ theo cùng tỉ lệ. Circuit breaker tắt: yêu cầu ở đây gửi liền nhau nên lúc breaker
+# mở sẽ từ chối cả loạt yêu cầu sau khi model đã hồi phục (breaker được đo trong bench_llm_gateway.py)
+GATEWAY_TIMING = {'base_delay': 0.01, 'max_delay': 0.05, 'failure_threshold': 10 ** 9}
+
+CHAT_MESSAGES = ["Hello!", "Hi, how are you?", "Thanks a lot!", "Good morning"]
+AGENT_QUESTIONS = ["When do I use the present perfect?", "Explain the passive voice", "What is a phrasal verb?"]
+SHORT_TEXT = "I am study English very hard everyday and I goes to school by bus."
+LONG_TEXT = " ".join([SHORT_TEXT] * 30)
+
+
+def build_workload(requests, tag):
+    """Tỉ lệ gần với lưu lượng thật: nhiều câu chào hỏi ngắn, câu hỏi cần tool và một ít bài viết cần phân tích."""
+    workload = []
+    for i in range(requests):
+        kind = ('chat', 'agent', 'agent', 'analysis', 'chat', 'analysis_long')[i % 6]
+        if kind == 'chat':
+            workload.append(('chat', CHAT_MESSAGES[i % len(CHAT_MESSAGES)]))
+        elif kind == 'agent':
+            workload.append(('tool_reasoning', AGENT_QUESTIONS[i % len(AGENT_QUESTIONS)]))
+        else:
+            # Mỗi bài khác nhau một chút (cả giữa các lần chạy) để không trúng cache phân tích
+            workload.append(('analysis', f"{LONG_TEXT if kind == 'analysis_long' else SHORT_TEXT} ({tag} {i})"))
+    return workload
+
+
+def register_tier_models(router):
+    """Một model giả riêng cho mỗi tier; trả về {tier: (chat model, generative model)}."""
+    models = {}
+    for tier, latency in TIER_LATENCY.items():
+        name = router.model_for(tier)
+        chat = FakeChatModel(responses=DEFAULT_CHAT_RESPONSES, latency=latency, model_name=name)
+        generative = FakeGenerativeModel(latency=latency)
+        register_chat_model(chat, model_names=[name])
+        registry.register(f'generative_model:{name}', generative)
+        models[tier] = (chat, generative)
+    return models
+
+
+def run(mode, scenario, requests):
+    from agent.llm_gateway import LLMGateway
+    from agent.model_router import DEFAULT_TIERS, ModelRouter
+    from agent.tutor_agent import EnglishTutorAgent
+
+    router = ModelRouter(latency_budgets=LATENCY_BUDGETS, gateway=LLMGateway(**GATEWAY_TIMING))
+    models = register_tier_models(router)
+    # register_chat_model dựng router mới: thay bằng router có ngân sách độ trễ thu nhỏ
+    registry.register('model_router', router)
+    tutor = EnglishTutorAgent()
+    tutor.use_semantic_cache = False
+    tutor.memory.summarizer = None
+    if mode == 'fixed':
+        # Như trước khi có router: mọi yêu cầu dùng model balanced, không có model dự phòng
+        tutor.switch_model('balanced')
+        balanced = router.model_for('balanced')
+        router.candidates = lambda task, input_chars=0, preferred=None: [balanced]
+
+    workload = build_workload(requests, f"{scenario}-{mode}")
+    chat, generative = models['balanced']
+    outage = range(len(workload) // 3, 2 * len(workload) // 3)
+    latencies, errors = {}, 0
+    for index, (task, message) in enumerate(workload):
+        if index == outage.start:
+            if scenario == 'rate_limit':
+                chat.failures = generative.failures = len(outage)
+            elif scenario == 'slow':
+                chat.latency = generative.latency = TIER_LATENCY['balanced'] * 10
+        elif index == outage.stop:
+            chat.failures = generative.failures = 0
+            chat.latency = generative.latency = TIER_LATENCY['balanced']
+
+        start = time.perf_counter()
+        # Bỏ phần log lỗi agent in ra stdout, lỗi đã được đếm bên dưới
+        with contextlib.redirect_stdout(io.StringIO()):
+            if task == 'analysis':
+                answer = tutor.analyze_text(message)
+                failed = answer.startswith("Không thể phân tích")
+            else:
+                answer = tutor.run_agent_chat(message)
+                failed = bool(tutor.last_turn and tutor.last_turn['error']) or answer.startswith("Xin lỗi")
+        latencies.setdefault(task, []).append(time.perf_counter() - start)
+        errors += failed
+
+    stats = router.stats()
+    tiers = {
+        tier: stats.get(config['model'], {}).get('calls', 0) - stats.get(config['model'], {}).get('failures', 0)
+        for tier, config in DEFAULT_TIERS.items()
+    }
+    calls = sum(tiers.values())
+    cost = sum(count * DEFAULT_TIERS[tier]['cost'] for tier, count in tiers.items())
+    return {
+        'mode': mode,
+        'scenario': scenario,
+        'errors': errors,
+        'latency_ms': {
+            task: {
+                'p50': statistics.median(values) * 1000,
+                'p95': sorted(values)[min(len(values) - 1, int(0.95 * len(values)))] * 1000,
+            }
+            for task, values in latencies.items()
+        },
+        'tier_calls': tiers,
+        'failed_calls': sum(model.get('failures', 0) for model in stats.values()),
+        # Chi phí trung bình mỗi lời gọi theo giá đầu vào, tương đối với việc luôn dùng balanced (=1.0)
+        'relative_cost': cost / calls / DEFAULT_TIERS['balanced']['cost'] if calls else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=90)
+    parser.add_argument('--scenario', choices=['normal', 'rate_limit', 'slow', 'all'], default='all')
+    parser.add_argument('--json', help="Ghi kết quả ra file JSON.")
+    args = parser.parse_args()
+
+    register_offline_resources()
+    scenarios = ['normal', 'rate_limit', 'slow'] if args.scenario == 'all' else [args.scenario]
+
+    results = []
+    for scenario in scenarios:
+        print(f"== {scenario} ({args.requests} yêu cầu)")
+        for mode in ('fixed', 'auto'):
+            result = run(mode, scenario, args.requests)
+            results.append(result)
+            latency = "  ".join(
+                f"{task} p50 {values['p50']:6.1f} / p95 {values['p95']:6.1f} ms"
+                for task, values in sorted(result['latency_ms'].items())
+            )
+            tiers = " ".join(f"{tier}={count}" for tier, count in result['tier_calls'].items())
+            print(f"  {mode:<6} lỗi: {result['errors']:>3}   {latency}")
+            print(f"  {'':<6} lời gọi: {tiers}   lỗi model: {result['failed_calls']}   "
+                  f"chi phí tương đối: {result['relative_cost']:.2f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""Phát lại các hội thoại và bài viết ghi sẵn qua run_agent_chat và analyze_text với LLM, Wikipedia và kho
+tài liệu RAG giả (không cần mạng hay API key), đo throughput, độ trễ p50/p95/p99, số lời gọi LLM mỗi lượt và
+bộ nhớ tối đa (peak RSS). Kết quả lưu ra JSON để so sánh giữa các commit.
+
+    python benchmarks/bench_replay.py --json before.json
+    git checkout <commit khác> && python benchmarks/bench_replay.py --json after.json --compare before.json
+
+Hội thoại: benchmarks/data/conversations.jsonl (mỗi lượt ghi tool agent nên gọi và câu trả lời), bài viết:
+benchmarks/data/essays.jsonl, tài liệu RAG: benchmarks/data/rag_corpus/. LLM giả trả lời theo nội dung prompt
+nên lượt đi qua đường tắt hay qua agent ReAct đều khớp kịch bản. Mỗi lần lặp dùng cache kết quả mới (trừ khi
+--warm-cache) để đo đường gọi LLM/tool thay vì đo cache.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import (
+    FakeGenerativeModel,
+    FakeWikipediaWrapper,
+    ReplayChatModel,
+    load_jsonl,
+    register_chat_model,
+    register_generative_model,
+    register_offline_resources,
+)
+from utils.helper import registry
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+CONVERSATIONS = os.path.join(DATA_DIR, 'conversations.jsonl')
+ESSAYS = os.path.join(DATA_DIR, 'essays.jsonl')
+RAG_CORPUS = os.path.join(DATA_DIR, 'rag_corpus')
+
+# Chỉ số càng nhỏ càng tốt, được so sánh khi có --compare (throughput so sánh theo chiều ngược lại)
+COMPARED_METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'llm_calls_per_turn')
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # ru_maxrss tính bằng KB trên Linux, byte trên macOS
+    scale = 1 / 1024 if sys.platform != 'darwin' else 1 / 1024 / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def reset_caches():
+    """Cache kết quả (RAG, Wikipedia, phân tích) mới để lần lặp sau không chỉ đo cache hit."""
+    from utils.cache import LRUCache, ResponseCache
+
+    registry.register('response_cache', ResponseCache(memory=LRUCache(max_size=1024, ttl=86400), ttl=86400))
+
+
+def analysis_response(words):
+    """Bài phân tích giả dài khoảng `words` từ, đủ dài để streaming/token_delay có ý nghĩa."""
+    sentence = "Câu này dùng sai thì, nên sửa 'I goes' thành 'I go' và thêm ví dụ minh họa cho học viên. "
+    text = "1. Lỗi ngữ pháp:\n" + sentence * max(1, words // len(sentence.split()))
+    return text + "\n4. Điểm: 6/10\n5. Bạn tiến bộ rất nhanh, cố gắng lên nhé!"
+
+
+def summarize(samples, llm_calls, elapsed_s, mismatches=0, routes=None):
+    result = {
+        'count': len(samples),
+        'throughput_per_s': len(samples) / elapsed_s if elapsed_s else 0.0,
+        'p50_ms': statistics.median(samples) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+        'mean_ms': statistics.mean(samples) * 1000,
+        'llm_calls_per_turn': statistics.mean(llm_calls),
+        'mismatches': mismatches,
+    }
+    if routes is not None:
+        result['routes'] = routes
+    return result
+
+
+def warm_up():
+    """Import trễ (google.generativeai, tool, BM25) xảy ra ở lượt đầu tiên của process, không thuộc về lượt nào."""
+    from agent.tutor_agent import EnglishTutorAgent
+
+    tutor = EnglishTutorAgent()
+    tutor.warm_up()
+    tutor.analyze_text("This sentence warm up the analysis path.")
+
+
+def replay_conversations(conversations, args):
+    from agent.tutor_agent import EnglishTutorAgent
+
+    samples, llm_calls, routes, mismatches = [], [], {}, 0
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        if not args.warm_cache:
+            reset_caches()
+        for conversation in conversations:
+            # Mỗi hội thoại là một phiên mới, như một học viên mở ứng dụng
+            tutor = EnglishTutorAgent()
+            tutor.use_fast_path = not args.no_fast_path
+            for turn in conversation['turns']:
+                turn_start = time.perf_counter()
+                answer = tutor.run_agent_chat(turn['input'])
+                samples.append(time.perf_counter() - turn_start)
+                llm_calls.append(len(tutor.last_turn['llm_calls']))
+                routes[tutor.last_turn['route']] = routes.get(tutor.last_turn['route'], 0) + 1
+                if tutor.last_turn['error'] or answer != turn['answer']:
+                    mismatches += 1
+    return summarize(samples, llm_calls, time.perf_counter() - start, mismatches, routes)
+
+
+def replay_essays(essays, generative_model, args):
+    from agent.tutor_agent import EnglishTutorAgent
+
+    tutor = EnglishTutorAgent()
+    samples, llm_calls, mismatches = [], [], 0
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        if not args.warm_cache:
+            reset_caches()
+        for essay in essays:
+            calls = generative_model.calls
+            turn_start = time.perf_counter()
+            analysis = tutor.analyze_text(essay['text'])
+            samples.append(time.perf_counter() - turn_start)
+            llm_calls.append(generative_model.calls - calls)
+            mismatches += analysis != generative_model.response
+    return summarize(samples, llm_calls, time.perf_counter() - start, mismatches)
+
+
+def compare(results, baseline, max_regression):
+    """In thay đổi so với baseline; trả về danh sách chỉ số tệ đi quá max_regression."""
+    regressions = []
+    print(f"\nSo với {baseline.get('commit') or 'baseline'}:")
+    for workload in ('chat', 'analysis'):
+        before_all, after_all = baseline.get(workload), results[workload]
+        if not before_all:
+            continue
+        for metric in COMPARED_METRICS + ('throughput_per_s',):
+            before, after = before_all.get(metric), after_all[metric]
+            if not before:
+                continue
+            change = after / before - 1
+            worse = -change if metric == 'throughput_per_s' else change
+            flag = "  <-- tệ hơn" if worse > max_regression else ""
+            print(f"  {workload:<9} {metric:<20} {before:10.2f} -> {after:10.2f}  ({change:+.1%}){flag}")
+            if flag:
+                regressions.append(f"{workload}.{metric}")
+    before, after = baseline.get('peak_rss_mb'), results['peak_rss_mb']
+    if before and after:
+        change = after / before - 1
+        flag = "  <-- tệ hơn" if change > max_regression else ""
+        print(f"  {'process':<9} {'peak_rss_mb':<20} {before:10.1f} -> {after:10.1f}  ({change:+.1%}){flag}")
+        if flag:
+            regressions.append('peak_rss_mb')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--conversations', default=CONVERSATIONS)
+    parser.add_argument('--essays', default=ESSAYS)
+    parser.add_argument('--repeat', type=int, default=3, help="Số lần phát lại toàn bộ dữ liệu.")
+    parser.add_argument('--latency', type=float, default=0.05, help="Giây trước token đầu tiên của LLM giả.")
+    parser.add_argument('--token-delay', type=float, default=0.0, help="Giây giữa các token của LLM giả.")
+    parser.add_argument('--analysis-words', type=int, default=150, help="Độ dài bài phân tích giả (số từ).")
+    parser.add_argument('--wiki-latency', type=float, default=0.1, help="Giây cho mỗi lần gọi Wikipedia giả.")
+    parser.add_argument('--no-fast-path', action='store_true', help="Mọi lượt đều đi qua AgentExecutor.")
+    parser.add_argument('--warm-cache', action='store_true', help="Giữ cache kết quả giữa các lần lặp.")
+    parser.add_argument('--json', help="Ghi kết quả ra file JSON.")
+    parser.add_argument('--compare', help="File JSON của lần chạy trước để so sánh.")
+    parser.add_argument('--max-regression', type=float, default=0.10,
+                        help="Tỉ lệ tệ đi tối đa so với --compare trước khi trả mã lỗi 1.")
+    args = parser.parse_args()
+
+    from langchain_community.embeddings import DeterministicFakeEmbedding
+
+    conversations = load_jsonl(args.conversations)
+    essays = load_jsonl(args.essays)
+    # Embedding tất định để kết quả truy hồi (và độ dài Observation) giống nhau giữa các lần chạy
+    register_offline_resources(docs_dir=RAG_CORPUS, embedding_model=DeterministicFakeEmbedding(size=384))
+    registry.register('wikipedia_wrapper', FakeWikipediaWrapper(500, latency=args.wiki_latency))
+    register_chat_model(ReplayChatModel(
+        turns=[turn for conversation in conversations for turn in conversation['turns']],
+        latency=args.latency, token_delay=args.token_delay,
+    ))
+    generative_model = FakeGenerativeModel(analysis_response(args.analysis_words), args.latency, args.token_delay)
+    register_generative_model(generative_model)
+
+    warm_up()
+    results = {
+        'commit': git_commit(),
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'config': {key: value for key, value in vars(args).items() if key not in ('json', 'compare')},
+        'chat': replay_conversations(conversations, args),
+        'analysis': replay_essays(essays, generative_model, args),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+    for workload in ('chat', 'analysis'):
+        result = results[workload]
+        print(f"{workload:<9} {result['count']:4d} lượt  {result['throughput_per_s']:7.1f} lượt/s   "
+              f"p50 {result['p50_ms']:7.1f}  p95 {result['p95_ms']:7.1f}  p99 {result['p99_ms']:7.1f} ms   "
+              f"{result['llm_calls_per_turn']:.2f} lời gọi LLM/lượt   sai kịch bản: {result['mismatches']}")
+    print(f"route: {results['chat']['routes']}")
+    if results['peak_rss_mb'] is not None:
+        print(f"peak RSS: {results['peak_rss_mb']:.1f} MB")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        if regressions:
+            print(f"Tệ hơn quá {args.max_regression:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
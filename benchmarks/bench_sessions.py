@@ -0,0 +1,69 @@
+"""Benchmark bộ nhớ (RSS) và thời gian khởi tạo khi thêm từng phiên EnglishTutorAgent.
+
+    python benchmarks/bench_sessions.py --sessions 50
+    python benchmarks/bench_sessions.py --sessions 50 --offline   # dùng model giả, không cần mạng/API key
+"""
+import argparse
+import gc
+import os
+import resource
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def current_rss_mb():
+    """RSS hiện tại của process (MB). Ngoài Linux thì dùng peak RSS thay thế."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--offline', action='store_true', help="Dùng embedding và LLM giả.")
+    args = parser.parse_args()
+
+    baseline_rss = current_rss_mb()
+    if args.offline:
+        from benchmarks.fakes import register_offline_resources
+
+        register_offline_resources()
+
+    from agent.tutor_agent import EnglishTutorAgent
+
+    sessions = []
+    init_times = []
+    previous_rss = current_rss_mb()
+    print(f"RSS ban đầu: {baseline_rss:.1f} MB (trước phiên đầu tiên: {previous_rss:.1f} MB)")
+    print(f"{'session':>8} {'init (s)':>10} {'RSS (MB)':>10} {'ΔRSS (MB)':>10}")
+    for i in range(1, args.sessions + 1):
+        start = time.perf_counter()
+        sessions.append(EnglishTutorAgent())
+        elapsed = time.perf_counter() - start
+        init_times.append(elapsed)
+        gc.collect()
+        rss = current_rss_mb()
+        if i == 1:
+            first_session_rss = rss
+        print(f"{i:>8} {elapsed:>10.3f} {rss:>10.1f} {rss - previous_rss:>10.2f}")
+        previous_rss = rss
+
+    print(f"Tổng RSS tăng thêm cho {len(sessions)} phiên: {previous_rss - baseline_rss:.1f} MB")
+    if len(sessions) > 1:
+        # Phiên đầu tiên nạp tài nguyên dùng chung, các phiên sau chỉ tốn phần riêng
+        marginal_rss = (previous_rss - first_session_rss) / (len(sessions) - 1)
+        marginal_time = sum(init_times[1:]) / (len(init_times) - 1)
+        print(f"Phiên đầu: {init_times[0]:.3f}s; mỗi phiên thêm: {marginal_time * 1000:.1f} ms, {marginal_rss:.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Đo số lần đổi cài đặt (trình độ, model) mỗi giây: cách cũ dựng lại prompt + agent ReAct + AgentExecutor
+sau mỗi lần đổi, cách hiện tại chỉ đổi thuộc tính và executor chọn prompt/LLM dựng sẵn ở lời gọi tiếp theo.
+
+    python benchmarks/bench_settings_switch.py --changes 2000
+
+Sau khi đo, một lượt chat với LLM giả kiểm tra rằng prompt gửi đi thật sự dùng trình độ vừa chọn.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from benchmarks.fakes import register_offline_resources
+
+LEVELS = ['beginner', 'intermediate', 'advanced']
+MODEL_TIERS = ['fast', 'balanced', 'smart', 'coding']
+
+
+class PromptCapture(BaseCallbackHandler):
+    def __init__(self):
+        self.prompts = []
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.prompts.extend(str(message.content) for batch in messages for message in batch)
+
+
+def rebuild_executor(tutor):
+    """Những gì update_user_level/switch_model từng làm sau mỗi lần đổi cài đặt."""
+    from langchain.agents import AgentExecutor, create_react_agent
+    from langchain_core.prompts import ChatPromptTemplate
+
+    from agent.tutor_agent import AGENT_PROMPT_TEMPLATE
+
+    prompt = ChatPromptTemplate.from_template(AGENT_PROMPT_TEMPLATE).partial(system_prompt=tutor.set_system_prompt())
+    agent = create_react_agent(tutor.llm, tutor.tools, prompt)
+    tutor.agent_executor = AgentExecutor(agent=agent, tools=tutor.tools, memory=tutor.memory, handle_parsing_errors=True)
+
+
+def measure(name, tutor, changes, rebuild):
+    start = time.perf_counter()
+    for i in range(changes):
+        if i % 2:
+            tutor.switch_model(MODEL_TIERS[i % len(MODEL_TIERS)])
+        else:
+            tutor.update_user_level(LEVELS[i % len(LEVELS)])
+        if rebuild:
+            rebuild_executor(tutor)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<22} {changes / elapsed:10.0f} lần đổi/s   {elapsed * 1e6 / changes:8.1f} µs/lần")
+    return changes / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--changes', type=int, default=2000)
+    args = parser.parse_args()
+
+    register_offline_resources()
+
+    from agent.tutor_agent import EnglishTutorAgent
+
+    tutor = EnglishTutorAgent()
+    tutor.use_fast_path = False
+    tutor.use_semantic_cache = False
+    executor = tutor.agent_executor
+
+    current = measure("runtime parameters", tutor, args.changes, rebuild=False)
+    assert tutor.agent_executor is executor, "executor không được dựng lại"
+    rebuilt = measure("rebuild executor", EnglishTutorAgent(), max(args.changes // 20, 10), rebuild=True)
+    print(f"nhanh hơn {current / rebuilt:.0f} lần")
+
+    for level in LEVELS:
+        tutor.update_user_level(level)
+        capture = PromptCapture()
+        tutor.agent_executor.invoke({"input": "Hello!"}, config={"callbacks": [capture]})
+        assert f"Trình độ: {level}" in capture.prompts[0], f"prompt không dùng trình độ {level}"
+    print("prompt gửi tới LLM khớp trình độ đã chọn cho cả", len(LEVELS), "trình độ")
+
+
+if __name__ == "__main__":
+    main()
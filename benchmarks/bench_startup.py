@@ -0,0 +1,86 @@
+"""Benchmark khởi động nguội: thời gian import, khởi tạo agent và phản hồi đầu tiên
+cho main.py và ui/streamlit_app.py. Mỗi lần đo chạy trong một process Python mới.
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --runs 5 --offline   # LLM/embedding giả
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+TARGETS = ['main.py', os.path.join('ui', 'streamlit_app.py')]
+# Câu hỏi ngữ pháp đi qua agent (không qua đường tắt chào hỏi) để phản hồi đầu tiên gồm cả việc dựng agent và tool
+FIRST_MESSAGE = "When do I use the present perfect?"
+
+
+def measure(target, offline):
+    """Chạy trong process con: đo từng giai đoạn khởi động của một script UI."""
+    timings = {}
+
+    start = time.perf_counter()
+    spec = importlib.util.spec_from_file_location('tutor_app', os.path.join(ROOT_DIR, target))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)  # main() chỉ chạy khi __name__ == "__main__"
+    timings['import_s'] = time.perf_counter() - start
+    from agent.router import ROUTE_AGENT  # đã được script UI import
+
+    if offline:
+        from benchmarks.fakes import register_offline_resources
+
+        register_offline_resources()
+
+    start = time.perf_counter()
+    tutor = module.EnglishTutorAgent()
+    timings['agent_init_s'] = time.perf_counter() - start
+
+    # Gói bài học/semantic cache có sẵn trên máy cũng trả lời được câu hỏi này mà không cần agent
+    tutor.use_lesson_pack = False
+    tutor.use_semantic_cache = False
+    start = time.perf_counter()
+    tutor.run_agent_chat(FIRST_MESSAGE)
+    timings['first_reply_s'] = time.perf_counter() - start
+    route = tutor.last_turn['route']
+    assert route == ROUTE_AGENT, f"{FIRST_MESSAGE!r} đi route {route!r}, không đo được thời gian dựng agent"
+
+    start = time.perf_counter()
+    tutor.warm_up()
+    timings['warm_up_s'] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--offline', action='store_true', help="Dùng embedding và LLM giả.")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.offline)))
+        return
+
+    for target in TARGETS:
+        runs = []
+        for _ in range(args.runs):
+            command = [sys.executable, os.path.abspath(__file__), '--child', target]
+            if args.offline:
+                command.append('--offline')
+            output = subprocess.run(command, cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+
+        summary = ", ".join(
+            f"{key}={statistics.median(run[key] for run in runs):.3f}" for key in runs[0]
+        )
+        print(f"{target} (median của {args.runs} lần): {summary}")
+
+
+if __name__ == "__main__":
+    main()
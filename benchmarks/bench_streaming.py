@@ -0,0 +1,88 @@
+"""Đo độ trễ cảm nhận (thời gian tới token đầu tiên hiển thị) của chat và phân tích text,
+so sánh đường chặn (run_agent_chat / analyze_text) với streaming, dùng LLM giả chạy local.
+
+    python benchmarks/bench_streaming.py --latency 0.5 --token-delay 0.02 --runs 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_replay import reset_caches
+from benchmarks.fakes import register_offline_resources
+
+# Một lượt ReAct có dùng tool: LLM được gọi 2 lần (Action rồi Final Answer)
+REACT_RESPONSES = [
+    "Thought: I should check the study material.\nAction: EnglishMaterialSearch\nAction Input: present perfect",
+    "Thought: I now know the final answer\nFinal Answer: We use the present perfect for experiences "
+    "and for actions that started in the past and continue now, for example: I have lived here for two years.",
+]
+
+
+def time_blocking(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed
+
+
+def time_streaming(generator, is_visible):
+    start = time.perf_counter()
+    first = None
+    for item in generator:
+        if first is None and is_visible(item):
+            first = time.perf_counter() - start
+    total = time.perf_counter() - start
+    return first if first is not None else total, total
+
+
+def measure(runs, sample):
+    """`runs` lần đo, mỗi lần với cache kết quả mới để đo đường gọi LLM chứ không phải cache hit."""
+    samples = []
+    for _ in range(runs):
+        reset_caches()
+        samples.append(sample())
+    return samples
+
+
+def report(name, samples):
+    first = [sample[0] for sample in samples]
+    total = [sample[1] for sample in samples]
+    print(f"{name:<28} first visible: {statistics.median(first) * 1000:8.1f} ms   "
+          f"total: {statistics.median(total) * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.5, help="Độ trễ trước token đầu của mỗi lời gọi LLM (s).")
+    parser.add_argument('--token-delay', type=float, default=0.02, help="Độ trễ giữa các token (s).")
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    register_offline_resources(responses=REACT_RESPONSES, latency=args.latency, token_delay=args.token_delay)
+
+    from agent.tutor_agent import EnglishTutorAgent
+
+    tutor = EnglishTutorAgent()
+    tutor.agent_executor.verbose = False
+    question = "When do I use the present perfect?"
+    text = "I am study English very hard everyday."
+    # Nạp trước tool và google.generativeai để chỉ đo độ trễ của LLM
+    tutor.warm_up()
+    tutor.analyze_text(text)
+
+    report("run_agent_chat", measure(args.runs, lambda: time_blocking(tutor.run_agent_chat, question)))
+    report("stream_agent_chat", measure(args.runs, lambda: time_streaming(
+        tutor.stream_agent_chat(question), lambda event: event["type"] in ("token", "final", "error"),
+    )))
+    report("analyze_text", measure(args.runs, lambda: time_blocking(tutor.analyze_text, text)))
+    report("stream_analyze_text", measure(args.runs, lambda: time_streaming(
+        tutor.stream_analyze_text(text), lambda chunk: bool(chunk),
+    )))
+
+
+if __name__ == "__main__":
+    main()
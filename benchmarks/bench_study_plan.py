@@ -0,0 +1,113 @@
+"""Số lời gọi LLM và độ trễ cho một yêu cầu lịch học lặp lại ("30 phút mỗi ngày trong tuần, trong 8 tuần"):
+agent gọi Google Calendar Add Event cho từng buổi như trước (một vòng ReAct mỗi buổi, dừng ở giới hạn vòng lặp của
+AgentExecutor), agent gọi Study Plan Schedule một lần cho cả lịch, và đường tắt trích xuất kế hoạch bằng một lời gọi.
+
+    python benchmarks/bench_study_plan.py
+    python benchmarks/bench_study_plan.py --weeks 4 8 12 --latency 0.5 --json study_plan.json
+
+LLM giả trả lời theo kịch bản soạn sẵn cho từng cách, mỗi lời gọi tốn --latency giây.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import FakeChatModel, register_chat_model, register_offline_resources
+
+MODES = ('per_event_agent', 'study_plan_agent', 'fast_path')
+MESSAGE = "Schedule 30 minutes of English every weekday for {weeks} weeks at 7pm"
+
+
+def plan_params(weeks):
+    start = datetime.now().replace(hour=19, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    return {
+        "title": "English practice",
+        "start_datetime_str": start.strftime("%Y-%m-%d %H:%M"),
+        "rrule": f"FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR;COUNT={5 * weeks}",
+        "duration_minutes": 30,
+    }
+
+
+def script(mode, weeks):
+    """Các câu trả lời LLM giả theo thứ tự lời gọi cho một cách xử lý."""
+    plan = plan_params(weeks)
+    final = "Thought: I now know the final answer\nFinal Answer: Your study plan is ready."
+    if mode == 'fast_path':
+        return [json.dumps(plan)]
+    if mode == 'study_plan_agent':
+        return [f"Thought: One plan covers every session.\nAction: Study Plan Schedule\nAction Input: {json.dumps(plan)}",
+                final]
+    start = datetime.strptime(plan['start_datetime_str'], "%Y-%m-%d %H:%M")
+    sessions = [start + timedelta(days=day) for day in range(7 * weeks)
+                if (start + timedelta(days=day)).weekday() < 5]
+    steps = [
+        f"Thought: Add session {i + 1}.\nAction: Google Calendar Add Event\nAction Input: "
+        + json.dumps({"title": plan['title'], "start_datetime_str": session.strftime("%Y-%m-%d %H:%M"),
+                      "duration_minutes": 30})
+        for i, session in enumerate(sessions)
+    ]
+    return steps + [final]
+
+
+def run(mode, weeks, latency):
+    from agent.tutor_agent import EnglishTutorAgent
+
+    register_chat_model(FakeChatModel(responses=script(mode, weeks), latency=latency))
+    tutor = EnglishTutorAgent()
+    tutor.use_fast_path = mode == 'fast_path'
+    start = time.perf_counter()
+    # AgentExecutor in log từng bước khi dừng ở giới hạn vòng lặp
+    with contextlib.redirect_stdout(io.StringIO()):
+        answer = tutor.run_agent_chat(MESSAGE.format(weeks=weeks))
+    elapsed = time.perf_counter() - start
+    turn = tutor.last_turn
+    if tutor.last_study_plan is not None:
+        events = len(tutor.last_study_plan.occurrences)
+    else:
+        events = sum(call['tool'] == "Google Calendar Add Event" for call in turn['tool_calls'])
+    return {
+        'mode': mode,
+        'weeks': weeks,
+        'sessions': 5 * weeks,
+        'events_created': events,
+        'llm_calls': len(turn['llm_calls']),
+        'tool_calls': len(turn['tool_calls']),
+        'latency_s': elapsed,
+        'route': turn['route'],
+        'stopped_early': "iteration limit" in answer,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--weeks', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--latency', type=float, default=0.3, help="Giây mỗi lời gọi LLM giả.")
+    parser.add_argument('--json', help="Ghi kết quả ra file JSON.")
+    args = parser.parse_args()
+
+    os.environ.setdefault('TUTOR_STUDY_PLAN_DIR', tempfile.mkdtemp(prefix='study-plans-'))
+    register_offline_resources()
+    results = []
+    print(f"{'tuần':>5} {'buổi':>5} {'cách':<18} {'lời gọi LLM':>12} {'tool':>5} {'sự kiện tạo':>12} {'độ trễ':>8}")
+    for weeks in args.weeks:
+        for mode in MODES:
+            result = run(mode, weeks, args.latency)
+            results.append(result)
+            note = "  (dừng ở giới hạn vòng lặp)" if result['stopped_early'] else ""
+            print(f"{weeks:>5} {result['sessions']:>5} {mode:<18} {result['llm_calls']:>12} {result['tool_calls']:>5} "
+                  f"{result['events_created']:>12} {result['latency_s']:>7.2f}s{note}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Thời gian chạy lại script Streamlit (main.py) theo độ dài phiên: 10, 100 và 1000 tin nhắn.
+
+So sánh vẽ toàn bộ lịch sử ở mỗi lần chạy lại (như trước khi có fragment) với chỉ vẽ cửa sổ tin nhắn gần nhất.
+Ngoài thời gian chạy lại cả trang, benchmark ghi thời gian vẽ khung chat (chat_panel): khi học viên gửi tin
+nhắn hay tải tin cũ, Streamlit chỉ chạy lại fragment này chứ không chạy lại sidebar và khung phân tích.
+
+    python benchmarks/bench_ui_rerun.py
+    python benchmarks/bench_ui_rerun.py --sizes 10 100 1000 5000 --runs 10 --json ui.json
+
+Chạy bằng streamlit.testing (AppTest) với LLM giả, không cần trình duyệt hay API key.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import register_offline_resources
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+
+SAMPLE_MESSAGES = [
+    {"role": "user", "content": "When do I use the present perfect?"},
+    {"role": "assistant", "content": (
+        "We use the **present perfect** (have/has + past participle) for experiences and for actions that started "
+        "in the past and continue now.\n\n- I have lived in Da Nang *for* five years.\n- She has *just* finished."
+    )},
+]
+
+
+def measure(app, size, full_history, runs):
+    """(thời gian chạy lại cả trang, thời gian vẽ khung chat) trung vị, tính bằng ms."""
+    messages = [SAMPLE_MESSAGES[i % 2] for i in range(size)]
+    app.session_state['messages'] = messages
+    app.session_state['history_complete'] = True
+    page, chat = [], []
+    for _ in range(runs):
+        if full_history:
+            app.session_state['history_window'] = len(messages)
+        start = time.perf_counter()
+        app.run()
+        page.append((time.perf_counter() - start) * 1000)
+        chat.append(app.session_state['chat_render_ms'])
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+    return statistics.median(page), statistics.median(chat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json', help="Ghi kết quả ra file JSON.")
+    args = parser.parse_args()
+
+    register_offline_resources()
+
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP, default_timeout=120)
+    app.run()
+    default_window = app.session_state['history_window']
+
+    results = []
+    print(f"{'tin nhắn':>9} {'':<16} {'cả trang':>10} {'khung chat':>11}")
+    for size in args.sizes:
+        for label, full_history in (('toàn bộ lịch sử', True), ('cửa sổ', False)):
+            app.session_state['history_window'] = default_window
+            page_ms, chat_ms = measure(app, size, full_history, args.runs)
+            results.append({'messages': size, 'mode': 'full' if full_history else 'windowed',
+                            'page_ms': page_ms, 'chat_fragment_ms': chat_ms})
+            print(f"{size:>9} {label:<16} {page_ms:>8.1f}ms {chat_ms:>9.1f}ms")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Độ trễ tra cứu của gói Wikipedia offline (SQLite FTS5) theo từng loại truy vấn: trùng tiêu đề, tìm toàn văn
+theo từ khóa và không tìm thấy (trường hợp sẽ rơi về API Wikipedia).
+
+    python benchmarks/bench_wiki_pack.py --entries 50000              # gói tổng hợp trong thư mục tạm
+    python benchmarks/bench_wiki_pack.py --pack data/wiki_pack.sqlite3  # gói thật đã build bằng setup_database.py
+    python benchmarks/bench_wiki_pack.py --live 5                     # so sánh với 5 lời gọi API thật (cần mạng)
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db_manager import KnowledgePack
+
+SYLLABLES = "ba ri lo ten mu sa kor vel an dri po lis gra mon tha eu cle ni fo rad".split()
+
+
+def make_vocabulary(rng, size=20_000):
+    """Từ giả ghép từ âm tiết; tần suất theo phân phối Zipf như văn bản thật (vài từ rất phổ biến, đa số hiếm)."""
+    words = sorted({"".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(size)})
+    rng.shuffle(words)
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    return words, weights
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def report(name, samples):
+    print(f"{name:<26} p50: {statistics.median(samples) * 1000:8.3f} ms   p99: {percentile(samples, 99) * 1000:8.3f} ms")
+    return {'p50_ms': statistics.median(samples) * 1000, 'p99_ms': percentile(samples, 99) * 1000}
+
+
+def build_synthetic_pack(path, entries, rng):
+    """Gói gồm `entries` mục tiêu đề 2-3 từ + mã số (để tiêu đề không trùng), tóm tắt ~80 từ."""
+    words, weights = make_vocabulary(rng)
+    titles = []
+    batch = []
+    for i in range(entries):
+        title = " ".join(word.capitalize() for word in rng.choices(words, weights, k=rng.randint(2, 3))) + f" {i}"
+        summary = " ".join(rng.choices(words, weights, k=80)) + "."
+        titles.append(title)
+        batch.append((title, summary, 'wikipedia', 'synthetic'))
+    pack = KnowledgePack(path)
+    start = time.perf_counter()
+    for offset in range(0, len(batch), 5000):
+        pack.upsert(batch[offset:offset + 5000])
+    return pack, titles, time.perf_counter() - start
+
+
+def time_queries(func, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        func(query)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=50_000)
+    parser.add_argument('--pack', help="Dùng gói có sẵn thay vì tạo gói tổng hợp.")
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--live', type=int, default=0, help="Số truy vấn gửi tới API Wikipedia thật để so sánh.")
+    parser.add_argument('--json', help="Ghi kết quả ra file JSON.")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    if args.pack:
+        pack = KnowledgePack(args.pack)
+        titles = list(pack.updated_at())
+        path = args.pack
+        print(f"Gói {path}: {len(titles)} mục")
+    else:
+        path = os.path.join(tempfile.mkdtemp(), 'wiki_pack.sqlite3')
+        pack, titles, elapsed = build_synthetic_pack(path, args.entries, rng)
+        print(f"Build {len(titles)} mục trong {elapsed:.1f}s ({len(titles) / elapsed:.0f} mục/s)")
+    print(f"Kích thước: {os.path.getsize(path) / 1e6:.1f} MB")
+
+    sample = [rng.choice(titles) for _ in range(args.queries)]
+    # Tiêu đề tổng hợp kết thúc bằng mã số: bỏ đi để truy vấn khớp nhiều mục như từ khóa thật
+    keyword_queries = [title if args.pack else title.rsplit(' ', 1)[0] for title in sample]
+    results = {
+        'entries': len(titles),
+        'size_mb': os.path.getsize(path) / 1e6,
+        'title': report("trùng tiêu đề", time_queries(lambda q: pack.lookup(q, max_chars=500), sample)),
+        'keywords': report("toàn văn (từ khóa)", time_queries(
+            lambda q: pack.lookup(f"what is the {q}", max_chars=500), keyword_queries)),
+        'miss': report("không tìm thấy", time_queries(
+            lambda q: pack.lookup(q, max_chars=500), [f"zyxw{i} qvut{i}" for i in range(args.queries)])),
+    }
+
+    if args.live:
+        from langchain_community.utilities import WikipediaAPIWrapper
+
+        wrapper = WikipediaAPIWrapper(top_k_results=1, doc_content_chars_max=500)
+        live_queries = ["British Museum", "Present perfect", "Phrasal verb", "Big Ben", "Hội An", "Idiom",
+                        "William Shakespeare", "London", "Vietnamese language", "Thanksgiving"][:args.live]
+        results['live'] = report("API Wikipedia (mạng)", time_queries(wrapper.run, live_queries))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
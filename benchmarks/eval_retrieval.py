@@ -0,0 +1,129 @@
+"""Đánh giá EnglishMaterialSearch trên bộ câu hỏi cố định: chỉ vector (FAISS), chỉ BM25 và tìm kiếm lai BM25 + FAISS.
+
+    python benchmarks/eval_retrieval.py                     # embedding MiniLM thật
+    python benchmarks/eval_retrieval.py --fake-embeddings   # không cần tải model (vector ngẫu nhiên, chỉ BM25 có ý nghĩa)
+    python benchmarks/eval_retrieval.py --agent             # chạy agent thật (cần GOOGLE_API_KEY)
+
+Mỗi câu hỏi trong benchmarks/data/rag_eval.jsonl có vài cách diễn đạt truy vấn mà agent thường thử lần lượt
+(câu tự nhiên trước, thuật ngữ cụ thể sau) và một đoạn văn bản phải xuất hiện trong top-k. Số vòng ReAct ước
+lượng = số lần gọi tool cho tới khi tìm thấy + 1 lượt Final Answer. Với --agent, số lần gọi tool và lời gọi
+LLM được đếm trực tiếp từ agent cho chế độ đang bật (TUTOR_RAG_HYBRID=0 để chạy chế độ chỉ vector).
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+EVAL_SET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'rag_eval.jsonl')
+
+
+def normalize(text):
+    return re.sub(r'\s+', ' ', text.replace('’', "'").replace('‘', "'")).strip().lower()
+
+
+def load_eval_set(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def first_hit_rank(docs, expected):
+    expected = normalize(expected)
+    for rank, doc in enumerate(docs, 1):
+        if expected in normalize(doc.page_content):
+            return rank
+    return None
+
+
+def evaluate(name, search_many, items, k):
+    """search_many(queries) -> [[Document, ...], ...]. Mỗi mục được tìm theo lô mọi cách diễn đạt của nó."""
+    hits, reciprocal_ranks, iterations = 0, [], []
+    start = time.perf_counter()
+    for item in items:
+        results = search_many(item['queries'])
+        ranks = [first_hit_rank(docs, item['expected']) for docs in results]
+        if ranks[0] is not None:
+            hits += 1
+        reciprocal_ranks.append(1 / ranks[0] if ranks[0] else 0.0)
+        attempts = next((i + 1 for i, rank in enumerate(ranks) if rank is not None), len(ranks))
+        iterations.append(attempts + 1)
+    elapsed = time.perf_counter() - start
+    result = {
+        'mode': name,
+        'hit_at_k': hits / len(items),
+        'mrr': statistics.mean(reciprocal_ranks),
+        'react_iterations': statistics.mean(iterations),
+        'ms_per_query': elapsed * 1000 / sum(len(item['queries']) for item in items),
+    }
+    print(f"{name:<8} hit@{k}: {result['hit_at_k']:.2f}   MRR: {result['mrr']:.2f}   "
+          f"vòng ReAct/câu hỏi (ước lượng): {result['react_iterations']:.2f}   {result['ms_per_query']:.2f} ms/truy vấn")
+    return result
+
+
+def run_agent(items):
+    """Chạy agent thật trên từng câu hỏi và đếm số lần gọi EnglishMaterialSearch và số lời gọi LLM."""
+    from agent.instrumentation import TurnRecorder
+    from agent.tutor_agent import EnglishTutorAgent
+
+    tool_calls, llm_calls = [], []
+    for item in items:
+        tutor = EnglishTutorAgent()
+        recorder = TurnRecorder()
+        tutor.agent_executor.invoke({"input": item['question']}, config={"callbacks": [recorder]})
+        tool_calls.append(recorder.tools_used.count("EnglishMaterialSearch"))
+        llm_calls.append(recorder.llm_calls)
+    mode = 'vector' if os.getenv('TUTOR_RAG_HYBRID', '1') == '0' else 'hybrid'
+    print(f"agent ({mode}): {statistics.mean(tool_calls):.2f} lần gọi EnglishMaterialSearch, "
+          f"{statistics.mean(llm_calls):.2f} lời gọi LLM mỗi câu hỏi")
+    return {'mode': f"agent-{mode}", 'tool_calls': statistics.mean(tool_calls), 'llm_calls': statistics.mean(llm_calls)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--eval-set', default=EVAL_SET)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--fake-embeddings', action='store_true', help="Dùng FakeEmbeddings thay vì MiniLM.")
+    parser.add_argument('--agent', action='store_true', help="Đếm số lần gọi tool của agent thật.")
+    parser.add_argument('--json', help="Ghi kết quả ra file JSON.")
+    args = parser.parse_args()
+
+    from agent.ingestion import EMBEDDING_MODEL_NAME, build_vectorstore
+    from agent.retrieval import HybridRetriever
+
+    items = load_eval_set(args.eval_set)
+    if args.fake_embeddings:
+        from langchain_community.embeddings import FakeEmbeddings
+
+        embedding_model = FakeEmbeddings(size=384)
+    else:
+        from langchain.embeddings import HuggingFaceEmbeddings
+
+        embedding_model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+
+    vectorstore = build_vectorstore(embedding_model)
+    hybrid = HybridRetriever(vectorstore)
+    print(f"{len(items)} câu hỏi, {len(vectorstore.index_to_docstore_id)} chunks")
+
+    results = [
+        evaluate('vector', lambda queries: [vectorstore.similarity_search(q, k=args.k) for q in queries], items, args.k),
+        evaluate('keyword', lambda queries: [
+            [vectorstore.docstore.search(vectorstore.index_to_docstore_id[position])
+             for position, _ in hybrid.keyword_index.search(q, args.k)]
+            for q in queries
+        ], items, args.k),
+        evaluate('hybrid', lambda queries: hybrid.search_many(queries, k=args.k), items, args.k),
+    ]
+    if args.agent:
+        results.append(run_agent(items))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'k': args.k, 'questions': len(items), 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Các tài nguyên giả dùng cho benchmark: chạy được không cần mạng, API key hay model thật."""
+import asyncio
+import itertools
+import json
+import re
+import time
+from types import SimpleNamespace
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from utils.helper import registry
+
+DEFAULT_MODEL_NAME = 'gemini-2.0-flash'
+DEFAULT_SUMMARY_RESPONSE = "The learner is practising English grammar and asked about several tenses."
+RATE_LIMIT_ERROR = "429 Resource has been exhausted (e.g. check quota)."
+DEFAULT_CHAT_RESPONSES = [
+    "Thought: I now know the final answer\nFinal Answer: Hello! Let's practise English together today.",
+]
+
+WIKIPEDIA_ARTICLE = (
+    "Page: {query}\nSummary: {query} is a widely discussed topic with a long history. " +
+    "Scholars have described its origins, its development over several centuries and its influence on culture, "
+    "education and everyday life, and many sources give detailed accounts of the people and events involved. " * 12
+)
+
+
+def split_tokens(text):
+    """Chia text thành các 'token' giả (từ kèm khoảng trắng) để mô phỏng streaming."""
+    return re.findall(r'\s*\S+', text) or [text]
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model giả, xoay vòng qua `responses`, với độ trễ có thể cấu hình:
+    `latency` là thời gian trước token đầu tiên, `token_delay` là thời gian giữa các token.
+    `failures` lời gọi kế tiếp sẽ lỗi giới hạn tần suất (429) như Gemini khi hết quota."""
+
+    responses: list = DEFAULT_CHAT_RESPONSES
+    latency: float = 0.0
+    token_delay: float = 0.0
+    failures: int = 0
+    model_name: str = DEFAULT_MODEL_NAME
+    _counter: itertools.count = PrivateAttr(default_factory=itertools.count)
+
+    @property
+    def _llm_type(self):
+        return "fake-tutor-chat-model"
+
+    def _get_ls_params(self, stop=None, **kwargs):
+        return {**super()._get_ls_params(stop=stop, **kwargs), 'ls_model_name': self.model_name}
+
+    def _next_response(self, messages=None):
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError(RATE_LIMIT_ERROR)
+        return self.responses[next(self._counter) % len(self.responses)]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        response = self._next_response(messages)
+        time.sleep(self.latency + self.token_delay * len(split_tokens(response)))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=response))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        response = self._next_response(messages)
+        time.sleep(self.latency)
+        for token in split_tokens(response):
+            time.sleep(self.token_delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        response = self._next_response(messages)
+        await asyncio.sleep(self.latency + self.token_delay * len(split_tokens(response)))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=response))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        response = self._next_response(messages)
+        await asyncio.sleep(self.latency)
+        for token in split_tokens(response):
+            await asyncio.sleep(self.token_delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class ReplayChatModel(FakeChatModel):
+    """Chat model giả trả lời theo nội dung prompt thay vì theo thứ tự lời gọi, để các hội thoại ghi sẵn
+    phát lại đúng dù lượt đi qua đường tắt (một lời gọi), agent ReAct (một hoặc hai vòng) hay semantic cache.
+
+    `turns` là các lượt {"input", "tool", "tool_input", "answer"} như trong benchmarks/data/conversations.jsonl."""
+
+    turns: list = []
+    _script: dict = PrivateAttr(default_factory=dict)
+
+    def model_post_init(self, context):
+        super().model_post_init(context)
+        self._script = {turn['input']: turn for turn in self.turns}
+
+    def _next_response(self, messages=None):
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError(RATE_LIMIT_ERROR)
+        prompt = str(messages[-1].content) if messages else ""
+        if prompt.startswith(("Extract the study event", "Extract the learner's recurring study schedule")):
+            # Đường tắt đặt lịch/lịch học lặp lại: không trích xuất được, lượt đi tiếp qua agent
+            return "NONE"
+        turn = self._script.get(prompt)
+        if turn is not None:
+            # Đường tắt chào hỏi: tin nhắn cuối chính là câu của học viên
+            return turn['answer']
+        question, _, scratchpad = prompt.rpartition("User question: ")[2].partition("\n")
+        turn = self._script.get(question)
+        if turn is None:
+            return super()._next_response(messages)
+        if turn['tool'] and "Observation:" not in scratchpad:
+            return f"Thought: I should look this up.\nAction: {turn['tool']}\nAction Input: {turn['tool_input']}"
+        return f"Thought: I now know the final answer\nFinal Answer: {turn['answer']}"
+
+
+class FakeGenerativeModel:
+    """Thay thế genai.GenerativeModel cho analyze_text / stream_analyze_text."""
+
+    def __init__(self, response="1. Lỗi ngữ pháp: 'I am study' -> 'I study'.\n4. Điểm: 6/10",
+                 latency=0.0, token_delay=0.0, failures=0):
+        self.response = response
+        self.latency = latency
+        self.token_delay = token_delay
+        self.failures = failures
+        self.calls = 0
+
+    def _check_quota(self):
+        self.calls += 1
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError(RATE_LIMIT_ERROR)
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        self._check_quota()
+        tokens = split_tokens(self.response)
+        if stream:
+            return self._stream(tokens)
+        time.sleep(self.latency + self.token_delay * len(tokens))
+        return SimpleNamespace(text=self.response)
+
+    async def generate_content_async(self, contents, generation_config=None):
+        self._check_quota()
+        await asyncio.sleep(self.latency + self.token_delay * len(split_tokens(self.response)))
+        return SimpleNamespace(text=self.response)
+
+    def _stream(self, tokens):
+        time.sleep(self.latency)
+        for token in tokens:
+            time.sleep(self.token_delay)
+            yield SimpleNamespace(text=token)
+
+
+class FakeWikipediaWrapper:
+    """Thay WikipediaAPIWrapper: trả về một bài dài, cắt theo doc_content_chars_max như wrapper thật."""
+
+    top_k_results = 1
+
+    def __init__(self, doc_content_chars_max=500, latency=0.0):
+        self.doc_content_chars_max = doc_content_chars_max
+        self.latency = latency
+
+    def run(self, query):
+        time.sleep(self.latency)
+        return WIKIPEDIA_ARTICLE.format(query=query)[:self.doc_content_chars_max]
+
+
+def load_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def register_chat_model(model, temperature=0.3, model_names=None):
+    """Đăng ký `model` cho mọi model của các tier (router có thể chọn bất kỳ tier nào) và dựng lại router
+    để các runnable đã cache không còn giữ model giả cũ, cùng gateway mới (circuit breaker/token bucket sạch)."""
+    from agent.llm_gateway import LLMGateway
+    from agent.model_router import DEFAULT_TIERS, ModelRouter
+
+    for model_name in model_names or {tier['model'] for tier in DEFAULT_TIERS.values()} | {DEFAULT_MODEL_NAME}:
+        registry.register(f'chat_llm:{model_name}:{temperature}', model)
+    registry.register('llm_gateway', LLMGateway())
+    registry.register('model_router', ModelRouter())
+
+
+def register_generative_model(model, model_names=None):
+    """Đăng ký `model` (FakeGenerativeModel) cho mọi model của các tier, dùng cho analyze_text."""
+    from agent.model_router import DEFAULT_TIERS
+
+    for model_name in model_names or {tier['model'] for tier in DEFAULT_TIERS.values()} | {DEFAULT_MODEL_NAME}:
+        registry.register(f'generative_model:{model_name}', model)
+
+
+def register_offline_resources(responses=None, model_name=DEFAULT_MODEL_NAME, latency=0.0, token_delay=0.0,
+                               docs_dir=None, embedding_model=None):
+    """Đăng ký embedding/LLM giả vào registry dùng chung của process.
+    docs_dir: thư mục tài liệu cho FAISS/BM25 (mặc định docs/ của ứng dụng)."""
+    from langchain_community.embeddings import FakeEmbeddings
+
+    from agent.ingestion import DOCS_DIR, build_vectorstore
+    from agent.model_router import DEFAULT_TIERS
+    from agent.retrieval import HybridRetriever
+
+    embedding_model = embedding_model or FakeEmbeddings(size=384)
+    vectorstore = build_vectorstore(embedding_model, docs_dir or DOCS_DIR)
+    registry.register('genai_config', 'offline')
+    registry.register('embedding_model', embedding_model)
+    # Không lưu xuống data/ để tránh ghi đè index thật bằng vector giả
+    registry.register('vectorstore', vectorstore)
+    registry.register('hybrid_retriever', HybridRetriever(vectorstore))
+    # Không dùng gói Wikipedia offline có thể có sẵn trong data/ để kết quả không phụ thuộc máy chạy
+    registry.register('knowledge_pack', None)
+    # Gói bài học soạn sẵn cũng vậy; benchmark nào cần thì tự build và đăng ký gói riêng
+    registry.register('lesson_pack', None)
+    # Cùng một model giả cho mọi tier để kịch bản trả lời không bị chia ra theo model mà router chọn
+    model_names = {tier['model'] for tier in DEFAULT_TIERS.values()} | {model_name}
+    register_chat_model(
+        FakeChatModel(responses=responses or DEFAULT_CHAT_RESPONSES, latency=latency, token_delay=token_delay),
+        model_names=model_names,
+    )
+    # Client riêng cho tóm tắt lịch sử (temperature 0) để không lấy mất các câu trả lời ReAct đã soạn sẵn
+    register_chat_model(FakeChatModel(responses=[DEFAULT_SUMMARY_RESPONSE]), temperature=0.0, model_names=model_names)
+    register_generative_model(FakeGenerativeModel(latency=latency, token_delay=token_delay), model_names)
@@ -0,0 +1,131 @@
+"""Server HTTP giả lập Gemini API (REST v1beta) cho benchmark: độ trễ tùy chỉnh, quota theo model (trả 429 khi
+vượt số request/phút như Gemini thật) và tỉ lệ lỗi 503 ngẫu nhiên.
+
+    python benchmarks/stub_gemini_server.py --port 8765 --rpm 60 --latency 0.2
+    TUTOR_GEMINI_ENDPOINT=http://127.0.0.1:8765 GOOGLE_API_KEY=x streamlit run main.py
+
+Hỗ trợ models/{model}:generateContent và :streamGenerateContent (alt=sse), đủ cho ChatGoogleGenerativeAI và
+genai.GenerativeModel với transport='rest'.
+"""
+import argparse
+import collections
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUOTA_EXCEEDED = {"error": {"code": 429, "message": "Resource has been exhausted (e.g. check quota).",
+                            "status": "RESOURCE_EXHAUSTED"}}
+UNAVAILABLE = {"error": {"code": 503, "message": "The model is overloaded. Please try again later.",
+                         "status": "UNAVAILABLE"}}
+
+
+def response_body(text):
+    return {
+        "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}],
+        "usageMetadata": {"promptTokenCount": 10, "candidatesTokenCount": len(text.split()),
+                          "totalTokenCount": 10 + len(text.split())},
+    }
+
+
+class StubGemini:
+    """Trạng thái dùng chung của server: quota `rpm` request mỗi cửa sổ trượt `window_s` giây theo model (benchmark
+    thu nhỏ cửa sổ để chạy nhanh) và bộ đếm request."""
+
+    def __init__(self, rpm=None, latency=0.1, error_rate=0.0, text="Stub answer from Gemini.", window_s=60.0):
+        self.rpm = rpm
+        self.window_s = window_s
+        self.latency = latency
+        self.error_rate = error_rate
+        self.text = text
+        self.counts = collections.Counter()
+        self._windows = collections.defaultdict(collections.deque)
+        self._lock = threading.Lock()
+
+    def admit(self, model):
+        """None nếu request được phục vụ, ngược lại (mã lỗi, body)."""
+        now = time.monotonic()
+        with self._lock:
+            self.counts['requests'] += 1
+            if self.rpm:
+                window = self._windows[model]
+                while window and now - window[0] >= self.window_s:
+                    window.popleft()
+                if len(window) >= self.rpm:
+                    self.counts['429'] += 1
+                    return 429, QUOTA_EXCEEDED
+                window.append(now)
+            if self.error_rate and random.random() < self.error_rate:
+                self.counts['503'] += 1
+                return 503, UNAVAILABLE
+            self.counts['200'] += 1
+        return None
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+            self._windows.clear()
+
+
+def make_handler(stub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, content_type='application/json'):
+            data = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            path = self.path.split('?')[0]
+            model, _, method = path.rsplit('/', 1)[-1].partition(':')
+            if method not in ('generateContent', 'streamGenerateContent'):
+                self._send(404, {"error": {"code": 404, "message": f"Unknown method {path}", "status": "NOT_FOUND"}})
+                return
+            time.sleep(stub.latency)
+            rejected = stub.admit(model)
+            if rejected is not None:
+                self._send(*rejected)
+            elif method == 'streamGenerateContent':
+                self._send(200, f"data: {json.dumps(response_body(stub.text))}\r\n\r\n".encode('utf-8'),
+                           'text/event-stream')
+            else:
+                self._send(200, response_body(stub.text))
+
+    return Handler
+
+
+def start_stub_server(stub, port=0):
+    """Chạy server trong thread nền; trả về (server, endpoint 'http://127.0.0.1:<port>')."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(stub))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='stub-gemini', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--rpm', type=int, help="Quota request/phút cho mỗi model (mặc định không giới hạn).")
+    parser.add_argument('--latency', type=float, default=0.1, help="Giây xử lý mỗi request.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Tỉ lệ request trả 503.")
+    args = parser.parse_args()
+
+    server, endpoint = start_stub_server(StubGemini(args.rpm, args.latency, args.error_rate), args.port)
+    print(f"Stub Gemini đang chạy tại {endpoint} (Ctrl+C để dừng)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
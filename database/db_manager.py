@@ -0,0 +1,417 @@
+"""Lưu trữ SQLite cho English AI Tutor."""
+import os
+import re
+import sqlite3
+import threading
+import time
+
+DEFAULT_DB_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+
+def connect(db_path):
+    """Mở kết nối SQLite dùng chung giữa các thread (mọi thao tác phải giữ lock của đối tượng sở hữu)."""
+    directory = os.path.dirname(os.path.abspath(db_path))
+    os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SQLiteCacheBackend:
+    """Backend cache key/value có TTL, lưu trên đĩa để dùng lại giữa các lần khởi động
+    và giữa các process. Khi vượt quá max_entries, các mục cũ nhất sẽ bị xóa.
+
+    Số mục chỉ được đếm lại sau mỗi `evict_every` lần ghi (mặc định 1% của max_entries, tối đa 1000) thay vì ở mọi
+    lần ghi, nên giữa hai lần dọn bảng có thể vượt max_entries chừng đó mục cho mỗi process đang ghi."""
+
+    def __init__(self, db_path=None, max_entries=100_000, evict_every=None):
+        self.db_path = db_path or os.path.join(DEFAULT_DB_DIR, 'cache.sqlite3')
+        self.max_entries = max_entries
+        # Nhiều process cùng ghi một file nên không giữ được bộ đếm chính xác trong process; chỉ đếm theo lô
+        self.evict_every = evict_every or max(1, min(1000, max_entries // 100))
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = connect(self.db_path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " expires_at REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_created_at ON cache(created_at)")
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at < time.time():
+                with self._conn:
+                    self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, expires_at),
+            )
+            self._writes += 1
+            if self._writes % self.evict_every:
+                return
+            count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count > self.max_entries:
+                count -= self._conn.execute(
+                    "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at < ?", (now,)
+                ).rowcount
+                if count > self.max_entries:
+                    self._conn.execute(
+                        "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY created_at LIMIT ?)",
+                        (count - self.max_entries,),
+                    )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class ConversationStore:
+    """Lưu lịch sử trò chuyện bền vững theo user và phiên: tin nhắn chỉ ghi thêm, xóa theo cả phiên.
+    Dữ liệu nằm ngoài process nên giữ được qua lần khởi động lại và dùng chung được giữa nhiều replica."""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(DEFAULT_DB_DIR, 'conversations.sqlite3')
+        self._lock = threading.Lock()
+        self._conn = connect(self.db_path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " user_id TEXT NOT NULL,"
+                " session_id TEXT NOT NULL,"
+                " role TEXT NOT NULL,"
+                " content TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id, id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_user ON messages(user_id, session_id)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                " session_id TEXT PRIMARY KEY,"
+                " summary TEXT NOT NULL,"
+                " message_count INTEGER NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " last_message_id INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(summaries)")}
+            if 'last_message_id' not in columns:
+                self._add_last_message_id()
+
+    def _add_last_message_id(self):
+        """Nâng cấp file tạo trước khi summaries có last_message_id: điền id tin nhắn cuối đã tóm tắt (chạy một lần)."""
+        self._conn.execute("ALTER TABLE summaries ADD COLUMN last_message_id INTEGER NOT NULL DEFAULT 0")
+        rows = self._conn.execute("SELECT session_id, message_count FROM summaries WHERE message_count > 0").fetchall()
+        for session_id, message_count in rows:
+            row = self._conn.execute(
+                "SELECT id FROM messages WHERE session_id = ? ORDER BY id LIMIT 1 OFFSET ?",
+                (session_id, message_count - 1),
+            ).fetchone()
+            if row:
+                self._conn.execute(
+                    "UPDATE summaries SET last_message_id = ? WHERE session_id = ?", (row[0], session_id)
+                )
+
+    def append(self, user_id, session_id, messages):
+        """Ghi thêm các tin nhắn [(role, content), ...] của một phiên trong cùng một transaction."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO messages (user_id, session_id, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(user_id, session_id, role, content, now) for role, content in messages],
+            )
+
+    def recent_messages(self, session_id, limit):
+        """`limit` tin nhắn gần nhất của phiên, theo thứ tự thời gian. Chỉ đọc đúng số dòng cần thiết."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, content FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+                (session_id, limit),
+            ).fetchall()
+        return rows[::-1]
+
+    def messages_after(self, session_id, after_id, limit):
+        """Tối đa `limit` tin nhắn gần nhất của phiên có id > after_id, dạng (id, role, content) theo thứ tự thời
+        gian. Đọc theo index (session_id, id) nên không phụ thuộc độ dài phiên."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, role, content FROM messages WHERE session_id = ? AND id > ? ORDER BY id DESC LIMIT ?",
+                (session_id, after_id, limit),
+            ).fetchall()
+        return rows[::-1]
+
+    def get_summary(self, session_id):
+        """(tóm tắt, số tin nhắn đã được tóm tắt, id tin nhắn cuối đã được tóm tắt) hoặc ('', 0, 0) nếu chưa có."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, message_count, last_message_id FROM summaries WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return tuple(row) if row else ('', 0, 0)
+
+    def set_summary(self, session_id, summary, message_count, last_message_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (session_id, summary, message_count, updated_at, last_message_id)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (session_id, summary, message_count, time.time(), last_message_id),
+            )
+
+    def clear_session(self, session_id):
+        """Xóa toàn bộ tin nhắn và bản tóm tắt của một phiên trong cùng một transaction."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM summaries WHERE session_id = ?", (session_id,))
+
+    def sessions(self, user_id):
+        """Các phiên của user, phiên hoạt động gần nhất trước."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT session_id, MAX(id) AS last_id FROM messages WHERE user_id = ?"
+                " GROUP BY session_id ORDER BY last_id DESC",
+                (user_id,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+
+# Từ quá phổ biến, bỏ khỏi truy vấn toàn văn để "what is the British Museum" vẫn khớp mục "British Museum"
+PACK_STOP_WORDS = {
+    'a', 'an', 'the', 'of', 'in', 'on', 'at', 'to', 'for', 'and', 'or', 'is', 'are', 'was', 'what', 'who',
+    'when', 'where', 'which', 'how', 'why', 'about', 'tell', 'me', 'explain', 'meaning', 'definition',
+}
+PACK_TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+
+class KnowledgePack:
+    """Gói kiến thức offline: tóm tắt Wikipedia và mục từ vựng tải sẵn, kèm index toàn văn FTS5 (có stemming).
+
+    Nội dung chỉ lưu một lần trong bảng entries (FTS5 dạng external content, detail=column) nên file gọn,
+    có thể build ở máy có mạng rồi chép sang lớp học không có Internet."""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(DEFAULT_DB_DIR, 'wiki_pack.sqlite3')
+        self._lock = threading.Lock()
+        self._conn = connect(self.db_path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " id INTEGER PRIMARY KEY,"
+                " title TEXT NOT NULL UNIQUE COLLATE NOCASE,"
+                " summary TEXT NOT NULL,"
+                " kind TEXT NOT NULL,"
+                " source TEXT,"
+                " updated_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5("
+                " title, summary, content='entries', content_rowid='id',"
+                " tokenize='porter unicode61 remove_diacritics 2', detail=column)"
+            )
+            # Trigger giữ index toàn văn đồng bộ với bảng entries khi thêm/cập nhật/xóa
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN"
+                " INSERT INTO entries_fts(rowid, title, summary) VALUES (new.id, new.title, new.summary); END"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN"
+                " INSERT INTO entries_fts(entries_fts, rowid, title, summary) VALUES ('delete', old.id, old.title, old.summary); END"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_au AFTER UPDATE ON entries BEGIN"
+                " INSERT INTO entries_fts(entries_fts, rowid, title, summary) VALUES ('delete', old.id, old.title, old.summary);"
+                " INSERT INTO entries_fts(rowid, title, summary) VALUES (new.id, new.title, new.summary); END"
+            )
+
+    def upsert(self, entries):
+        """Thêm hoặc cập nhật các mục [(title, summary, kind, source), ...] trong cùng một transaction."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO entries (title, summary, kind, source, updated_at) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(title) DO UPDATE SET summary = excluded.summary, kind = excluded.kind,"
+                " source = excluded.source, updated_at = excluded.updated_at",
+                [(title, summary, kind, source, now) for title, summary, kind, source in entries],
+            )
+
+    def updated_at(self):
+        """{tiêu đề viết thường: thời điểm cập nhật}, dùng để chỉ tải lại các mục thiếu hoặc đã cũ."""
+        with self._lock:
+            rows = self._conn.execute("SELECT title, updated_at FROM entries").fetchall()
+        return {title.lower(): updated_at for title, updated_at in rows}
+
+    def search(self, query, limit=1):
+        """[(title, summary), ...]: trùng tiêu đề trước, sau đó các mục có mọi từ khóa của truy vấn trong tiêu đề,
+        cuối cùng là trong cả nội dung (xếp hạng BM25, tiêu đề nặng gấp 10 lần nội dung)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT title, summary FROM entries WHERE title = ?", (query.strip(),)
+            ).fetchall()
+            if rows:
+                return rows
+            terms = [term for term in PACK_TOKEN_PATTERN.findall(query.lower()) if term not in PACK_STOP_WORDS]
+            if not terms:
+                return []
+            match = ' '.join(f'"{term}"' for term in terms[:16])
+            # Khớp trên tiêu đề trước: ít mục hơn nên nhanh hơn, và thường chính là trang cần tìm
+            for expression in (f"title : ({match})", match):
+                rows = self._conn.execute(
+                    "SELECT e.title, e.summary FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid"
+                    " WHERE entries_fts MATCH ? ORDER BY bm25(entries_fts, 10.0, 1.0) LIMIT ?",
+                    (expression, limit),
+                ).fetchall()
+                if rows:
+                    return rows
+            return []
+
+    def lookup(self, query, top_k=1, max_chars=None):
+        """Kết quả cùng định dạng với WikipediaAPIWrapper ("Page: ...\\nSummary: ..."), hoặc None nếu không có."""
+        rows = self.search(query, top_k)
+        if not rows:
+            return None
+        text = "\n\n".join(f"Page: {title}\nSummary: {summary}" for title, summary in rows)
+        return text[:max_chars] if max_chars else text
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+class LessonPack:
+    """Gói bài học soạn sẵn: giải thích và bài tập cho từng chủ đề ngữ pháp ở mỗi trình độ, build offline từ tài
+    liệu RAG (python setup_database.py --lesson-pack) kèm index toàn văn FTS5 trên tiêu đề và từ khóa chủ đề.
+
+    Mỗi mục ghi lại hash của các đoạn tài liệu dùng để soạn, phiên bản prompt và khóa index tài liệu (index_key):
+    lần build sau chỉ soạn lại mục có nguồn hoặc prompt đã đổi. Khi có index_key, chỉ các mục đã build (hoặc xác
+    nhận lại) với đúng phiên bản tài liệu đó mới được trả về."""
+
+    def __init__(self, db_path=None, index_key=None):
+        self.db_path = db_path or os.path.join(DEFAULT_DB_DIR, 'lesson_pack.sqlite3')
+        self.index_key = index_key
+        self._lock = threading.Lock()
+        self._conn = connect(self.db_path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS lessons ("
+                " id INTEGER PRIMARY KEY,"
+                " topic TEXT NOT NULL,"
+                " level TEXT NOT NULL,"
+                " title TEXT NOT NULL,"
+                " keywords TEXT NOT NULL,"
+                " explanation TEXT NOT NULL,"
+                " exercises TEXT NOT NULL,"
+                " sources TEXT,"
+                " source_hash TEXT NOT NULL,"
+                " version INTEGER NOT NULL,"
+                " index_key TEXT NOT NULL,"
+                " model TEXT,"
+                " updated_at REAL NOT NULL,"
+                " UNIQUE (topic, level))"
+            )
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS lessons_fts USING fts5("
+                " title, keywords, content='lessons', content_rowid='id',"
+                " tokenize='porter unicode61 remove_diacritics 2', detail=column)"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS lessons_ai AFTER INSERT ON lessons BEGIN"
+                " INSERT INTO lessons_fts(rowid, title, keywords) VALUES (new.id, new.title, new.keywords); END"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS lessons_ad AFTER DELETE ON lessons BEGIN"
+                " INSERT INTO lessons_fts(lessons_fts, rowid, title, keywords) VALUES ('delete', old.id, old.title, old.keywords); END"
+            )
+            # Chỉ đánh index lại khi tiêu đề/từ khóa đổi: xác nhận lại index_key không chạm vào FTS
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS lessons_au AFTER UPDATE OF title, keywords ON lessons BEGIN"
+                " INSERT INTO lessons_fts(lessons_fts, rowid, title, keywords) VALUES ('delete', old.id, old.title, old.keywords);"
+                " INSERT INTO lessons_fts(rowid, title, keywords) VALUES (new.id, new.title, new.keywords); END"
+            )
+
+    def upsert(self, entries):
+        """Thêm hoặc cập nhật các mục [(topic, level, title, keywords, explanation, exercises, sources, source_hash,
+        version, index_key, model), ...] trong cùng một transaction."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO lessons (topic, level, title, keywords, explanation, exercises, sources, source_hash,"
+                " version, index_key, model, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(topic, level) DO UPDATE SET title = excluded.title, keywords = excluded.keywords,"
+                " explanation = excluded.explanation, exercises = excluded.exercises, sources = excluded.sources,"
+                " source_hash = excluded.source_hash, version = excluded.version, index_key = excluded.index_key,"
+                " model = excluded.model, updated_at = excluded.updated_at",
+                [(*entry, now) for entry in entries],
+            )
+
+    def revisions(self):
+        """{(topic, level): (source_hash, version)}, dùng để chỉ soạn lại các mục thiếu hoặc đã cũ."""
+        with self._lock:
+            rows = self._conn.execute("SELECT topic, level, source_hash, version FROM lessons").fetchall()
+        return {(topic, level): (source_hash, version) for topic, level, source_hash, version in rows}
+
+    def confirm(self, keys, index_key, title_keywords=None):
+        """Gắn index_key mới cho các mục [(topic, level), ...] có nguồn không đổi (không cần soạn lại);
+        title_keywords {topic: (title, keywords)} cập nhật luôn tiêu đề/từ khóa nếu danh sách chủ đề đã sửa."""
+        title_keywords = title_keywords or {}
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE lessons SET index_key = ? WHERE topic = ? AND level = ?",
+                [(index_key, topic, level) for topic, level in keys],
+            )
+            self._conn.executemany(
+                "UPDATE lessons SET title = ?, keywords = ? WHERE topic = ? AND (title != ? OR keywords != ?)",
+                [(title, keywords, topic, title, keywords) for topic, (title, keywords) in title_keywords.items()],
+            )
+
+    def remove(self, keys):
+        """Xóa các mục [(topic, level), ...] (chủ đề/trình độ không còn trong danh sách)."""
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM lessons WHERE topic = ? AND level = ?", list(keys))
+
+    def candidates(self, query, level, limit=20):
+        """[(topic, title, keywords, explanation, exercises, sources), ...] của trình độ `level` có ít nhất một từ
+        của truy vấn trong tiêu đề hoặc từ khóa, xếp hạng BM25. Người gọi tự kiểm tra cụm từ khóa có thật sự khớp."""
+        # Không bỏ stop word: "a", "an", "the" chính là từ khóa của chủ đề mạo từ
+        terms = list(dict.fromkeys(PACK_TOKEN_PATTERN.findall(query.lower())))
+        if not terms:
+            return []
+        match = ' OR '.join(f'"{term}"' for term in terms[:32])
+        sql = (
+            "SELECT l.topic, l.title, l.keywords, l.explanation, l.exercises, l.sources"
+            " FROM lessons_fts JOIN lessons l ON l.id = lessons_fts.rowid"
+            " WHERE lessons_fts MATCH ? AND l.level = ?"
+        )
+        params = [match, level]
+        if self.index_key is not None:
+            sql += " AND l.index_key = ?"
+            params.append(self.index_key)
+        sql += " ORDER BY bm25(lessons_fts, 2.0, 1.0) LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM lessons").fetchone()[0]
@@ -1,12 +1,37 @@
 import streamlit as st
 import sys
 import os
+import time
 
 # Add parent directory to path to import agent
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from agent.tutor_agent import EnglishTutorAgent
 
+WELCOME_MESSAGE = {"role": "assistant", "content": "Chào mừng bạn! Tôi là gia sư tiếng Anh AI của bạn. Hãy cùng bắt đầu nhé!"}
+# Chỉ vẽ các tin nhắn gần nhất; mỗi lần bấm "Tải tin nhắn cũ hơn" hiện thêm một trang
+HISTORY_PAGE_SIZE = int(os.getenv('TUTOR_UI_PAGE_SIZE', '20'))
+
+
+def load_messages(tutor, limit):
+    """Tin nhắn chào mừng + `limit` tin nhắn gần nhất của phiên; kèm cờ cho biết đã nạp hết lịch sử chưa."""
+    history = tutor.get_chat_history(limit=limit)
+    return [WELCOME_MESSAGE] + history, len(history) < limit
+
+
+def reset_chat_state(tutor):
+    st.session_state.messages, st.session_state.history_complete = load_messages(tutor, 2 * HISTORY_PAGE_SIZE)
+    st.session_state.history_window = HISTORY_PAGE_SIZE
+
+
+def load_older_messages():
+    state = st.session_state
+    state.history_window += HISTORY_PAGE_SIZE
+    # Lịch sử lưu trên SQLite chỉ được nạp thêm khi người dùng thật sự cuộn lên tới đó
+    if not state.history_complete and state.history_window >= len(state.messages):
+        state.messages, state.history_complete = load_messages(state.tutor, state.history_window + HISTORY_PAGE_SIZE)
+
+
 def main():
     st.set_page_config(
         page_title="English AI Tutor",
@@ -19,9 +44,11 @@ def main():
     
     # Initialize agent in session state
     if 'tutor' not in st.session_state:
-        st.session_state.tutor = EnglishTutorAgent()
-        # Khởi tạo tin nhắn ban đầu để hiển thị, LangChain memory sẽ quản lý chính
-        st.session_state.messages = [{"role": "assistant", "content": "Chào mừng bạn! Tôi là gia sư tiếng Anh AI của bạn. Hãy cùng bắt đầu nhé!"}]
+        # Mã phiên nằm trên URL để tải lại trang (hoặc server khởi động lại) vẫn tiếp tục được cuộc trò chuyện
+        st.session_state.tutor = EnglishTutorAgent(session_id=st.query_params.get("session"))
+        st.query_params["session"] = st.session_state.tutor.session_id
+        # Tin nhắn để hiển thị (chỉ vài trang gần nhất), LangChain memory sẽ quản lý chính
+        reset_chat_state(st.session_state.tutor)
         
     # Sidebar for settings
     with st.sidebar:
@@ -44,16 +71,18 @@ def main():
         st.subheader("Model và Thông tin") # Đổi tiêu đề cho phù hợp
         # Hiển thị thông tin model hiện tại
         model_info = st.session_state.tutor.get_model_info()
-        st.write(f"**Model hiện tại:** {model_info['current_model']}")
+        if model_info['current_tier'] == 'auto':
+            st.write("**Model hiện tại:** auto (chọn theo từng yêu cầu)")
+        else:
+            st.write(f"**Model hiện tại:** {model_info['current_model']}")
         st.write(f"**Chi phí:** {model_info['cost']}")
 
         # Tùy chọn chuyển đổi model (đã có từ trước)
         selected_model_tier = st.selectbox(
             "Chọn loại model:",
-            ['fast', 'balanced', 'smart', 'coding'],
-            index=['fast', 'balanced', 'smart', 'coding'].index(
-                next(key for key, value in model_info['available_models'].items() if value == model_info['current_model'])
-            )
+            list(model_info['model_info']),
+            index=list(model_info['model_info']).index(model_info['current_tier']),
+            format_func=lambda tier: f"{tier} - {model_info['model_info'][tier]}",
         )
         if st.button("Chuyển đổi Model"):
             st.session_state.tutor.switch_model(selected_model_tier)
@@ -62,18 +91,48 @@ def main():
             
         st.divider()
         
+        st.checkbox("🔍 Hiện thông tin debug", key="show_debug", help="Độ trễ, token, tool và cache của lượt gần nhất")
+
         if st.button("🗑️ Xóa cuộc trò chuyện"):
-            st.session_state.tutor = EnglishTutorAgent() # Khởi tạo lại Agent để reset memory
-            st.session_state.messages = [{"role": "assistant", "content": "Chào mừng bạn! Tôi là gia sư tiếng Anh AI của bạn. Hãy cùng bắt đầu nhé!"}]
+            st.session_state.tutor = EnglishTutorAgent() # Khởi tạo lại Agent (phiên mới) để reset memory
+            st.query_params["session"] = st.session_state.tutor.session_id
+            reset_chat_state(st.session_state.tutor)
             st.rerun()
     
     # Chat interface
     st.header("💬 Trò chuyện")
+    chat_panel()
     
+    # Text analysis section
+    st.divider()
+    st.header("📝 Phân tích văn bản")
+    analysis_panel()
+
+    # Nạp trước các tool nặng (FAISS, Wikipedia) ở nền sau khi trang đã hiển thị
+    if not st.session_state.get('warm_up_started'):
+        st.session_state.tutor.warm_up(background=True)
+        st.session_state.warm_up_started = True
+
+
+@st.fragment
+def chat_panel():
+    """Khung chat chạy lại độc lập: gửi tin nhắn hay tải tin cũ chỉ vẽ lại phần này, không chạy lại sidebar
+    và khung phân tích. Chỉ HISTORY_PAGE_SIZE tin nhắn gần nhất được vẽ nên thời gian vẽ không tăng theo độ dài phiên."""
+    start = time.perf_counter()
+    messages = st.session_state.messages
+    window = st.session_state.history_window
+    hidden = max(len(messages) - window, 0)
+    if hidden or not st.session_state.history_complete:
+        label = f"⬆️ Tải tin nhắn cũ hơn ({hidden} tin nhắn)" if hidden else "⬆️ Tải tin nhắn cũ hơn"
+        # Callback chạy trước lần vẽ lại khung chat nên không cần st.rerun
+        st.button(label, key="load_older", on_click=load_older_messages)
+
     # Display chat history
-    for message in st.session_state.messages:
+    for message in messages[-window:]:
         with st.chat_message(message["role"]):
             st.write(message["content"])
+    # Thời gian vẽ lịch sử ở lần chạy này (không tính thời gian chờ agent trả lời), hiện trong phần debug
+    st.session_state.chat_render_ms = (time.perf_counter() - start) * 1000
     
     # Chat input
     if prompt := st.chat_input("Nhập tin nhắn của bạn..."):
@@ -82,20 +141,63 @@ def main():
         with st.chat_message("user"):
             st.write(prompt)
         
-        # Get AI response
+        # Get AI response, hiển thị dần từng token ngay khi agent trả về
         with st.chat_message("assistant"):
-            with st.spinner("Đang suy nghĩ..."):
-                # Gọi phương thức chat mới đã được tích hợp LangChain
-                response = st.session_state.tutor.run_agent_chat(prompt) 
-                st.write(response)
+            status = st.empty()
+            placeholder = st.empty()
+            status.caption("Đang suy nghĩ...")
+            response = ""
+            for event in st.session_state.tutor.stream_agent_chat(prompt):
+                if event["type"] == "token":
+                    if not response:
+                        status.empty()
+                    response += event["content"]
+                    placeholder.write(response + "▌")
+                elif event["type"] == "tool_start":
+                    status.caption(f"🔧 Đang dùng công cụ: {event['tool']}...")
+                elif event["type"] == "tool_end":
+                    status.caption("Đang suy nghĩ...")
+                else:
+                    # "final" / "error" chứa câu trả lời hoàn chỉnh
+                    response = event["content"]
+            status.empty()
+            placeholder.write(response)
+            study_plan = st.session_state.tutor.last_study_plan
+            if study_plan is not None:
+                # Tải file .ics ngay trên trình duyệt; on_click="ignore" để không chạy lại khung chat
+                st.download_button("📅 Tải lịch học (.ics)", data=study_plan.to_ics(),
+                                   file_name=study_plan.file_name, mime="text/calendar", on_click="ignore")
         
         # Add AI response to chat history
         st.session_state.messages.append({"role": "assistant", "content": response})
-    
-    # Text analysis section
-    st.divider()
-    st.header("📝 Phân tích văn bản")
-    
+
+
+    last_turn = st.session_state.tutor.last_turn
+    if st.session_state.get('show_debug') and last_turn:
+        with st.expander(f"🔍 Lượt gần nhất: {last_turn['route']} - {last_turn['duration_ms']:.0f} ms", expanded=True):
+            st.caption(f"Vẽ lại khung chat: {st.session_state.chat_render_ms:.1f} ms "
+                       f"({min(len(st.session_state.messages), st.session_state.history_window)}"
+                       f"/{len(st.session_state.messages)} tin nhắn)")
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Vòng ReAct", last_turn['react_iterations'])
+            col2.metric("Token prompt", last_turn['prompt_tokens'])
+            col3.metric("Token completion", last_turn['completion_tokens'])
+            if last_turn['llm_calls']:
+                st.write("**Lời gọi LLM**")
+                st.dataframe(last_turn['llm_calls'], use_container_width=True)
+            if last_turn['tool_calls']:
+                st.write("**Tool**")
+                st.dataframe(last_turn['tool_calls'], use_container_width=True)
+            if last_turn['cache']:
+                st.write("**Cache**")
+                st.json(last_turn['cache'])
+            if last_turn['error']:
+                st.error(last_turn['error'])
+
+
+@st.fragment
+def analysis_panel():
+    """Khung phân tích chạy lại độc lập với khung chat: bấm "Phân tích" không vẽ lại lịch sử trò chuyện."""
     text_to_analyze = st.text_area(
         "Nhập đoạn văn bản tiếng Anh để phân tích:",
         height=100,
@@ -104,13 +206,11 @@ def main():
     
     if st.button("🔍 Phân tích"):
         if text_to_analyze.strip():
-            with st.spinner("Đang phân tích..."):
-                analysis = st.session_state.tutor.analyze_text(text_to_analyze)
-                st.write("**Kết quả phân tích:**")
-                st.write(analysis)
+            st.write("**Kết quả phân tích:**")
+            st.write_stream(st.session_state.tutor.stream_analyze_text(text_to_analyze))
         else:
             st.warning("Vui lòng nhập văn bản cần phân tích.")
-            
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,69 @@
+"""Điểm chạy dòng lệnh (không cần giao diện Streamlit) cho English AI Tutor.
+
+    python run_app.py batch-analyze essays.csv results.jsonl --concurrency 4 --rpm 15
+    python run_app.py serve --port 8000 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+def batch_analyze(args):
+    from agent.batch import analyze_batch
+    from agent.tutor_agent import EnglishTutorAgent
+
+    tutor = EnglishTutorAgent()
+    if args.level:
+        tutor.update_user_level(args.level)
+
+    stats = asyncio.run(analyze_batch(
+        tutor,
+        args.input,
+        args.output,
+        concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+        max_retries=args.max_retries,
+        id_field=args.id_field,
+        text_field=args.text_field,
+    ))
+    print(f"Đã phân tích {stats['processed']} bài ({stats['duplicates']} bài trùng, "
+          f"{stats['skipped']} bài bỏ qua từ checkpoint, {stats['errors']} lỗi, {stats['retries']} lần thử lại) "
+          f"trong {stats['elapsed_s']:.1f}s - {stats['essays_per_minute']:.1f} bài/phút", file=sys.stderr)
+
+
+def serve(args):
+    from agent.server import serve as run_server
+
+    run_server(args.host, args.port, args.workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="English AI Tutor - chạy từ dòng lệnh.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    batch = subparsers.add_parser('batch-analyze', help="Phân tích hàng loạt bài viết từ file CSV/JSONL.")
+    batch.add_argument('input', help="File .csv hoặc .jsonl chứa các bài viết.")
+    batch.add_argument('output', help="File .jsonl ghi kết quả (đồng thời là checkpoint để chạy tiếp).")
+    batch.add_argument('--concurrency', type=int, default=4, help="Số request chạy song song.")
+    batch.add_argument('--rpm', type=float, default=None, help="Giới hạn số request mỗi phút (theo quota Gemini).")
+    batch.add_argument('--max-retries', type=int, default=5)
+    batch.add_argument('--level', choices=['beginner', 'intermediate', 'advanced'])
+    batch.add_argument('--id-field', default='id')
+    batch.add_argument('--text-field', default='text')
+    batch.set_defaults(handler=batch_analyze)
+
+    server = subparsers.add_parser('serve', help="Chạy server HTTP (chat, analyze, retrieve) với nhiều worker process.")
+    server.add_argument('--host', default='127.0.0.1')
+    server.add_argument('--port', type=int, default=8000)
+    server.add_argument('--workers', type=int, default=None, help="Số worker process (mặc định bằng số core).")
+    server.set_defaults(handler=serve)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
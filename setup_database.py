@@ -0,0 +1,220 @@
+"""Build offline các index dùng cho English AI Tutor.
+
+Chạy một lần trước khi deploy (hoặc khi tài liệu trong docs/ thay đổi):
+
+    python setup_database.py                 # chỉ embed lại tài liệu mới/đã thay đổi
+    python setup_database.py --force         # build lại toàn bộ
+    python setup_database.py --docs-dir /path/to/grammar-library --workers 8   # server: TUTOR_DOCS_DIR cùng thư mục
+    python setup_database.py --wiki-pack --skip-rag          # chỉ build/cập nhật gói Wikipedia offline
+    python setup_database.py --wiki-import vocabulary.jsonl  # nhập mục từ vựng/tóm tắt đã tải sẵn
+    python setup_database.py --lesson-pack                   # soạn bài học theo trình độ cho chủ đề mới/tài liệu đã đổi
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from agent.ann_index import AnnIndexConfig, apply_ann_index
+from agent.retrieval import load_or_build_keyword_index
+from agent.ingestion import (
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    DOCS_DIR,
+    EMBEDDING_MODEL_NAME,
+    INDEX_DIR,
+    ingest_directory,
+    settings_key,
+)
+
+WIKI_TOPICS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'wiki_topics.txt')
+# Đủ cho doc_content_chars_max hiện tại (500) và để dư nếu sau này tăng giới hạn
+WIKI_SUMMARY_MAX_CHARS = 2000
+
+
+def build_rag_index(docs_dir=DOCS_DIR, force=False, workers=None):
+    key = settings_key(docs_dir, CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_MODEL_NAME)
+    print(f"Index {key} (docs={os.path.realpath(docs_dir)}, chunk_size={CHUNK_SIZE}, chunk_overlap={CHUNK_OVERLAP}, "
+          f"model={EMBEDDING_MODEL_NAME})")
+
+    from langchain.embeddings import HuggingFaceEmbeddings
+
+    start = time.perf_counter()
+    embedding_model = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+    vectorstore, report = ingest_directory(embedding_model, docs_dir=docs_dir, force_rebuild=force, workers=workers)
+    elapsed = time.perf_counter() - start
+
+    print(f"{report['files']} tài liệu: {report['changed']} mới/thay đổi, {report['removed']} đã xóa")
+    if report['changed']:
+        print(f"Đã xử lý {report['pages']} trang, {report['chunks']} chunks trong {report['elapsed_s']:.1f}s "
+              f"({report['pages_per_s']:.1f} trang/s, {report['chunks_per_s']:.1f} chunks/s)")
+    print(f"Index có {len(vectorstore.index_to_docstore_id)} chunks tại "
+          f"{os.path.join(os.path.abspath(INDEX_DIR), key)} ({elapsed:.1f}s)")
+
+    keyword_index = load_or_build_keyword_index(vectorstore, os.path.join(INDEX_DIR, key))
+    print(f"Inverted index từ khóa: {len(keyword_index.postings)} từ khóa")
+
+    # Build sẵn index ANN (nếu cấu hình TUTOR_RAG_INDEX / TUTOR_RAG_QUANTIZATION) để server không phải build lúc khởi động
+    ann_config = AnnIndexConfig.from_env()
+    if not ann_config.is_exact:
+        ann_start = time.perf_counter()
+        apply_ann_index(vectorstore, ann_config, os.path.join(INDEX_DIR, key))
+        print(f"Index tìm kiếm {ann_config.build_key} sẵn sàng ({time.perf_counter() - ann_start:.1f}s)")
+
+
+def fetch_wikipedia_summary(title):
+    """(tiêu đề chuẩn, tóm tắt) của một trang Wikipedia tiếng Anh, hoặc None nếu không tải được
+    (không có trang, trang mơ hồ, lỗi mạng); chủ đề đó sẽ được thử lại ở lần cập nhật sau."""
+    import wikipedia
+
+    try:
+        page = wikipedia.page(title, auto_suggest=False)
+        return page.title, page.summary[:WIKI_SUMMARY_MAX_CHARS]
+    except Exception:
+        return None
+
+
+def load_pack_entries(path):
+    """Các mục từ file JSONL {"title", "summary", "kind" (mặc định 'vocabulary'), "source"}."""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                yield item['title'], item['summary'], item.get('kind', 'vocabulary'), item.get('source', path)
+
+
+def build_wiki_pack(pack_path=None, topics_file=None, import_file=None, workers=8, max_age_days=None):
+    """Build/cập nhật gói kiến thức offline: nhập file JSONL (nếu có) và tải tóm tắt Wikipedia cho các chủ đề
+    còn thiếu (hoặc cũ hơn max_age_days ngày). Chạy lại nhiều lần được, chỉ phần thiếu mới gọi mạng."""
+    from database.db_manager import DEFAULT_DB_DIR, KnowledgePack
+
+    pack_path = pack_path or os.getenv('TUTOR_WIKI_PACK') or os.path.join(DEFAULT_DB_DIR, 'wiki_pack.sqlite3')
+    pack = KnowledgePack(pack_path)
+
+    if import_file:
+        entries = list(load_pack_entries(import_file))
+        pack.upsert(entries)
+        print(f"Đã nhập {len(entries)} mục từ {import_file}")
+
+    if topics_file:
+        with open(topics_file, encoding='utf-8') as f:
+            topics = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        updated_at = pack.updated_at()
+        cutoff = time.time() - max_age_days * 86400 if max_age_days is not None else None
+        pending = [
+            topic for topic in topics
+            if topic.lower() not in updated_at or (cutoff is not None and updated_at[topic.lower()] < cutoff)
+        ]
+        print(f"{len(topics)} chủ đề, {len(pending)} cần tải từ Wikipedia")
+
+        start = time.perf_counter()
+        fetched, failed = [], []
+        # Mỗi lần tải chủ yếu là chờ mạng nên dùng thread
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+            for topic, result in zip(pending, pool.map(fetch_wikipedia_summary, pending)):
+                if result is None:
+                    failed.append(topic)
+                    continue
+                title, summary = result
+                fetched.append((title, summary, 'wikipedia', 'en.wikipedia.org'))
+                if title.lower() != topic.lower():
+                    # Lưu cả tên chủ đề gốc để lần cập nhật sau không tải lại và tra đúng tên vẫn trúng ngay
+                    fetched.append((topic, summary, 'wikipedia', f'en.wikipedia.org/{title}'))
+        pack.upsert(fetched)
+        print(f"Đã tải {len(pending) - len(failed)} trang trong {time.perf_counter() - start:.1f}s"
+              + (f"; không tải được (không có trang, trang mơ hồ hoặc lỗi mạng): {', '.join(failed)}" if failed else ""))
+
+    size_mb = os.path.getsize(pack_path) / 1e6
+    print(f"Gói kiến thức offline: {len(pack)} mục, {size_mb:.2f} MB tại {os.path.abspath(pack_path)}")
+
+
+def build_lesson_pack(pack_path=None, topics_file=None, docs_dir=DOCS_DIR, workers=4, force=False):
+    """Soạn/cập nhật gói bài học theo trình độ từ index tài liệu của docs_dir (chạy sau build_rag_index).
+    Chạy lại nhiều lần được: chỉ chủ đề mới hoặc có đoạn tài liệu nguồn đã đổi mới gọi LLM."""
+    from agent import lesson_pack
+    from agent.ingestion import compute_index_key, load_or_build_vectorstore
+    from agent.model_router import TASK_ANALYSIS
+    from agent.retrieval import HybridRetriever, load_or_build_keyword_index
+    from database.db_manager import DEFAULT_DB_DIR, LessonPack
+    from utils.helper import (
+        get_embedding_model,
+        get_generative_model,
+        get_hybrid_retriever,
+        get_model_router,
+        get_vectorstore,
+    )
+
+    pack_path = pack_path or os.getenv('TUTOR_LESSON_PACK') or os.path.join(DEFAULT_DB_DIR, 'lesson_pack.sqlite3')
+    pack = LessonPack(pack_path)
+    topics = lesson_pack.load_topics(topics_file or lesson_pack.LESSON_TOPICS)
+    if os.path.realpath(docs_dir) == os.path.realpath(DOCS_DIR):
+        retriever = get_hybrid_retriever() or HybridRetriever(get_vectorstore())
+    else:
+        vectorstore = load_or_build_vectorstore(get_embedding_model(), docs_dir=docs_dir)
+        index_path = os.path.join(INDEX_DIR, settings_key(docs_dir))
+        retriever = HybridRetriever(vectorstore, load_or_build_keyword_index(vectorstore, index_path))
+    router = get_model_router()
+
+    def generate(prompt):
+        return router.call(
+            TASK_ANALYSIS, len(prompt),
+            lambda model: (get_generative_model(model).generate_content(prompt).text, model),
+        )
+
+    report = lesson_pack.build_lesson_pack(pack, topics, retriever, generate, compute_index_key(docs_dir),
+                                           workers=workers, force=force)
+    print(f"{report['topics']} chủ đề x {len(lesson_pack.LEVELS)} trình độ: {report['generated']} bài soạn mới, "
+          f"{report['unchanged']} giữ nguyên, {report['removed']} đã xóa ({report['elapsed_s']:.1f}s)")
+    if report['failed']:
+        print(f"Soạn lỗi (sẽ thử lại ở lần chạy sau): {'; '.join(report['failed'])}")
+    size_mb = os.path.getsize(pack_path) / 1e6
+    print(f"Gói bài học: {report['entries']} bài, {size_mb:.2f} MB tại {os.path.abspath(pack_path)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build các index offline cho English AI Tutor.")
+    parser.add_argument('--force', action='store_true', help="Build lại index kể cả khi đã có sẵn.")
+    parser.add_argument('--docs-dir', default=DOCS_DIR,
+                        help="Thư mục tài liệu (PDF, TXT, MD); mặc định TUTOR_DOCS_DIR hoặc docs/.")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Số process trích xuất song song (mặc định: số CPU, 0 = tuần tự).")
+    parser.add_argument('--skip-rag', action='store_true', help="Không build index tài liệu (RAG).")
+    parser.add_argument('--wiki-pack', action='store_true',
+                        help="Build/cập nhật gói Wikipedia offline từ danh sách chủ đề (--wiki-topics).")
+    parser.add_argument('--wiki-topics', default=WIKI_TOPICS, help="File chủ đề, mỗi dòng một tiêu đề trang.")
+    parser.add_argument('--wiki-import', help="Nhập các mục từ file JSONL (title, summary, kind, source).")
+    parser.add_argument('--wiki-max-age', type=float, default=None,
+                        help="Tải lại các mục cũ hơn số ngày này (mặc định chỉ tải mục còn thiếu).")
+    parser.add_argument('--wiki-path', default=None, help="File gói (mặc định TUTOR_WIKI_PACK hoặc data/wiki_pack.sqlite3).")
+    parser.add_argument('--lesson-pack', action='store_true',
+                        help="Soạn/cập nhật gói bài học theo trình độ từ tài liệu (mỗi bài một lời gọi LLM).")
+    parser.add_argument('--lesson-topics', default=None,
+                        help="File chủ đề bài học (mặc định database/lesson_topics.txt).")
+    parser.add_argument('--lesson-path', default=None,
+                        help="File gói bài học (mặc định TUTOR_LESSON_PACK hoặc data/lesson_pack.sqlite3).")
+    args = parser.parse_args()
+
+    if os.path.realpath(args.docs_dir) != os.path.realpath(DOCS_DIR):
+        # Index và gói bài học được khóa theo thư mục tài liệu: server chỉ dùng chúng khi đọc cùng thư mục
+        print(f"Lưu ý: chạy server với TUTOR_DOCS_DIR={os.path.realpath(args.docs_dir)} để dùng index vừa build")
+    if not args.skip_rag:
+        build_rag_index(docs_dir=args.docs_dir, force=args.force, workers=args.workers)
+    if args.wiki_pack or args.wiki_import:
+        build_wiki_pack(
+            pack_path=args.wiki_path,
+            topics_file=args.wiki_topics if args.wiki_pack else None,
+            import_file=args.wiki_import,
+            workers=args.workers or 8,
+            max_age_days=args.wiki_max_age,
+        )
+    if args.lesson_pack:
+        # --force cũng soạn lại toàn bộ bài học
+        build_lesson_pack(pack_path=args.lesson_path, topics_file=args.lesson_topics, docs_dir=args.docs_dir,
+                          workers=args.workers or 4, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
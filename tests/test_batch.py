@@ -0,0 +1,48 @@
+import asyncio
+import json
+
+from agent import batch
+from agent.batch import analyze_batch
+
+
+class _Tutor:
+    """aanalyze_text giả: ném lần lượt các lỗi trong `errors` rồi trả về kết quả."""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def aanalyze_text(self, text, user_id=None, raise_errors=False):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return f"analysis: {text}"
+
+
+def _run(tmp_path, tutor, essays, max_retries=2):
+    input_path, output_path = tmp_path / 'essays.jsonl', tmp_path / 'results.jsonl'
+    input_path.write_text("".join(json.dumps({'id': i, 'text': text}) + "\n" for i, text in enumerate(essays)),
+                          encoding='utf-8')
+    stats = asyncio.run(analyze_batch(tutor, str(input_path), str(output_path), concurrency=2,
+                                      max_retries=max_retries))
+    records = [json.loads(line) for line in output_path.read_text(encoding='utf-8').splitlines()]
+    return stats, records
+
+
+def test_invalid_request_is_not_retried(tmp_path):
+    tutor = _Tutor([ValueError("400 invalid argument")])
+    stats, records = _run(tmp_path, tutor, ["I go to school."])
+    assert tutor.calls == 1
+    assert stats['retries'] == 0
+    assert records[0]['status'] == 'error'
+
+
+def test_rate_limit_is_retried(tmp_path, monkeypatch):
+    # Jitter nhỏ nhất: chờ 0.5s trước lần thử lại
+    monkeypatch.setattr(batch.random, 'random', lambda: 0.0)
+    tutor = _Tutor([RuntimeError("429 Resource has been exhausted")])
+    stats, records = _run(tmp_path, tutor, ["I go to school.", "I go to school."])
+    assert tutor.calls == 2
+    assert stats['retries'] == 1
+    assert stats['duplicates'] == 1
+    assert [record['status'] for record in records] == ['ok', 'ok']
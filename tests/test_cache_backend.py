@@ -0,0 +1,21 @@
+from database.db_manager import SQLiteCacheBackend
+
+
+def test_entry_count_is_checked_once_per_batch_of_writes(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / 'cache.sqlite3'), max_entries=20, evict_every=5)
+    statements = []
+    backend._conn.set_trace_callback(statements.append)
+
+    for i in range(50):
+        backend.set(f"key-{i}", f"value-{i}")
+    backend._conn.set_trace_callback(None)
+
+    assert sum(statement.startswith("SELECT COUNT(*)") for statement in statements) == 50 // 5
+    assert len(backend) == backend.max_entries
+    assert backend.get("key-49") == "value-49"
+    assert backend.get("key-0") is None
+
+
+def test_default_batch_scales_with_max_entries(tmp_path):
+    assert SQLiteCacheBackend(str(tmp_path / 'a.sqlite3'), max_entries=50).evict_every == 1
+    assert SQLiteCacheBackend(str(tmp_path / 'b.sqlite3'), max_entries=100_000).evict_every == 1000
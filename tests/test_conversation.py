@@ -0,0 +1,103 @@
+import sqlite3
+from types import SimpleNamespace
+
+from agent.context import BudgetedConversationMemory
+from agent.conversation import SQLiteChatMessageHistory
+from database.db_manager import ConversationStore
+from langchain_core.messages import AIMessage, HumanMessage
+
+
+class _Summarizer:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.prompts = []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        if self.fail:
+            raise RuntimeError("503 Service Unavailable")
+        return SimpleNamespace(content="Học viên luyện thì hiện tại hoàn thành.")
+
+
+def _memory(store, summarizer, session_id='session'):
+    return BudgetedConversationMemory(
+        chat_memory=SQLiteChatMessageHistory(store, 'user', session_id), k=2, summarizer=summarizer,
+        summarize_in_background=False, return_messages=True,
+    )
+
+
+def _turns(memory, count, start=0):
+    for i in range(start, start + count):
+        memory.save_context({"input": f"question {i}"}, {"output": f"answer {i}"})
+
+
+def test_clear_removes_only_this_session(tmp_path):
+    store = ConversationStore(str(tmp_path / 'conversations.sqlite3'))
+    history = SQLiteChatMessageHistory(store, 'user', 'session-a')
+    other = SQLiteChatMessageHistory(store, 'user', 'session-b')
+    history.add_messages([HumanMessage(content="Hi"), AIMessage(content="Hello!")])
+    other.add_messages([HumanMessage(content="Bye")])
+    history.save_summary("Học viên chào hỏi.", 2, 2)
+
+    history.clear()
+
+    assert history.messages == []
+    assert history.load_summary() == ('', 0, 0)
+    assert [message.content for message in other.messages] == ["Bye"]
+    assert store.sessions('user') == ['session-b']
+
+
+def test_pending_messages_are_read_after_last_summarized_id(tmp_path):
+    store = ConversationStore(str(tmp_path / 'conversations.sqlite3'))
+    memory = _memory(store, _Summarizer())
+    _turns(memory, 10)
+    summary, count, last_id = store.get_summary('session')
+    assert summary and count == 16
+
+    statements = []
+    store._conn.set_trace_callback(statements.append)
+    resumed = _memory(store, _Summarizer())
+    history = resumed.buffer_as_messages
+    store._conn.set_trace_callback(None)
+
+    assert [message.content for message in history[1:]] == ["question 8", "answer 8", "question 9", "answer 9"]
+    reads = [statement for statement in statements if "FROM messages" in statement]
+    assert reads and all("OFFSET" not in statement and f"id > {last_id}" in statement for statement in reads)
+
+
+def test_failing_summarizer_does_not_grow_pending_reads(tmp_path):
+    store = ConversationStore(str(tmp_path / 'conversations.sqlite3'))
+    summarizer = _Summarizer(fail=True)
+    memory = _memory(store, summarizer)
+    _turns(memory, 60)
+
+    assert store.get_summary('session') == ('', 0, 0)
+    assert len(memory._pending_messages()) == memory._pending_limit()
+    assert [message.content for message in memory.buffer_as_messages][-1] == "answer 59"
+
+    summarizer.fail = False
+    _turns(memory, 1, start=60)
+    _, _, last_id = store.get_summary('session')
+    assert [message.content for message in memory._pending_messages()] == [
+        "question 59", "answer 59", "question 60", "answer 60",
+    ]
+    assert last_id == int(memory._pending_messages()[0].id) - 1
+
+
+def test_summaries_from_older_files_get_last_message_id(tmp_path):
+    path = str(tmp_path / 'conversations.sqlite3')
+    store = ConversationStore(path)
+    store.append('user', 'session', [('human', f"message {i}") for i in range(6)])
+    store._conn.close()
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("DROP TABLE summaries")
+        conn.execute("CREATE TABLE summaries (session_id TEXT PRIMARY KEY, summary TEXT NOT NULL,"
+                     " message_count INTEGER NOT NULL, updated_at REAL NOT NULL)")
+        conn.execute("INSERT INTO summaries VALUES ('session', 'Tóm tắt cũ.', 4, 0)")
+    conn.close()
+
+    store = ConversationStore(path)
+    summary, count, last_id = store.get_summary('session')
+    assert (summary, count) == ('Tóm tắt cũ.', 4)
+    assert [content for _, _, content in store.messages_after('session', last_id, 10)] == ["message 4", "message 5"]
@@ -0,0 +1,46 @@
+from agent.essay_analysis import AnalysisPlan, chunk_hints, find_issues, overall_score, report_header
+
+WRONG_SENTENCES = "Yesterday I go to school. She can speaks English. I am agree with you. My friend are very kind."
+
+
+def test_sentences_without_rule_matches_still_go_to_the_llm():
+    plan = AnalysisPlan(WRONG_SENTENCES, prepass=True)
+    assert plan.skipped == []
+    assert plan.chunks == [WRONG_SENTENCES]
+    assert "bỏ qua" not in report_header(plan)
+
+
+def test_only_exact_repeats_are_skipped_and_not_scored():
+    plan = AnalysisPlan("I like tea. I like tea.\n\ni  like   TEA. I like coffee.", prepass=True)
+    assert plan.skipped == ["I like tea.", "i  like   TEA."]
+    assert " ".join(plan.chunks).split() == "I like tea. I like coffee.".split()
+    assert overall_score(plan, ["Điểm: 6/10"]) == 6.0
+
+
+def test_prepass_disabled_keeps_repeats():
+    plan = AnalysisPlan("I like tea. I like tea.", prepass=False)
+    assert plan.skipped == []
+    assert plan.chunks == ["I like tea. I like tea."]
+
+
+def test_prepass_choice_of_the_plan_controls_hints():
+    text = "I am study English. She like music."
+    assert chunk_hints(text, AnalysisPlan(text, prepass=False).prepass) == []
+    assert len(chunk_hints(text, AnalysisPlan(text, prepass=True).prepass)) == 2
+
+
+def test_correct_sentences_have_no_issues():
+    for sentence in (
+        "I have come home early today.",
+        "She has become a good doctor.",
+        "He is like his father.",
+        "We need a break, i.e. a short rest.",
+    ):
+        assert find_issues(sentence) == [], sentence
+
+
+def test_rules_still_catch_common_mistakes():
+    assert [issue['rule'] for issue in find_issues("I am study English.")] == ['be_base_verb']
+    assert [issue['rule'] for issue in find_issues("She like music.")] == ['third_person_base_verb']
+    assert [issue['rule'] for issue in find_issues("They have go home.")] == ['perfect_base_verb']
+    assert [issue['rule'] for issue in find_issues("Then i left.")] == ['lowercase_i']
@@ -0,0 +1,13 @@
+from agent.ingestion import DOCS_DIR, compute_index_key, settings_key
+
+
+def test_index_key_depends_on_docs_dir(tmp_path):
+    for directory in ('a', 'b'):
+        (tmp_path / directory).mkdir()
+        (tmp_path / directory / 'notes.txt').write_text("Present simple: I go to school.", encoding='utf-8')
+
+    assert settings_key(str(tmp_path / 'a')) != settings_key(str(tmp_path / 'b'))
+    assert compute_index_key(str(tmp_path / 'a')) != compute_index_key(str(tmp_path / 'b'))
+    # Cùng một thư mục viết theo cách khác vẫn cho cùng một khóa
+    assert settings_key(str(tmp_path / 'a' / '..' / 'a')) == settings_key(str(tmp_path / 'a'))
+    assert settings_key() == settings_key(DOCS_DIR)
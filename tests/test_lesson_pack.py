@@ -0,0 +1,22 @@
+from langchain_core.documents import Document
+
+from agent.lesson_pack import LessonTopic, topic_grounding
+
+
+class _Retriever:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def search(self, query, k):
+        return self.docs[:k]
+
+
+def test_grounding_sources_use_stored_page_numbers():
+    # ingestion lưu số trang PDF bắt đầu từ 1
+    retriever = _Retriever([
+        Document(page_content="Articles: a, an, the.", metadata={'source': 'grammar/book.pdf', 'page': 1}),
+        Document(page_content="Use 'an' before vowel sounds.", metadata={'source': 'grammar/book.pdf', 'page': 7}),
+        Document(page_content="The is definite.", metadata={'source': 'notes.txt', 'page': 1}),
+    ])
+    _, sources, _ = topic_grounding(LessonTopic('articles', 'Articles', 'articles'), retriever)
+    assert sources == "book.pdf p.1; book.pdf p.7; notes.txt"
@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+import pytest
+
+from agent.llm_gateway import CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CircuitOpenError, LLMGateway
+
+MODEL = 'gemini-test'
+
+
+def _open_breaker(gateway):
+    """Một lỗi tạm thời mở breaker (failure_threshold=1), chờ hết reset_timeout để lời gọi kế tiếp là lời gọi thử."""
+    def _unavailable():
+        raise RuntimeError("503 Service Unavailable")
+
+    with pytest.raises(RuntimeError):
+        gateway.call(MODEL, _unavailable)
+    with pytest.raises(CircuitOpenError):
+        gateway.call(MODEL, lambda: 'ok')
+    time.sleep(gateway.reset_timeout * 2)
+
+
+def _gateway():
+    return LLMGateway(max_retries=0, failure_threshold=1, reset_timeout=0.05)
+
+
+def test_probe_failing_with_unclassified_error_releases_half_open_breaker():
+    gateway = _gateway()
+    _open_breaker(gateway)
+
+    def _invalid_request():
+        raise ValueError("400 invalid argument")
+
+    with pytest.raises(ValueError):
+        gateway.call(MODEL, _invalid_request)
+    assert gateway.breaker(MODEL).state == CIRCUIT_HALF_OPEN
+    # Lời gọi thử trước không kết luận được gì: lời gọi sau được thử ngay, thành công thì breaker đóng lại
+    assert gateway.call(MODEL, lambda: 'ok') == 'ok'
+    assert gateway.breaker(MODEL).state == CIRCUIT_CLOSED
+
+
+def test_cancelled_async_probe_releases_half_open_breaker():
+    gateway = _gateway()
+    _open_breaker(gateway)
+
+    async def _cancelled():
+        raise asyncio.CancelledError()
+
+    async def _ok():
+        return 'ok'
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(gateway.acall(MODEL, _cancelled))
+    assert asyncio.run(gateway.acall(MODEL, _ok)) == 'ok'
+
+
+def test_abandoned_stream_probe_releases_half_open_breaker():
+    gateway = _gateway()
+    _open_breaker(gateway)
+
+    stream = gateway.stream(MODEL, lambda: iter(['a', 'b']))
+    assert next(stream) == 'a'
+    stream.close()
+    assert gateway.call(MODEL, lambda: 'ok') == 'ok'
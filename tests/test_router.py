@@ -0,0 +1,53 @@
+import pytest
+
+from agent.router import (
+    ROUTE_AGENT,
+    ROUTE_CALENDAR,
+    ROUTE_SMALL_TALK,
+    ROUTE_STUDY_PLAN,
+    ROUTE_TIME,
+    RouterStats,
+    classify_message,
+)
+
+
+@pytest.mark.parametrize('message', [
+    "How should I plan my study of the present perfect?",
+    "What does the word calendar mean?",
+    "Explain the phrase remind me of",
+    "Can you book-report style study tips?",
+    "What is a good study routine?",
+    "When should I schedule a study session?",
+    "Is 'I booked a class at 7pm' correct?",
+    "Can you add an event clause example?",
+])
+def test_grammar_questions_go_to_the_agent(message):
+    assert classify_message(message) == ROUTE_AGENT
+
+
+@pytest.mark.parametrize('message, route', [
+    ("Schedule an English lesson tomorrow at 7pm", ROUTE_CALENDAR),
+    ("Book a speaking class on Friday at 19:00", ROUTE_CALENDAR),
+    ("Remind me to review vocabulary at 8pm", ROUTE_CALENDAR),
+    ("Put my IELTS exam in my calendar on June 5", ROUTE_CALENDAR),
+    ("Đặt lịch học tiếng Anh lúc 20 giờ ngày mai", ROUTE_CALENDAR),
+    ("Schedule 30 minutes of English every weekday for 8 weeks at 7pm", ROUTE_STUDY_PLAN),
+    ("Lên lịch học mỗi tối thứ hai", ROUTE_STUDY_PLAN),
+    ("What time is it?", ROUTE_TIME),
+    ("Hello teacher!", ROUTE_SMALL_TALK),
+])
+def test_simple_requests_take_the_fast_path(message, route):
+    assert classify_message(message) == route
+
+
+def test_fallbacks_are_not_counted_as_saved_calls():
+    stats = RouterStats()
+    stats.record(ROUTE_CALENDAR, 1)
+    stats.record(ROUTE_CALENDAR, 1, answered=False)
+    stats.record(ROUTE_AGENT, 3)
+
+    calendar = stats.stats()['routes'][ROUTE_CALENDAR]
+    assert (calendar['requests'], calendar['fallbacks']) == (1, 1)
+    # Baseline 2 lời gọi cho lần trả lời được, trừ 1 lời gọi của chính nó và 1 lời gọi trích xuất bị bỏ phí
+    assert calendar['llm_calls_saved'] == 0
+    assert stats.stats()['llm_calls_saved'] == 0
@@ -0,0 +1,196 @@
+"""Cache kết quả cho các lời gọi tốn kém (analyze_text, Wikipedia, tìm kiếm tài liệu)."""
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from utils.metrics import record_cache_event
+
+
+def normalize_text(text, lowercase=False):
+    """Chuẩn hóa text trước khi tạo khóa cache: bỏ khoảng trắng thừa (và chữ hoa nếu cần)."""
+    text = re.sub(r'\s+', ' ', text or '').strip()
+    return text.lower() if lowercase else text
+
+
+def make_cache_key(namespace, parts):
+    """Tạo khóa ổn định từ namespace và các thành phần có thể serialize JSON."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return f"{namespace}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+class LRUCache:
+    """Cache trong bộ nhớ với giới hạn số phần tử (LRU) và thời gian sống (TTL, giây)."""
+
+    def __init__(self, max_size=1024, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ResponseCache:
+    """Cache hai tầng: LRU trong bộ nhớ phía trước, backend lưu trữ (ví dụ SQLite) tùy chọn phía sau.
+    Giá trị phải là chuỗi. Đếm hit/miss theo từng namespace."""
+
+    def __init__(self, memory=None, backend=None, ttl=3600):
+        self.memory = memory if memory is not None else LRUCache(ttl=ttl)
+        self.backend = backend
+        self.ttl = ttl
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _count(self, namespace, field):
+        with self._lock:
+            counters = self._counters.setdefault(namespace, {'hits': 0, 'misses': 0})
+            counters[field] += 1
+
+    def get(self, namespace, parts):
+        key = make_cache_key(namespace, parts)
+        value = self.memory.get(key)
+        if value is None and self.backend is not None:
+            value = self.backend.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        self._count(namespace, 'hits' if value is not None else 'misses')
+        record_cache_event(namespace, value is not None)
+        return value
+
+    def set(self, namespace, parts, value, ttl=None):
+        key = make_cache_key(namespace, parts)
+        ttl = self.ttl if ttl is None else ttl
+        self.memory.set(key, value, ttl)
+        if self.backend is not None:
+            self.backend.set(key, value, ttl)
+
+    def get_or_compute(self, namespace, parts, compute, ttl=None):
+        """Trả về giá trị đã cache, hoặc gọi compute() rồi lưu lại.
+        Nếu compute() raise thì không có gì được cache."""
+        value = self.get(namespace, parts)
+        if value is None:
+            value = compute()
+            self.set(namespace, parts, value, ttl)
+        return value
+
+    def stats(self):
+        with self._lock:
+            stats = {namespace: dict(counters) for namespace, counters in self._counters.items()}
+        for counters in stats.values():
+            total = counters['hits'] + counters['misses']
+            counters['hit_rate'] = counters['hits'] / total if total else 0.0
+        return stats
+
+    def clear(self):
+        self.memory.clear()
+        if self.backend is not None:
+            self.backend.clear()
+        with self._lock:
+            self._counters.clear()
+
+
+class SemanticCache:
+    """Cache câu trả lời theo độ tương đồng ngữ nghĩa của câu hỏi (cosine trên embedding).
+    Mỗi câu trả lời thuộc một `scope` (ví dụ trình độ học viên) và chỉ được dùng lại trong đúng scope đó."""
+
+    def __init__(self, embedding_model, threshold=0.92, max_entries=512, ttl=86400):
+        self.embedding_model = embedding_model
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # id -> (scope, vector, question, answer, expires_at)
+        self._vectors = LRUCache(max_size=256, ttl=None)
+        self._next_id = 0
+        self._counters = {'hits': 0, 'misses': 0, 'bypassed': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+
+    def _embed(self, question):
+        import numpy as np
+
+        text = normalize_text(question, lowercase=True)
+        vector = self._vectors.get(text)
+        if vector is None:
+            vector = np.asarray(self.embedding_model.embed_query(text), dtype='float32')
+            norm = np.linalg.norm(vector)
+            if norm:
+                vector = vector / norm
+            self._vectors.set(text, vector)
+        return vector
+
+    def lookup(self, question, scope):
+        """Trả về câu trả lời của câu hỏi gần nhất trong cùng scope nếu độ tương đồng >= threshold."""
+        vector = self._embed(question)
+        now = time.monotonic()
+        best_id, best_score = None, self.threshold
+        with self._lock:
+            for entry_id, (entry_scope, entry_vector, _, _, expires_at) in list(self._entries.items()):
+                if expires_at is not None and expires_at < now:
+                    del self._entries[entry_id]
+                    self._counters['evictions'] += 1
+                    continue
+                if entry_scope != scope:
+                    continue
+                score = float(entry_vector @ vector)
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self._counters['misses'] += 1
+                return None
+            self._counters['hits'] += 1
+            self._entries.move_to_end(best_id)
+            return self._entries[best_id][3]
+
+    def store(self, question, scope, answer):
+        vector = self._embed(question)
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[self._next_id] = (scope, vector, question, answer, expires_at)
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def record_bypass(self):
+        with self._lock:
+            self._counters['bypassed'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters, size=len(self._entries))
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,105 @@
+"""Giới hạn số lời gọi LLM chạy đồng thời trong một process, chia lượt công bằng giữa các học viên."""
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+
+class _Waiter:
+    __slots__ = ('loop', 'future', 'granted')
+
+    def __init__(self, loop, future):
+        self.loop = loop
+        self.future = future
+        self.granted = False
+
+
+class FairConcurrencyLimiter:
+    """Tối đa `max_concurrency` tác vụ chạy cùng lúc, mỗi user tối đa `per_user_limit`.
+    Khi phải chờ, các user được phục vụ xoay vòng (round-robin) nên một user gửi nhiều
+    yêu cầu không chiếm hết lượt của người khác. Dùng được từ nhiều event loop/thread."""
+
+    def __init__(self, max_concurrency=8, per_user_limit=1):
+        self.max_concurrency = max_concurrency
+        self.per_user_limit = per_user_limit
+        self._active = 0
+        self._active_per_user = {}
+        self._waiters = OrderedDict()  # user_id -> deque[_Waiter]
+        self._lock = threading.Lock()
+
+    @asynccontextmanager
+    async def slot(self, user_id):
+        await self._acquire(user_id)
+        try:
+            yield
+        finally:
+            self._release(user_id)
+
+    def _can_run(self, user_id):
+        return (self._active < self.max_concurrency
+                and self._active_per_user.get(user_id, 0) < self.per_user_limit)
+
+    def _grant(self, user_id):
+        self._active += 1
+        self._active_per_user[user_id] = self._active_per_user.get(user_id, 0) + 1
+
+    async def _acquire(self, user_id):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._can_run(user_id) and user_id not in self._waiters:
+                self._grant(user_id)
+                return
+            waiter = _Waiter(loop, loop.create_future())
+            self._waiters.setdefault(user_id, deque()).append(waiter)
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if not waiter.granted:
+                    self._waiters[user_id].remove(waiter)
+                    if not self._waiters[user_id]:
+                        del self._waiters[user_id]
+                    raise
+            # Đã được cấp lượt ngay trước khi bị hủy: trả lại lượt cho người khác
+            self._release(user_id)
+            raise
+
+    def _release(self, user_id):
+        with self._lock:
+            self._active -= 1
+            self._active_per_user[user_id] -= 1
+            if not self._active_per_user[user_id]:
+                del self._active_per_user[user_id]
+            self._dispatch()
+
+    def _dispatch(self):
+        """Cấp lượt cho các yêu cầu đang chờ theo thứ tự xoay vòng giữa các user (gọi khi đang giữ lock)."""
+        while self._active < self.max_concurrency:
+            user_id = next((user for user in self._waiters if self._can_run(user)), None)
+            if user_id is None:
+                return
+            queue = self._waiters[user_id]
+            waiter = queue.popleft()
+            if queue:
+                self._waiters.move_to_end(user_id)
+            else:
+                del self._waiters[user_id]
+
+            waiter.granted = True
+            self._grant(user_id)
+            waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active': self._active,
+                'waiting': sum(len(queue) for queue in self._waiters.values()),
+                'max_concurrency': self.max_concurrency,
+                'per_user_limit': self.per_user_limit,
+            }
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
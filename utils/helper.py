@@ -0,0 +1,354 @@
+"""Các tiện ích dùng chung cho English AI Tutor."""
+import os
+import threading
+
+
+class ResourceRegistry:
+    """Giữ các tài nguyên chỉ-đọc, tốn bộ nhớ (model embedding, FAISS index, LLM client...)
+    để mọi phiên trong cùng một process dùng chung một bản duy nhất.
+    Mỗi phiên chỉ giữ memory và user profile của riêng mình."""
+
+    def __init__(self):
+        self._resources = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, factory):
+        """Trả về tài nguyên `name`, gọi `factory()` để tạo ở lần đầu tiên.
+        Mỗi tài nguyên có lock riêng nên việc nạp một model chậm không chặn các tài nguyên khác."""
+        try:
+            return self._resources[name]
+        except KeyError:
+            pass
+
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self._resources:
+                self._resources[name] = factory()
+            return self._resources[name]
+
+    def register(self, name, resource):
+        """Đăng ký sẵn một tài nguyên (ví dụ bản giả lập dùng cho benchmark)."""
+        with self._lock:
+            self._resources[name] = resource
+
+    def names(self):
+        return sorted(self._resources)
+
+    def retain(self, names):
+        """Chỉ giữ các tài nguyên trong `names`. Dùng trong process con sau fork: tài nguyên chỉ-đọc nạp ở
+        process cha được dùng chung, còn kết nối SQLite, client gRPC, thread nền... phải được tạo lại."""
+        with self._lock:
+            for name in list(self._resources):
+                if name not in names:
+                    del self._resources[name]
+            self._locks.clear()
+
+    def clear(self):
+        with self._lock:
+            self._resources.clear()
+            self._locks.clear()
+
+
+registry = ResourceRegistry()
+
+
+def gemini_client_options():
+    """Tham số kết nối chung cho mọi client Gemini. TUTOR_GEMINI_ENDPOINT=http://host:port trỏ tới một endpoint
+    khác (ví dụ benchmarks/stub_gemini_server.py) qua REST thay vì gRPC."""
+    endpoint = os.getenv('TUTOR_GEMINI_ENDPOINT')
+    if not endpoint:
+        return {}
+    return {'transport': 'rest', 'client_options': {'api_endpoint': endpoint}}
+
+
+def configure_genai():
+    """Cấu hình google.generativeai đúng một lần cho cả process."""
+    def _configure():
+        import google.generativeai as genai
+
+        gemini_api_key = os.getenv('GOOGLE_API_KEY')
+        if not gemini_api_key:
+            raise ValueError("GOOGLE_API_KEY environment variable not set. Please set it in your .env file.")
+        genai.configure(api_key=gemini_api_key, **gemini_client_options())
+        return gemini_api_key
+
+    return registry.get('genai_config', _configure)
+
+
+def get_embedding_model():
+    def _load():
+        from langchain.embeddings import HuggingFaceEmbeddings
+        from agent.ingestion import EMBEDDING_MODEL_NAME
+
+        return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+
+    return registry.get('embedding_model', _load)
+
+
+def get_ann_index_config():
+    """Loại index dùng cho RAG (exact/HNSW/IVF, int8/PQ), cấu hình bằng các biến TUTOR_RAG_*."""
+    def _load():
+        from agent.ann_index import AnnIndexConfig
+
+        return AnnIndexConfig.from_env()
+
+    return registry.get('ann_index_config', _load)
+
+
+def get_vectorstore():
+    """FAISS index dùng chung. TUTOR_RAG_MMAP=1 đọc index bằng mmap chỉ đọc (server nhiều worker process)."""
+    def _load():
+        from agent.ingestion import load_or_build_vectorstore
+
+        return load_or_build_vectorstore(get_embedding_model(), ann_config=get_ann_index_config(),
+                                         mmap=os.getenv('TUTOR_RAG_MMAP') == '1')
+
+    return registry.get('vectorstore', _load)
+
+
+def get_hybrid_retriever():
+    """Bộ tìm kiếm lai BM25 + FAISS dùng chung cho RAGTool; None nếu tắt bằng TUTOR_RAG_HYBRID=0."""
+    def _load():
+        if os.getenv('TUTOR_RAG_HYBRID', '1') == '0':
+            return None
+        from agent.ingestion import INDEX_DIR, settings_key
+        from agent.retrieval import HybridRetriever, load_or_build_keyword_index
+
+        vectorstore = get_vectorstore()
+        index_path = os.path.join(INDEX_DIR, settings_key())
+        keyword_index = load_or_build_keyword_index(vectorstore, index_path if os.path.isdir(index_path) else None)
+        return HybridRetriever(vectorstore, keyword_index)
+
+    return registry.get('hybrid_retriever', _load)
+
+
+def get_wikipedia_wrapper():
+    def _load():
+        from langchain_community.utilities import WikipediaAPIWrapper
+
+        return WikipediaAPIWrapper(top_k_results=1, doc_content_chars_max=500)
+
+    return registry.get('wikipedia_wrapper', _load)
+
+
+def get_wiki_mode():
+    """TUTOR_WIKI_MODE: 'auto' (mặc định, tra gói offline trước rồi mới gọi API Wikipedia),
+    'offline' (chỉ dùng gói offline, không bao giờ gọi mạng) hoặc 'live' (luôn gọi API)."""
+    mode = os.getenv('TUTOR_WIKI_MODE', 'auto').lower()
+    if mode not in ('auto', 'offline', 'live'):
+        raise ValueError(f"TUTOR_WIKI_MODE không hợp lệ: {mode!r} (chọn auto, offline hoặc live)")
+    return mode
+
+
+def get_knowledge_pack():
+    """Gói kiến thức offline cho WikipediaTool (TUTOR_WIKI_PACK, mặc định data/wiki_pack.sqlite3),
+    hoặc None nếu chế độ 'live' hay chưa build gói (python setup_database.py --wiki-pack)."""
+    if get_wiki_mode() == 'live':
+        return None
+
+    def _load():
+        from database.db_manager import DEFAULT_DB_DIR, KnowledgePack
+
+        pack_path = os.getenv('TUTOR_WIKI_PACK') or os.path.join(DEFAULT_DB_DIR, 'wiki_pack.sqlite3')
+        return KnowledgePack(pack_path) if os.path.exists(pack_path) else None
+
+    return registry.get('knowledge_pack', _load)
+
+
+def get_lesson_pack():
+    """Gói bài học soạn sẵn theo trình độ (TUTOR_LESSON_PACK, mặc định data/lesson_pack.sqlite3), hoặc None nếu
+    tắt bằng TUTOR_LESSON_PACK=off hay chưa build (python setup_database.py --lesson-pack). Chỉ các bài đã build
+    với đúng phiên bản tài liệu hiện tại trong docs/ mới được dùng."""
+    def _load():
+        from agent.ingestion import compute_index_key
+        from database.db_manager import DEFAULT_DB_DIR, LessonPack
+
+        pack_path = os.getenv('TUTOR_LESSON_PACK') or os.path.join(DEFAULT_DB_DIR, 'lesson_pack.sqlite3')
+        if pack_path == 'off' or not os.path.exists(pack_path):
+            return None
+        return LessonPack(pack_path, index_key=compute_index_key())
+
+    return registry.get('lesson_pack', _load)
+
+
+def get_chat_llm(model_name, temperature=0.3):
+    """LLM client cho LangChain, dùng chung theo (model, temperature)."""
+    def _load():
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        configure_genai()
+        return ChatGoogleGenerativeAI(model=model_name, temperature=temperature, **gemini_client_options())
+
+    return registry.get(f'chat_llm:{model_name}:{temperature}', _load)
+
+
+def get_model_router():
+    """Router chọn model theo tác vụ, dùng chung cho cả process để mọi phiên cùng biết model nào đang chậm/quá tải.
+    Cấu hình tier và ngân sách bằng TUTOR_MODEL_TIERS, TUTOR_MODEL_COST_BUDGET, TUTOR_LATENCY_BUDGET_* (xem ModelRouter)."""
+    def _load():
+        from agent.model_router import ModelRouter
+
+        return ModelRouter.from_env()
+
+    return registry.get('model_router', _load)
+
+
+def get_llm_gateway():
+    """Cổng chung cho mọi lời gọi Gemini của process: giới hạn tần suất, thử lại, circuit breaker, gộp yêu cầu trùng.
+    Cấu hình bằng TUTOR_LLM_RPM, TUTOR_LLM_BURST, TUTOR_LLM_RETRIES, TUTOR_LLM_BREAKER_* (xem LLMGateway)."""
+    def _load():
+        from agent.llm_gateway import LLMGateway
+
+        return LLMGateway.from_env()
+
+    return registry.get('llm_gateway', _load)
+
+
+def get_generative_model(model_name):
+    """genai.GenerativeModel dùng cho các lời gọi trực tiếp (ví dụ analyze_text)."""
+    def _load():
+        import google.generativeai as genai
+
+        configure_genai()
+        return genai.GenerativeModel(model_name)
+
+    return registry.get(f'generative_model:{model_name}', _load)
+
+
+def get_rag_index_key():
+    """Khóa của FAISS index đang dùng (đổi khi tài liệu/cấu hình đổi), dùng để phân vùng cache."""
+    def _load():
+        from agent.ingestion import compute_index_key
+
+        index_key = compute_index_key()
+        ann_config = get_ann_index_config()
+        # Index xấp xỉ có thể trả về chunk khác index exact nên cache được phân vùng theo cấu hình
+        return index_key if ann_config.is_exact else f"{index_key}:{ann_config.cache_key}"
+
+    return registry.get('rag_index_key', _load)
+
+
+def get_response_cache():
+    """Cache kết quả dùng chung. Cấu hình bằng biến môi trường:
+    TUTOR_CACHE_TTL (giây, mặc định 86400), TUTOR_CACHE_SIZE (mặc định 1024),
+    TUTOR_CACHE_DB (đường dẫn file SQLite; để trống thì chỉ cache trong bộ nhớ)."""
+    def _load():
+        from utils.cache import LRUCache, ResponseCache
+
+        ttl = int(os.getenv('TUTOR_CACHE_TTL', '86400'))
+        backend = None
+        db_path = os.getenv('TUTOR_CACHE_DB')
+        if db_path:
+            from database.db_manager import SQLiteCacheBackend
+
+            backend = SQLiteCacheBackend(db_path)
+        memory = LRUCache(max_size=int(os.getenv('TUTOR_CACHE_SIZE', '1024')), ttl=ttl)
+        return ResponseCache(memory=memory, backend=backend, ttl=ttl)
+
+    return registry.get('response_cache', _load)
+
+
+def get_semantic_cache():
+    """Semantic cache dùng chung cho run_agent_chat, hoặc None nếu chưa bật.
+    Bật bằng TUTOR_SEMANTIC_CACHE=1; ngưỡng tương đồng TUTOR_SEMANTIC_CACHE_THRESHOLD (mặc định 0.92)."""
+    if os.getenv('TUTOR_SEMANTIC_CACHE', '0').lower() not in ('1', 'true', 'yes'):
+        return None
+
+    def _load():
+        from utils.cache import SemanticCache
+
+        return SemanticCache(
+            get_embedding_model(),
+            threshold=float(os.getenv('TUTOR_SEMANTIC_CACHE_THRESHOLD', '0.92')),
+            max_entries=int(os.getenv('TUTOR_SEMANTIC_CACHE_SIZE', '512')),
+            ttl=int(os.getenv('TUTOR_CACHE_TTL', '86400')),
+        )
+
+    return registry.get('semantic_cache', _load)
+
+
+def get_concurrency_limiter():
+    """Bộ giới hạn đồng thời dùng chung cho các API async của agent.
+    Cấu hình bằng TUTOR_MAX_CONCURRENCY (mặc định 8) và TUTOR_PER_USER_CONCURRENCY (mặc định 1)."""
+    def _load():
+        from utils.concurrency import FairConcurrencyLimiter
+
+        return FairConcurrencyLimiter(
+            max_concurrency=int(os.getenv('TUTOR_MAX_CONCURRENCY', '8')),
+            per_user_limit=int(os.getenv('TUTOR_PER_USER_CONCURRENCY', '1')),
+        )
+
+    return registry.get('concurrency_limiter', _load)
+
+
+def get_router_stats():
+    """Thống kê số yêu cầu và lời gọi LLM theo từng route của router."""
+    def _load():
+        from agent.router import RouterStats
+
+        return RouterStats()
+
+    return registry.get('router_stats', _load)
+
+
+def get_conversation_store():
+    """Kho lịch sử trò chuyện SQLite dùng chung, hoặc None nếu chưa bật.
+    Bật bằng TUTOR_CONVERSATION_DB=<đường dẫn file SQLite>; khi đó memory của mỗi phiên được lưu trên đĩa."""
+    db_path = os.getenv('TUTOR_CONVERSATION_DB')
+    if not db_path:
+        return None
+
+    def _load():
+        from database.db_manager import ConversationStore
+
+        return ConversationStore(db_path)
+
+    return registry.get('conversation_store', _load)
+
+
+def get_metrics():
+    """Counter/histogram của process. TUTOR_METRICS_PORT=<port> mở endpoint /metrics cho Prometheus;
+    TUTOR_TURN_LOG=<đường dẫn file> (hoặc '-' cho stderr) ghi mỗi lượt hội thoại thành một dòng JSON."""
+    def _load():
+        import logging
+
+        from utils.metrics import MetricsRegistry, start_metrics_server
+
+        metrics = MetricsRegistry()
+        metrics.describe('tutor_turns_total', "Số lượt hội thoại theo route.")
+        metrics.describe('tutor_turn_duration_seconds', "Thời gian xử lý một lượt hội thoại.")
+        metrics.describe('tutor_turn_errors_total', "Số lượt hội thoại bị lỗi.")
+        metrics.describe('tutor_react_iterations', "Số vòng ReAct (lời gọi LLM) mỗi lượt đi qua agent.")
+        metrics.describe('tutor_llm_calls_total', "Số lời gọi LLM.")
+        metrics.describe('tutor_llm_duration_seconds', "Độ trễ mỗi lời gọi LLM.")
+        metrics.describe('tutor_llm_tokens_total', "Số token prompt/completion.")
+        metrics.describe('tutor_tool_calls_total', "Số lần gọi tool.")
+        metrics.describe('tutor_tool_duration_seconds', "Độ trễ mỗi lần gọi tool.")
+        metrics.describe('tutor_cache_requests_total', "Số lần tra cache theo namespace và kết quả.")
+        metrics.describe('tutor_model_requests_total', "Số lời gọi thành công theo tác vụ và model được router chọn.")
+        metrics.describe('tutor_model_fallbacks_total', "Số lời gọi phải chuyển sang model dự phòng.")
+        metrics.describe('tutor_model_failures_total', "Số lời gọi model thất bại theo lý do (rate_limit/transient/error).")
+        metrics.describe('tutor_llm_gateway_retries_total', "Số lần LLMGateway thử lại theo model và lý do.")
+        metrics.describe('tutor_llm_gateway_coalesced_total', "Số yêu cầu được gộp vào một yêu cầu giống hệt đang chạy.")
+        metrics.describe('tutor_llm_gateway_rejected_total', "Số lời gọi bị circuit breaker từ chối.")
+        metrics.describe('tutor_lesson_pack_requests_total',
+                         "Số lượt tra gói bài học theo kết quả (served/grounded/miss) và trình độ.")
+        metrics.describe('tutor_lesson_pack_lookup_seconds', "Thời gian tra gói bài học mỗi lượt.")
+
+        port = os.getenv('TUTOR_METRICS_PORT')
+        if port:
+            start_metrics_server(metrics, int(port))
+
+        log_target = os.getenv('TUTOR_TURN_LOG')
+        if log_target:
+            turn_logger = logging.getLogger('english_tutor.turns')
+            handler = logging.StreamHandler() if log_target == '-' else logging.FileHandler(log_target, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            turn_logger.addHandler(handler)
+            turn_logger.setLevel(logging.INFO)
+            turn_logger.propagate = False
+        return metrics
+
+    return registry.get('metrics', _load)
@@ -0,0 +1,127 @@
+"""Counter/histogram kiểu Prometheus trong bộ nhớ (không cần thư viện ngoài) và ngữ cảnh của lượt hội thoại
+đang chạy, để các lớp cấp thấp (cache, tool) ghi sự kiện vào đúng lượt mà không phải truyền tham số."""
+import bisect
+import contextvars
+import threading
+
+# Đơn vị giây: đủ chi tiết cho cả tra cache (ms) lẫn một lượt ReAct nhiều bước (chục giây)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Lượt hội thoại (TurnTrace) đang chạy trong ngữ cảnh hiện tại; asyncio.to_thread và task mới kế thừa giá trị này
+current_trace = contextvars.ContextVar('current_trace', default=None)
+
+
+def record_cache_event(namespace, hit):
+    """Ghi một lần tra cache vào lượt đang chạy (không làm gì nếu ngoài một lượt)."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.record_cache(namespace, hit)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        f'{key}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for key, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+class MetricsRegistry:
+    """Counter và histogram có nhãn. Mỗi lần ghi chỉ là vài phép cộng dưới một lock nên có thể bật thường trực."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = {}    # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._histograms.get(key)
+            if state is None:
+                state = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def snapshot(self):
+        """{'counters': {...}, 'histograms': {...}} với khóa dạng 'name{label="..."}', tiện cho hiển thị/JSON."""
+        with self._lock:
+            counters = {f"{name}{_format_labels(labels)}": value for (name, labels), value in self._counters.items()}
+            histograms = {
+                f"{name}{_format_labels(labels)}": {'count': state[-1], 'sum': state[-2]}
+                for (name, labels), state in self._histograms.items()
+            }
+        return {'counters': counters, 'histograms': histograms}
+
+    def render(self):
+        """Văn bản theo định dạng exposition của Prometheus (text/plain; version=0.0.4)."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(state)) for key, state in self._histograms.items())
+
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), state in histograms:
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state[:-2]):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {state[-2]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {state[-1]}")
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+def start_metrics_server(metrics, port, host='0.0.0.0'):
+    """Phục vụ GET /metrics trong một thread nền (dùng cho Streamlit, vốn không có endpoint HTTP riêng)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="tutor-metrics", daemon=True).start()
+    return server